@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+Measure the overhead of SubprocessRunner compared with bare subprocess.run(),
+and the latency of each phase of SubprocessRunner.run().
+
+Usage:
+    python benchmarks/bench_overhead.py --count 200
+    python benchmarks/bench_overhead.py --filter phase:
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from mbstrdecoder import MultiByteStrDecoder
+
+from subprocrunner import CommandTemplate, ResultCache, Retry, ShellSession, SubprocessRunner, Which
+from subprocrunner._env import get_env
+
+
+TINY_COMMAND = ["true"]
+FAILING_COMMAND = ["false"]
+LARGE_OUTPUT_COMMAND = ["seq", "1000000"]
+BASELINE_CASE = "tiny:subprocess.run"
+RUNNER_CASE = "tiny:SubprocessRunner(list)"
+
+
+class Result(NamedTuple):
+    name: str
+    count: int
+    mean: float
+    median: float
+    p95: float
+
+    @property
+    def throughput(self) -> float:
+        return 1 / self.mean if self.mean else float("inf")
+
+
+def parse_option() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=200,
+        help="number of iterations for each command execution case. defaults to %(default)s",
+    )
+    parser.add_argument(
+        "--filter",
+        help="execute only the cases whose name contains the value",
+    )
+    parser.add_argument(
+        "--max-overhead-ratio",
+        type=float,
+        help="""exit with a non-zero code if the mean latency ratio of
+        tiny:SubprocessRunner(list) to tiny:subprocess.run exceeds the value""",
+    )
+
+    return parser.parse_args()
+
+
+def bench(name: str, func: Callable[[], object], count: int, warmup: int = 3) -> Result:
+    for _i in range(warmup):
+        func()
+
+    durations: List[float] = []
+    for _i in range(count):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+
+    durations.sort()
+
+    return Result(
+        name=name,
+        count=count,
+        mean=statistics.mean(durations),
+        median=statistics.median(durations),
+        p95=durations[min(count - 1, int(count * 0.95))],
+    )
+
+
+def print_results(results: List[Result]) -> None:
+    name_width = max(len(result.name) for result in results)
+    print(
+        f"{'case':<{name_width}} {'count':>6} {'mean [us]':>11} {'median [us]':>12} "
+        f"{'p95 [us]':>10} {'ops/s':>10}"
+    )
+
+    for result in results:
+        print(
+            f"{result.name:<{name_width}} {result.count:>6} {result.mean * 1e6:>11.1f} "
+            f"{result.median * 1e6:>12.1f} {result.p95 * 1e6:>10.1f} {result.throughput:>10.1f}"
+        )
+
+
+def make_cases(count: int) -> List[tuple]:
+    # retries the failing command three times with negligible backoffs,
+    # to measure the overhead of the retry loop rather than the sleeps
+    retry = Retry(total=3, backoff_factor=1e-4, jitter=1e-4, max_backoff=1e-3, quiet=True)
+    large_output = subprocess.run(LARGE_OUTPUT_COMMAND, stdout=subprocess.PIPE).stdout
+    runner = SubprocessRunner(TINY_COMMAND)
+    session = ShellSession()
+    result_cache = ResultCache()
+    template = CommandTemplate(["true", "{value}"])
+
+    def run_with_history() -> None:
+        SubprocessRunner.is_save_history = True
+        try:
+            SubprocessRunner(TINY_COMMAND).run()
+        finally:
+            SubprocessRunner.is_save_history = False
+            SubprocessRunner.clear_history()
+
+    def run_large_output_decoded() -> None:
+        runner = SubprocessRunner(LARGE_OUTPUT_COMMAND)
+        runner.run()
+        assert runner.stdout
+
+    large_count = max(1, count // 20)
+    phase_count = count * 50
+
+    return [
+        # command executions
+        (BASELINE_CASE, lambda: subprocess.run(TINY_COMMAND), count),
+        (RUNNER_CASE, lambda: SubprocessRunner(TINY_COMMAND).run(), count),
+        ("tiny:SubprocessRunner(shell)", lambda: SubprocessRunner("true").run(), count),
+        ("tiny:SubprocessRunner(reuse)", runner.run, count),
+        (
+            "tiny:SubprocessRunner(retry x3)",
+            lambda: SubprocessRunner(FAILING_COMMAND, quiet=True).run(retry=retry),
+            count,
+        ),
+        ("tiny:SubprocessRunner(history)", run_with_history, count),
+        ("tiny:CommandTemplate", lambda: template.runner(value="hoge").run(), count),
+        ("tiny:ShellSession", lambda: session.run("true"), count),
+        (
+            "tiny:SubprocessRunner(cache hit)",
+            lambda: SubprocessRunner(TINY_COMMAND, result_cache=result_cache).run(),
+            count,
+        ),
+        (
+            "tiny:SubprocessRunner(dry-run)",
+            lambda: SubprocessRunner(TINY_COMMAND, dry_run=True).run(),
+            count,
+        ),
+        (
+            "large:subprocess.run",
+            lambda: subprocess.run(LARGE_OUTPUT_COMMAND, stdout=subprocess.PIPE),
+            large_count,
+        ),
+        (
+            "large:SubprocessRunner(bytes)",
+            lambda: SubprocessRunner(LARGE_OUTPUT_COMMAND).run(),
+            large_count,
+        ),
+        (
+            "large:SubprocessRunner(decoded)",
+            run_large_output_decoded,
+            large_count,
+        ),
+        # phases of SubprocessRunner.run()
+        ("phase:constructor", lambda: SubprocessRunner(TINY_COMMAND), phase_count),
+        ("phase:template", lambda: template.runner(value="hoge"), phase_count),
+        ("phase:which(cached)", lambda: Which("true").verify(), phase_count),
+        ("phase:which(uncached)", lambda: Which("true", use_cache=False).verify(), phase_count),
+        ("phase:env(default)", get_env, phase_count),
+        ("phase:env(copy)", lambda: dict(os.environ, LC_ALL="C"), phase_count),
+        (
+            "phase:decode(MultiByteStrDecoder)",
+            lambda: MultiByteStrDecoder(large_output).unicode_str,
+            large_count,
+        ),
+        (
+            "phase:decode(ascii)",
+            lambda: large_output.isascii() and large_output.decode(),
+            large_count,
+        ),
+    ]
+
+
+def main() -> int:
+    options = parse_option()
+    filter_value: Optional[str] = options.filter
+    results: List[Result] = []
+
+    for name, func, count in make_cases(options.count):
+        if filter_value and filter_value not in name:
+            continue
+
+        results.append(bench(name, func, count))
+
+    if not results:
+        print("no cases matched", file=sys.stderr)
+        return 1
+
+    print_results(results)
+
+    if options.max_overhead_ratio is None:
+        return 0
+
+    result_map = {result.name: result for result in results}
+    try:
+        ratio = result_map[RUNNER_CASE].mean / result_map[BASELINE_CASE].mean
+    except KeyError:
+        print(f"both of {BASELINE_CASE} and {RUNNER_CASE} are required", file=sys.stderr)
+        return 1
+
+    print(f"\noverhead ratio: {ratio:.2f} (max: {options.max_overhead_ratio:.2f})")
+
+    return 0 if ratio <= options.max_overhead_ratio else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Compare process spawn latency of the default, ``fast_spawn``, and ``use_launcher``
+launch paths of SubprocessRunner for different parent process memory usage (RSS).
+
+Usage:
+    python benchmarks/bench_spawn.py --rss-mb 0 512 2048 --count 200
+"""
+
+import argparse
+import resource
+import sys
+import time
+from typing import List
+
+from subprocrunner import SubprocessRunner
+
+
+def parse_option() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rss-mb",
+        type=int,
+        nargs="+",
+        default=[0, 256, 1024],
+        help="parent process memory usage to test in MiB. defaults to %(default)s",
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=200,
+        help="number of command executions for each case. defaults to %(default)s",
+    )
+
+    return parser.parse_args()
+
+
+def measure(count: int, **kwargs: bool) -> float:
+    runner = SubprocessRunner(["true"], **kwargs)
+    runner.run()  # warm up
+
+    started = time.perf_counter()
+    for _i in range(count):
+        runner.run()
+
+    return (time.perf_counter() - started) / count
+
+
+def main() -> int:
+    options = parse_option()
+    ballast: List[bytearray] = []
+
+    print(
+        f"{'parent RSS [MiB]':>16} {'default [ms]':>13} {'fast_spawn [ms]':>16} "
+        f"{'use_launcher [ms]':>18}"
+    )
+
+    for rss_mb in sorted(options.rss_mb):
+        # touch the pages so that they are actually mapped to the parent process
+        while sum(len(b) for b in ballast) < rss_mb * 1024**2:
+            ballast.append(bytearray(b"\x01" * 1024**2))
+
+        maxrss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        default = measure(options.count, fast_spawn=False)
+        fast = measure(options.count, fast_spawn=True)
+        launcher = measure(options.count, use_launcher=True)
+
+        print(
+            f"{maxrss_mb:16.0f} {default * 1000:13.3f} {fast * 1000:16.3f} {launcher * 1000:18.3f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
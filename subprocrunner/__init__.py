@@ -3,11 +3,24 @@
 """
 
 from .__version__ import __author__, __copyright__, __email__, __license__, __version__
+from ._command_template import CommandTemplate
+from ._completed_run import CompletedRun
+from ._env import Env
+from ._history import HistoryRecord
 from ._logger import set_log_level, set_logger
+from ._pipeline import Pipeline
+from ._result_cache import ResultCache, ResultCacheInfo
+from ._runner_pool import RunnerPool, run_many
+from ._rusage import ResourceUsage
+from ._shell_session import ShellSession
+from ._singleflight import CoalesceInfo
+from ._spawn_limiter import SpawnLimiter, SpawnLimiterInfo
 from ._subprocess_runner import SubprocessRunner
+from ._timings import ExecutionTimings
 from ._which import Which
-from .error import CalledProcessError, CommandError
-from .retry import Retry
+from .capture import Capture
+from .error import CalledProcessError, CircuitOpenError, CommandError, SpawnLimitError
+from .retry import CircuitBreaker, Retry, RetryBudget, RetryBudgetInfo
 
 
 __all__ = (
@@ -17,10 +30,31 @@ __all__ = (
     "__license__",
     "__version__",
     "CalledProcessError",
+    "Capture",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CoalesceInfo",
     "CommandError",
+    "CommandTemplate",
+    "CompletedRun",
+    "Env",
+    "ExecutionTimings",
+    "HistoryRecord",
+    "Pipeline",
+    "ResourceUsage",
+    "ResultCache",
+    "ResultCacheInfo",
     "Retry",
+    "RetryBudget",
+    "RetryBudgetInfo",
+    "RunnerPool",
+    "ShellSession",
+    "SpawnLimitError",
+    "SpawnLimiter",
+    "SpawnLimiterInfo",
     "SubprocessRunner",
     "Which",
+    "run_many",
     "set_log_level",
     "set_logger",
 )
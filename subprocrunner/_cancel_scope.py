@@ -0,0 +1,58 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import signal
+import threading
+from typing import Any, Dict, Tuple
+
+from ._stream import send_signal
+
+
+class CancelScope:
+    """
+    Processes started by runners within a scope (e.g. a batch of :py:class:`RunnerPool`),
+    that are killed when the scope is cancelled. Processes started after the cancellation
+    are killed immediately, and runners stop retrying.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__procs: Dict[int, Tuple[Any, bool]] = {}
+        self.__is_cancelled = False
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.__is_cancelled
+
+    def add(self, proc: Any, kill_group: bool = False) -> None:
+        with self.__lock:
+            if not self.__is_cancelled:
+                self.__procs[id(proc)] = (proc, kill_group)
+                return
+
+        _kill(proc, kill_group)
+
+    def discard(self, proc: Any) -> None:
+        with self.__lock:
+            self.__procs.pop(id(proc), None)
+
+    def cancel(self) -> None:
+        with self.__lock:
+            self.__is_cancelled = True
+            procs = list(self.__procs.values())
+            self.__procs.clear()
+
+        for proc, kill_group in procs:
+            _kill(proc, kill_group)
+
+
+def _kill(proc: Any, kill_group: bool) -> None:
+    if kill_group:
+        send_signal(proc, signal.SIGKILL, kill_group=True)
+        return
+
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,170 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+from string import Formatter
+from typing import Any, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple, Union, cast
+
+from ._subprocess_runner import SubprocessRunner
+from ._which import Which
+
+
+# literal text, or (field name, format spec, conversion) of a replacement field
+_ArgPart = Union[str, Tuple[str, str, Optional[str]]]
+
+
+class CommandTemplate:
+    """
+    A command with replacement fields (e.g. ``["tc", "class", "show", "dev", "{dev}"]``)
+    that is parsed, validated and resolved once, and then executed many times
+    with different parameters.
+
+    Each argument is substituted with :py:meth:`str.format` syntax and always stays a single
+    argument of the argv, so that parameters are never interpreted by a shell.
+    Replacement fields must be plain identifiers (no attribute/index access),
+    and the executable (the first argument) must not contain replacement fields.
+
+    :param command: Argument list of the command. Shell command strings are not accepted.
+    :param kwargs: Keyword arguments passed to the :py:class:`SubprocessRunner` constructor.
+    """
+
+    def __init__(self, command: Sequence[str], **kwargs: Any) -> None:
+        if isinstance(command, str) or not isinstance(command, (list, tuple)):
+            raise TypeError(f"command must be a list or a tuple of arguments: {command!r}")
+
+        self.__prototype = SubprocessRunner(command, **kwargs)
+        self.__command = cast(List[str], self.__prototype.command)
+        self.__args = [self.__compile(arg) for arg in self.__command]
+
+        if not isinstance(self.__args[0], str):
+            raise ValueError(f"executable must not contain replacement fields: {command[0]}")
+
+        self.__fields = frozenset(
+            part[0]
+            for parts in self.__args
+            if not isinstance(parts, str)
+            for part in parts
+            if not isinstance(part, str)
+        )
+        self.__exec_command0 = self.__resolve(
+            self.__command[0], use_abspath=kwargs.get("use_abspath", False)
+        )
+
+    def __repr__(self) -> str:
+        return "CommandTemplate(command='{}', fields={})".format(
+            self.__prototype.command_str, sorted(self.__fields)
+        )
+
+    @property
+    def command(self) -> List[str]:
+        return list(self.__command)
+
+    @property
+    def fields(self) -> FrozenSet[str]:
+        """
+        Names of the replacement fields of the command.
+        """
+
+        return self.__fields
+
+    @property
+    def dry_run(self) -> bool:
+        return self.__prototype.dry_run
+
+    def format(self, **params: Any) -> List[str]:
+        """
+        Return the argv substituted with ``params``.
+        Raises :py:class:`ValueError` if ``params`` do not match :py:attr:`.fields`.
+        """
+
+        if params.keys() != self.__fields:
+            missing = self.__fields - params.keys()
+            if missing:
+                raise ValueError("missing parameters: {}".format(", ".join(sorted(missing))))
+
+            raise ValueError(
+                "unknown parameters: {}".format(", ".join(sorted(params.keys() - self.__fields)))
+            )
+
+        argv = []
+        for parts in self.__args:
+            if isinstance(parts, str):
+                argv.append(parts)
+                continue
+
+            argv.append("".join(self.__render(part, params) for part in parts))
+
+        return argv
+
+    def runner(self, **params: Any) -> SubprocessRunner:
+        """
+        Return a :py:class:`SubprocessRunner` that executes the command substituted with
+        ``params``. The runner skips the validation and the executable resolution.
+        """
+
+        argv = self.format(**params)
+
+        return self.__prototype._bind(argv, [self.__exec_command0] + argv[1:], " ".join(argv))
+
+    def runners(self, param_sets: Iterable[Mapping[str, Any]]) -> List[SubprocessRunner]:
+        """
+        Return runners for each parameter set.
+        The runners can be executed by :py:class:`RunnerPool`.
+        """
+
+        return [self.runner(**params) for params in param_sets]
+
+    @staticmethod
+    def __compile(arg: str) -> Union[str, List[_ArgPart]]:
+        parts: List[_ArgPart] = []
+        has_field = False
+
+        for literal, field_name, format_spec, conversion in Formatter().parse(arg):
+            if literal:
+                parts.append(literal)
+
+            if field_name is None:
+                continue
+
+            if not field_name.isidentifier():
+                raise ValueError(f"invalid replacement field: {{{field_name}}} in {arg!r}")
+            if format_spec and "{" in format_spec:
+                raise ValueError(f"nested replacement fields are not supported: {arg!r}")
+
+            parts.append((field_name, format_spec or "", conversion))
+            has_field = True
+
+        if not has_field:
+            return "".join(cast(List[str], parts))
+
+        return parts
+
+    @staticmethod
+    def __render(part: _ArgPart, params: Mapping[str, Any]) -> str:
+        if isinstance(part, str):
+            return part
+
+        field_name, format_spec, conversion = part
+        value = params[field_name]
+
+        if conversion == "r":
+            value = repr(value)
+        elif conversion == "a":
+            value = ascii(value)
+        elif conversion == "s":
+            value = str(value)
+
+        return format(value, format_spec)
+
+    def __resolve(self, executable: str, use_abspath: bool) -> str:
+        if self.dry_run or platform.system() == "Windows":
+            return executable
+
+        which = Which(executable)
+        which.verify()
+
+        if use_abspath or self.__prototype.fast_spawn:
+            return cast(str, which.abspath())
+
+        return executable
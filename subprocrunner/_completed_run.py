@@ -0,0 +1,121 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+from typing import Optional, Union
+
+from ._output import decode_output
+from .error import CalledProcessError
+
+
+class CompletedRun:
+    """
+    Immutable result of a command execution by :py:meth:`SubprocessRunner.execute`.
+    Outputs are decoded lazily when :py:attr:`.stdout`/:py:attr:`.stderr` are accessed.
+    """
+
+    __slots__ = (
+        "__command",
+        "__returncode",
+        "__stdout_bytes",
+        "__stderr_bytes",
+        "__stdout",
+        "__stderr",
+        "__duration",
+        "__attempts",
+        "__raw",
+        "__output_encoding",
+        "__output_errors",
+    )
+
+    def __init__(
+        self,
+        command: str,
+        returncode: int,
+        stdout_bytes: Optional[bytes],
+        stderr_bytes: Optional[bytes],
+        duration: float,
+        attempts: int,
+        output_encoding: Optional[str] = None,
+        output_errors: Optional[str] = None,
+        stdout: Optional[str] = None,
+        stderr: Optional[str] = None,
+        raw: bool = False,
+    ) -> None:
+        self.__command = command
+        self.__returncode = returncode
+        self.__stdout_bytes = stdout_bytes
+        self.__stderr_bytes = stderr_bytes
+        self.__stdout = stdout
+        self.__stderr = stderr
+        self.__duration = duration
+        self.__attempts = attempts
+        self.__raw = raw
+        self.__output_encoding = output_encoding
+        self.__output_errors = output_errors
+
+    def __repr__(self) -> str:
+        return "CompletedRun(command='{}', returncode={}, duration={:.6f}, attempts={})".format(
+            self.__command, self.__returncode, self.__duration, self.__attempts
+        )
+
+    @property
+    def command(self) -> str:
+        return self.__command
+
+    @property
+    def returncode(self) -> int:
+        return self.__returncode
+
+    @property
+    def stdout(self) -> Optional[str]:
+        if self.__stdout is None and self.__stdout_bytes is not None:
+            self.__stdout = decode_output(
+                self.__stdout_bytes, self.__output_encoding, self.__output_errors
+            )
+
+        return self.__stdout
+
+    @property
+    def stderr(self) -> Optional[str]:
+        if self.__stderr is None and self.__stderr_bytes is not None:
+            self.__stderr = decode_output(
+                self.__stderr_bytes, self.__output_encoding, self.__output_errors
+            )
+
+        return self.__stderr
+
+    @property
+    def stdout_bytes(self) -> Optional[bytes]:
+        return self.__stdout_bytes
+
+    @property
+    def stderr_bytes(self) -> Optional[bytes]:
+        return self.__stderr_bytes
+
+    @property
+    def duration(self) -> float:
+        """
+        Elapsed seconds of the execution including backoff times between retries.
+        """
+
+        return self.__duration
+
+    @property
+    def attempts(self) -> int:
+        """
+        Number of the processes executed.
+        """
+
+        return self.__attempts
+
+    def raise_for_returncode(self) -> None:
+        if self.__returncode == 0:
+            return
+
+        output: Union[str, bytes, None] = self.__stdout_bytes if self.__raw else self.stdout
+        stderr: Union[str, bytes, None] = self.__stderr_bytes if self.__raw else self.stderr
+
+        raise CalledProcessError(
+            returncode=self.__returncode, cmd=self.__command, output=output, stderr=stderr
+        )
@@ -0,0 +1,62 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+from typing import Dict, Mapping, Optional
+
+
+class Env(Dict[str, str]):
+    """
+    Prebuilt environment variables for commands.
+    An instance can be shared by multiple runners to avoid building
+    the environment variables for each execution.
+    Do not modify an instance after passing it to runners.
+
+    :param overrides: Variables that overwrite ``base``.
+    :param base: Base variables. Defaults to a snapshot of ``os.environ``.
+    """
+
+    def __init__(
+        self,
+        overrides: Optional[Mapping[str, str]] = None,
+        base: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        super().__init__(os.environ if base is None else base)
+
+        if overrides:
+            self.update(overrides)
+
+    def overlay(self, overrides: Mapping[str, str]) -> "Env":
+        """
+        Return a new :py:class:`Env` that ``overrides`` merged onto the instance.
+        """
+
+        return Env(overrides=overrides, base=self)
+
+
+def get_env(
+    env: Optional[Mapping[str, str]] = None,
+    overrides: Optional[Mapping[str, str]] = None,
+) -> Mapping[str, str]:
+    """
+    Return environment variables for a command: ``env`` if specified, otherwise
+    the default environment variables built from the current ``os.environ``
+    (with ``LC_ALL=C`` on Linux). ``overrides`` are merged onto a copy of them.
+    The returned mapping must not be modified.
+    Pass an :py:class:`Env` as ``env`` to reuse a prebuilt snapshot.
+    """
+
+    if env is None:
+        if platform.system() != "Linux":
+            env = os.environ
+        elif overrides:
+            return dict(os.environ, LC_ALL="C", **overrides)
+        else:
+            return dict(os.environ, LC_ALL="C")
+
+    if overrides:
+        return dict(env, **overrides)
+
+    return env
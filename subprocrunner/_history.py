@@ -0,0 +1,110 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import heapq
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+
+class HistoryRecord:
+    """
+    A command execution saved to the command history.
+
+    .. py:attribute:: command
+
+        Executed command string.
+
+    .. py:attribute:: returncode
+
+        Return code of the command. ``None`` if the execution raised an exception
+        (e.g. timeout).
+
+    .. py:attribute:: start_time
+
+        Time when the execution started, in seconds since the epoch.
+
+    .. py:attribute:: duration
+
+        Elapsed time of the execution in seconds.
+
+    .. py:attribute:: retry_attempt
+
+        Retry attempt number of the execution. ``None`` for the first attempt.
+
+    .. py:attribute:: dry_run
+    """
+
+    __slots__ = ("command", "returncode", "start_time", "duration", "retry_attempt", "dry_run")
+
+    def __init__(
+        self,
+        command: str,
+        returncode: Optional[int],
+        start_time: float,
+        duration: float,
+        retry_attempt: Optional[int] = None,
+        dry_run: bool = False,
+    ) -> None:
+        self.command = command
+        self.returncode = returncode
+        self.start_time = start_time
+        self.duration = duration
+        self.retry_attempt = retry_attempt
+        self.dry_run = dry_run
+
+    def __repr__(self) -> str:
+        params = [
+            f"command='{self.command}'",
+            f"returncode={self.returncode}",
+            f"start_time={self.start_time:.6f}",
+            f"duration={self.duration:.6f}",
+        ]
+        if self.retry_attempt is not None:
+            params.append(f"retry_attempt={self.retry_attempt}")
+        if self.dry_run:
+            params.append(f"dry_run={self.dry_run}")
+
+        return "HistoryRecord({})".format(", ".join(params))
+
+    @property
+    def is_failed(self) -> bool:
+        return self.returncode != 0
+
+
+class CommandHistory:
+    """
+    Thread-safe ring buffer of :py:class:`HistoryRecord`.
+    """
+
+    def __init__(self, maxlen: int) -> None:
+        self.__lock = threading.Lock()
+        self.__records: Deque[HistoryRecord] = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def append(self, record: HistoryRecord, maxlen: int) -> None:
+        with self.__lock:
+            if self.__records.maxlen != maxlen:
+                self.__records = deque(self.__records, maxlen=maxlen)
+
+            self.__records.append(record)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__records.clear()
+
+    def records(self) -> List[HistoryRecord]:
+        with self.__lock:
+            return list(self.__records)
+
+    def slowest(self, n: int) -> List[HistoryRecord]:
+        return heapq.nlargest(n, self.records(), key=lambda record: record.duration)
+
+    def failures(self) -> List[HistoryRecord]:
+        return [record for record in self.records() if record.is_failed]
+
+    def find(self, prefix: str) -> List[HistoryRecord]:
+        return [record for record in self.records() if record.command.startswith(prefix)]
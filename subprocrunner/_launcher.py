@@ -0,0 +1,520 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import atexit
+import os
+import platform
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import IO, Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, cast
+
+from ._launcher_server import recv_message, send_message
+from ._popen import TrackedPopen
+from ._stream import STDERR, STDOUT, iter_output
+
+
+_SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_launcher_server.py")
+
+
+class LauncherUnavailableError(Exception):
+    """
+    Raised when the launcher process cannot accept spawn requests.
+    """
+
+
+class Launcher:
+    """
+    A small helper process that spawns commands on behalf of the caller.
+    The helper is a fresh interpreter, so that the spawn cost does not depend on
+    the memory usage of the caller. The helper is started at the first spawn request,
+    and restarted at the next request if it died.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__proc: Optional[subprocess.Popen] = None
+        self.__sock: Optional[socket.socket] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        if self.__proc is None:
+            return None
+
+        return self.__proc.pid
+
+    def is_running(self) -> bool:
+        return self.__proc is not None and self.__proc.poll() is None
+
+    def start(self) -> None:
+        with self.__lock:
+            self.__start()
+
+    def stop(self) -> None:
+        with self.__lock:
+            self.__stop()
+
+    def spawn(self, request: Dict[str, Any], fds: Sequence[int]) -> Tuple[int, socket.socket]:
+        """
+        Request the helper to spawn a process with ``fds`` as the stdin/stdout/stderr.
+        Return the process ID and a socket to receive the exit status of the process.
+
+        Raises :py:class:`LauncherUnavailableError` if the helper is not available,
+        and re-raises exceptions raised by the helper to spawn the process.
+        """
+
+        reply, reply_peer = socket.socketpair()
+        try:
+            with self.__lock:
+                try:
+                    if not self.is_running():
+                        self.__start()
+
+                    sock = cast(socket.socket, self.__sock)
+                    send_message(sock, request, list(fds) + [reply_peer.fileno()])
+                except OSError as e:
+                    self.__stop()
+                    raise LauncherUnavailableError(e)
+        except BaseException:
+            reply.close()
+            raise
+        finally:
+            reply_peer.close()
+
+        try:
+            message = recv_message(reply)
+        except (OSError, EOFError) as e:
+            message = None
+            cause: Optional[Exception] = e
+        else:
+            cause = None
+
+        if message is None:
+            reply.close()
+            raise LauncherUnavailableError("launcher exited") from cause
+
+        (kind, value), _fds = message
+        if kind == "error":
+            reply.close()
+            raise value
+
+        return (value, reply)
+
+    def __start(self) -> None:
+        # the launcher keeps exited processes unreaped with waitid(WNOWAIT)
+        if platform.system() == "Windows" or not sys.executable or not hasattr(os, "waitid"):
+            raise LauncherUnavailableError("launcher is not supported in the environment")
+
+        self.__stop()
+
+        sock, peer = socket.socketpair()
+        try:
+            self.__proc = subprocess.Popen(
+                [sys.executable, "-I", "-S", _SERVER_PATH, str(peer.fileno())],
+                stdin=subprocess.DEVNULL,
+                pass_fds=[peer.fileno()],
+            )
+        except OSError as e:
+            sock.close()
+            raise LauncherUnavailableError(e)
+        finally:
+            peer.close()
+
+        self.__sock = sock
+
+    def __stop(self) -> None:
+        if self.__sock is not None:
+            # the helper exits when the socket is closed
+            self.__sock.close()
+            self.__sock = None
+
+        if self.__proc is not None:
+            try:
+                self.__proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self.__proc.kill()
+                self.__proc.wait()
+            self.__proc = None
+
+
+launcher = Launcher()
+atexit.register(launcher.stop)
+
+
+class LauncherPopen:
+    """
+    A process created by the launcher, which provides the interface of
+    :py:class:`TrackedPopen` used by the runners. The pipes are always binary.
+
+    Falls back to creating the process in the caller with :py:class:`TrackedPopen`
+    if the launcher is not available, or other keyword arguments than the explicit parameters
+    (e.g. ``preexec_fn``/``pass_fds``) are given.
+    The launcher keeps the exited process unreaped until :py:meth:`wait`/:py:meth:`poll`
+    acknowledge the exit, so that signals are never sent to a recycled process ID.
+    If the launcher exits before reporting the exit status, the process is killed and
+    the return code is ``-SIGKILL``.
+    """
+
+    def __init__(
+        self,
+        args: Any,
+        stdin: Any = None,
+        stdout: Any = None,
+        stderr: Any = None,
+        shell: bool = False,
+        cwd: Any = None,
+        env: Optional[Mapping[str, str]] = None,
+        executable: Any = None,
+        close_fds: bool = True,
+        start_new_session: bool = False,
+        on_exit: Optional[Callable[[], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.args = args
+        self.pid = -1
+        self.returncode: Optional[int] = None
+        self.wait_time = 0.0
+        self.rusage: Optional[Any] = None
+        self.stdin: Optional[IO[bytes]] = None
+        self.stdout: Optional[IO[bytes]] = None
+        self.stderr: Optional[IO[bytes]] = None
+        self.__popen: Optional[TrackedPopen] = None
+        self.__reply: Optional[socket.socket] = None
+        self.__lock = threading.Lock()
+        self.__on_exit: Optional[Callable[[], None]] = None
+        self.__on_exit_lock = threading.Lock()
+        self.__chunks: Dict[str, List[bytes]] = {STDOUT: [], STDERR: []}
+
+        child_fds: Dict[str, Optional[int]] = {}
+        # file descriptors for the child that are closed after the spawn
+        owned_fds: List[int] = []
+
+        try:
+            child_fds["stdin"], self.stdin = self.__open_stream(stdin, True, owned_fds)
+            child_fds["stdout"], self.stdout = self.__open_stream(stdout, False, owned_fds)
+            if stderr == subprocess.STDOUT:
+                child_fds["stderr"] = child_fds["stdout"]
+            else:
+                child_fds["stderr"], self.stderr = self.__open_stream(stderr, False, owned_fds)
+
+            if kwargs:
+                self.__spawn_popen(
+                    args,
+                    child_fds,
+                    shell,
+                    cwd,
+                    env,
+                    executable,
+                    close_fds,
+                    start_new_session,
+                    kwargs,
+                )
+            else:
+                try:
+                    self.__spawn_launcher(
+                        args, child_fds, shell, cwd, env, executable, start_new_session
+                    )
+                except LauncherUnavailableError:
+                    self.__spawn_popen(
+                        args,
+                        child_fds,
+                        shell,
+                        cwd,
+                        env,
+                        executable,
+                        close_fds,
+                        start_new_session,
+                        {},
+                    )
+        except BaseException:
+            for stream in (self.stdin, self.stdout, self.stderr):
+                if stream is not None:
+                    stream.close()
+            raise
+        finally:
+            for fd in owned_fds:
+                os.close(fd)
+
+        # the caller is responsible for the failed spawn
+        self.__on_exit = on_exit
+
+    def __enter__(self) -> "LauncherPopen":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        for stream in (self.stdout, self.stderr, self.stdin):
+            if stream is not None:
+                stream.close()
+
+        self.wait()
+
+    def __del__(self) -> None:
+        reply = getattr(self, "_LauncherPopen__reply", None)
+        if reply is not None:
+            # the launcher reaps the process when it exits
+            reply.close()
+
+        # the process may be still running: notify anyway since the object is discarded
+        self.__notify_exit(force=True)
+
+    @property
+    def is_launched(self) -> bool:
+        """
+        ``True`` if the process was created by the launcher.
+        """
+
+        return self.__popen is None
+
+    def poll(self) -> Optional[int]:
+        try:
+            if self.returncode is None:
+                if self.__popen is not None:
+                    self.__popen.poll()
+                    self.__update_from_popen()
+                else:
+                    self.__wait_exit(0)
+
+            return self.returncode
+        finally:
+            self.__notify_exit()
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        started = time.perf_counter()
+        try:
+            if self.returncode is None:
+                if self.__popen is not None:
+                    self.__popen.wait(timeout)
+                    self.__update_from_popen()
+                elif not self.__wait_exit(timeout):
+                    raise subprocess.TimeoutExpired(self.args, cast(float, timeout))
+
+            return cast(int, self.returncode)
+        finally:
+            self.wait_time += time.perf_counter() - started
+            self.__notify_exit()
+
+    def communicate(
+        self, input: Optional[bytes] = None, timeout: Optional[float] = None
+    ) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """
+        Same as :py:meth:`subprocess.Popen.communicate`.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            for name, chunk in iter_output(self, input=input, timeout=timeout):  # type: ignore
+                self.__chunks[name].append(chunk)
+        except subprocess.TimeoutExpired:
+            raise subprocess.TimeoutExpired(
+                self.args,
+                cast(float, timeout),
+                output=b"".join(self.__chunks[STDOUT]),
+                stderr=b"".join(self.__chunks[STDERR]),
+            )
+
+        self.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        return (
+            None if self.stdout is None else b"".join(self.__chunks[STDOUT]),
+            None if self.stderr is None else b"".join(self.__chunks[STDERR]),
+        )
+
+    def send_signal(self, sig: int) -> None:
+        if self.__popen is not None:
+            self.__popen.send_signal(sig)
+            return
+
+        with self.__lock:
+            # the process ID is valid until the exit is acknowledged with the lock
+            if self.returncode is None:
+                os.kill(self.pid, sig)
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+    @staticmethod
+    def __open_stream(
+        spec: Any, is_input: bool, owned_fds: List[int]
+    ) -> Tuple[Optional[int], Optional[IO[bytes]]]:
+        """
+        Return the file descriptor of the stream for the child (``None`` to inherit the caller's),
+        and the pipe of the caller if ``spec`` is ``PIPE``.
+        """
+
+        if spec is None:
+            return (None, None)
+
+        if spec == subprocess.PIPE:
+            read_fd, write_fd = os.pipe()
+            if is_input:
+                owned_fds.append(read_fd)
+                return (read_fd, open(write_fd, "wb", buffering=0))
+
+            owned_fds.append(write_fd)
+            return (write_fd, open(read_fd, "rb", buffering=0))
+
+        if spec == subprocess.DEVNULL:
+            fd = os.open(os.devnull, os.O_RDWR)
+            owned_fds.append(fd)
+
+            return (fd, None)
+
+        if isinstance(spec, int):
+            return (spec, None)
+
+        return (spec.fileno(), None)
+
+    def __spawn_launcher(
+        self,
+        args: Any,
+        child_fds: Dict[str, Optional[int]],
+        shell: bool,
+        cwd: Any,
+        env: Optional[Mapping[str, str]],
+        executable: Any,
+        start_new_session: bool,
+    ) -> None:
+        if isinstance(args, (str, bytes, os.PathLike)):
+            args = [args]
+        else:
+            args = list(args)
+        if shell:
+            args = ["/bin/sh", "-c"] + args
+            if executable:
+                args[0] = executable
+
+        request = {
+            "args": [os.fsdecode(arg) for arg in args],
+            "executable": os.fsdecode(executable) if executable else None,
+            "cwd": os.fsdecode(cwd) if cwd else None,
+            "env": dict(env) if env is not None else None,
+            "start_new_session": start_new_session,
+        }
+        # inherit the standard streams of the caller for the unspecified streams
+        fds = [
+            default if child_fds[name] is None else cast(int, child_fds[name])
+            for name, default in (("stdin", 0), ("stdout", 1), ("stderr", 2))
+        ]
+
+        self.pid, self.__reply = launcher.spawn(request, fds)
+
+    def __spawn_popen(
+        self,
+        args: Any,
+        child_fds: Dict[str, Optional[int]],
+        shell: bool,
+        cwd: Any,
+        env: Optional[Mapping[str, str]],
+        executable: Any,
+        close_fds: bool,
+        start_new_session: bool,
+        kwargs: Dict[str, Any],
+    ) -> None:
+        self.__popen = TrackedPopen(
+            args,
+            stdin=child_fds["stdin"],
+            stdout=child_fds["stdout"],
+            stderr=child_fds["stderr"],
+            shell=shell,
+            cwd=cwd,
+            env=env,
+            executable=executable,
+            close_fds=close_fds,
+            start_new_session=start_new_session,
+            **kwargs,
+        )
+        self.pid = self.__popen.pid
+
+    def __update_from_popen(self) -> None:
+        popen = cast(TrackedPopen, self.__popen)
+        self.rusage = popen.rusage
+        self.returncode = popen.returncode
+
+    def __wait_exit(self, timeout: Optional[float]) -> bool:
+        """
+        Wait for the exit of the process created by the launcher.
+        Return ``False`` if the process did not exit within ``timeout`` seconds.
+        """
+
+        reply = self.__reply
+        if reply is not None:
+            try:
+                if not select.select([reply], [], [], timeout)[0]:
+                    return False
+            except (OSError, ValueError):
+                # the socket was closed by another thread that acknowledged the exit
+                pass
+
+        self.__acknowledge_exit()
+
+        return True
+
+    def __acknowledge_exit(self) -> None:
+        with self.__lock:
+            reply, self.__reply = self.__reply, None
+            if reply is None:
+                return
+
+            is_exited = False
+            try:
+                message = recv_message(reply)
+                if message is not None:
+                    is_exited = True
+                    # the launcher reaps the process after the acknowledgement
+                    send_message(reply, ("ack",))
+                    message = recv_message(reply)
+            except (OSError, EOFError):
+                message = None
+            finally:
+                reply.close()
+
+            if message is None:
+                # the launcher exited: the exit status is unknown.
+                # kill the orphaned process in case it is still running (best effort:
+                # the process was reparented and is not a child of the caller),
+                # and never report the unknown status as a success
+                if not is_exited:
+                    try:
+                        os.kill(self.pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+                self.returncode = -signal.SIGKILL
+                return
+
+            (_kind, status, rusage), _fds = message
+            self.rusage = rusage
+            self.returncode = _to_returncode(status)
+
+    def __notify_exit(self, force: bool = False) -> None:
+        """
+        Call the ``on_exit`` callback once the process is reaped.
+        """
+
+        if self.__on_exit is None or (not force and self.returncode is None):
+            return
+
+        with self.__on_exit_lock:
+            on_exit, self.__on_exit = self.__on_exit, None
+
+        if on_exit is not None:
+            on_exit()
+
+
+def _to_returncode(status: int) -> int:
+    # same as subprocess.Popen._handle_exitstatus
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+
+    return status
@@ -0,0 +1,164 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+
+Helper process of the launcher that spawns commands requested over a Unix socket.
+This file is executed as a script by a fresh interpreter, so that it must depend on
+the standard library only.
+"""
+
+import array
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import threading
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+_HEADER = struct.Struct("!I")
+_MAX_FDS = 8
+_MSG_CMSG_CLOEXEC = getattr(socket, "MSG_CMSG_CLOEXEC", 0)
+
+
+def send_message(sock: socket.socket, message: Any, fds: Sequence[int] = ()) -> None:
+    payload = pickle.dumps(message)
+    data = _HEADER.pack(len(payload)) + payload
+
+    if not fds:
+        sock.sendall(data)
+        return
+
+    # file descriptors are passed along with the first byte of the message
+    sent = sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+    sock.sendall(data[sent:])
+
+
+def recv_message(sock: socket.socket) -> Optional[Tuple[Any, List[int]]]:
+    """
+    Return ``(message, received file descriptors)``. ``None`` if the peer closed the socket.
+    """
+
+    fds = array.array("i")
+    header, ancdata, _flags, _addr = sock.recvmsg(
+        _HEADER.size, socket.CMSG_SPACE(_MAX_FDS * fds.itemsize), _MSG_CMSG_CLOEXEC
+    )
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - (len(data) % fds.itemsize)])
+
+    # received file descriptors are inheritable unless MSG_CMSG_CLOEXEC is supported:
+    # make sure that they are not leaked to the processes spawned later,
+    # which allows spawning processes without closing fds.
+    # the stdin/stdout/stderr of a process are still duplicated by Popen.
+    for fd in fds:
+        os.set_inheritable(fd, False)
+
+    if not header:
+        return None
+
+    header += _recv_exact(sock, _HEADER.size - len(header))
+    (size,) = _HEADER.unpack(header)
+
+    return (pickle.loads(_recv_exact(sock, size)), list(fds))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("connection closed by the peer")
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _wait_child(proc: subprocess.Popen, reply: socket.socket) -> None:
+    try:
+        # keep the exited process unreaped until the client acknowledges the exit,
+        # so that the process ID is not recycled while the client may send signals to it
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+        send_message(reply, ("exited",))
+        # None if the client discarded the process
+        recv_message(reply)
+    except (OSError, EOFError):
+        pass
+
+    try:
+        _pid, status, rusage = os.wait4(proc.pid, 0)
+        # the process is already reaped: prevent Popen from waiting for it
+        proc.returncode = status
+        send_message(reply, ("exit", status, rusage))
+    except OSError:
+        pass
+    finally:
+        reply.close()
+
+
+def _spawn(request: dict, fds: List[int]) -> None:
+    stdin, stdout, stderr, reply_fd = fds
+    reply = socket.socket(fileno=reply_fd)
+
+    try:
+        proc = subprocess.Popen(
+            request["args"],
+            executable=request["executable"],
+            stdin=stdin,
+            stdout=stdout,
+            stderr=stderr,
+            cwd=request["cwd"],
+            env=request["env"],
+            start_new_session=request.get("start_new_session", False),
+            close_fds=False,
+        )
+    except Exception as e:
+        try:
+            send_message(reply, ("error", e))
+        except Exception:
+            send_message(reply, ("error", OSError(str(e))))
+        reply.close()
+        return
+    finally:
+        for fd in (stdin, stdout, stderr):
+            os.close(fd)
+
+    send_message(reply, ("pid", proc.pid))
+    threading.Thread(target=_wait_child, args=(proc, reply), daemon=True).start()
+
+
+def serve(sock: socket.socket) -> None:
+    while True:
+        message = recv_message(sock)
+        if message is None:
+            # the client exited
+            return
+
+        request, fds = message
+        if len(fds) != 4:
+            for fd in fds:
+                os.close(fd)
+            continue
+
+        _spawn(request, fds)
+
+
+def main() -> int:
+    fd = int(sys.argv[1])
+    # the socket passed by the client is inheritable: the spawned processes would keep
+    # the helper alive after the client exited
+    os.set_inheritable(fd, False)
+
+    try:
+        serve(socket.socket(fileno=fd))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import functools
+from typing import Callable, Optional, Pattern, Union
+
+from mbstrdecoder import MultiByteStrDecoder
+
+
+_ASCII_BYTES = bytes(range(128))
+
+
+@functools.lru_cache(maxsize=None)
+def is_ascii_compatible(encoding: str) -> bool:
+    """
+    Return ``True`` if ASCII bytes are decoded to the same characters with ``encoding``
+    (e.g. ``False`` for UTF-16/32, EBCDIC).
+    """
+
+    try:
+        return _ASCII_BYTES.decode(encoding) == _ASCII_BYTES.decode("ascii")
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+def decode_output(
+    data: Union[bytes, str], encoding: Optional[str] = None, errors: Optional[str] = None
+) -> str:
+    """
+    Decode an output of a command with ``encoding``/``errors``.
+    If ``encoding`` is ``None``, outputs that are not ASCII are decoded by detecting
+    the encoding with ``MultiByteStrDecoder``.
+    """
+
+    if isinstance(data, str):
+        return data
+
+    if data.isascii() and (not encoding or is_ascii_compatible(encoding)):
+        return data.decode("ascii")
+
+    if encoding:
+        return data.decode(encoding, errors or "strict")
+
+    return MultiByteStrDecoder(data).unicode_str
+
+
+def resolve_error_log_level(
+    error_log_level: Optional[str], quiet: bool, default_error_log_level: str
+) -> str:
+    if quiet:
+        return "QUIET"
+
+    if error_log_level is not None:
+        return error_log_level
+
+    return default_error_log_level
+
+
+def report_failure(
+    command: str,
+    returncode: int,
+    stderr: Union[str, bytes, None],
+    ignore_stderr_regexp: Optional[Pattern],
+    logging_method: Callable,
+) -> bool:
+    """
+    Log a failed execution of a command with ``logging_method``.
+    Return ``False`` if the failure is ignored since ``stderr`` matches
+    ``ignore_stderr_regexp``.
+    """
+
+    try:
+        if ignore_stderr_regexp and ignore_stderr_regexp.search(stderr) is not None:  # type: ignore
+            return False
+    except (AttributeError, TypeError):
+        pass
+
+    logging_method(f"command='{command}', returncode={returncode}, stderr={stderr!r}")
+
+    return True
@@ -0,0 +1,438 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import signal
+import subprocess
+import time
+from subprocess import DEVNULL, PIPE
+from typing import Any, Dict, Hashable, Iterator, List, NamedTuple, Optional, Sequence, Union, cast
+
+from ._logger import get_logging_method
+from ._output import decode_output, report_failure, resolve_error_log_level
+from ._stream import (
+    STDOUT,
+    close_process,
+    iter_streams,
+    send_signal,
+    split_input,
+    terminate_process,
+)
+from ._subprocess_runner import SubprocessRunner
+from .error import CalledProcessError, CircuitOpenError
+from .retry import Retry
+from .typing import Command, EnvMapping, Input
+
+
+RunnerSource = Union[Command, SubprocessRunner]
+
+
+class _Stage(NamedTuple):
+    runner: SubprocessRunner
+    env: Optional[EnvMapping]
+    env_overrides: Optional[EnvMapping]
+
+
+class Pipeline:
+    """
+    Execute commands connected with pipes like ``command1 | command2 | ...`` without a shell.
+    The stdout of each command is connected to the stdin of the next command by an OS pipe,
+    so that the data between the commands does not pass through Python.
+    Processes are created by :py:meth:`SubprocessRunner.popen` of each stage.
+    Not available on Windows.
+
+    :param commands:
+        Commands of the stages. ``SubprocessRunner`` instances are executed as they are.
+    :param pipefail:
+        If ``True``, the return code of the pipeline is the last non-zero return code
+        of the stages (the same as ``set -o pipefail`` of bash).
+        Note that stages terminated by ``SIGPIPE`` (the return code is ``-13``)
+        because the next stage exited without reading all of the input are failures as well.
+        Otherwise, the return code of the last stage.
+    :param error_log_level:
+        Log level of the error logs of failed executions.
+        Defaults to :py:attr:`SubprocessRunner.default_error_log_level`.
+    :param kill_grace_period:
+        Seconds to wait for the processes to exit after ``SIGTERM`` when timed out.
+        Defaults to :py:attr:`SubprocessRunner.default_kill_grace_period`.
+    :param quiet: Suppress the debug and error logs.
+    :param output_encoding:
+        Codec used to decode outputs.
+        Defaults to :py:attr:`SubprocessRunner.default_output_encoding`.
+    :param output_errors:
+        Error handler used with ``output_encoding``.
+        Defaults to :py:attr:`SubprocessRunner.default_output_errors`.
+    """
+
+    def __init__(
+        self,
+        commands: Sequence[RunnerSource] = (),
+        pipefail: bool = True,
+        error_log_level: Optional[str] = None,
+        kill_grace_period: Optional[float] = None,
+        quiet: bool = False,
+        output_encoding: Optional[str] = None,
+        output_errors: Optional[str] = None,
+    ) -> None:
+        self.__stages: List[_Stage] = []
+        self.__pipefail = pipefail
+        self.__kill_grace_period = (
+            kill_grace_period
+            if kill_grace_period is not None
+            else SubprocessRunner.default_kill_grace_period
+        )
+        self.__output_encoding = (
+            output_encoding
+            if output_encoding is not None
+            else SubprocessRunner.default_output_encoding
+        )
+        self.__output_errors = (
+            output_errors if output_errors is not None else SubprocessRunner.default_output_errors
+        )
+        self.__error_logging_method = get_logging_method(
+            resolve_error_log_level(
+                error_log_level, quiet, SubprocessRunner.default_error_log_level
+            )
+        )
+        self.__debug_logging_method = get_logging_method("QUIET" if quiet else "DEBUG")
+
+        self.__returncodes: List[Optional[int]] = []
+        self.__stdout_bytes: Optional[bytes] = None
+        self.__stderrs_bytes: List[Optional[bytes]] = []
+        self.__stdout: Optional[str] = None
+        self.__stderrs: Optional[List[Optional[str]]] = None
+
+        for command in commands:
+            self.pipe(command)
+
+    def __repr__(self) -> str:
+        return "Pipeline(command='{}', returncodes={})".format(
+            self.command_str, self.__returncodes if self.__returncodes else "'not yet executed'"
+        )
+
+    def __len__(self) -> int:
+        return len(self.__stages)
+
+    @property
+    def runners(self) -> List[SubprocessRunner]:
+        return [stage.runner for stage in self.__stages]
+
+    @property
+    def command_str(self) -> str:
+        return " | ".join(stage.runner.command_str for stage in self.__stages)
+
+    @property
+    def pipefail(self) -> bool:
+        return self.__pipefail
+
+    @property
+    def dry_run(self) -> bool:
+        return any(stage.runner.dry_run for stage in self.__stages)
+
+    @property
+    def returncodes(self) -> List[Optional[int]]:
+        """
+        Return codes of the stages of the last execution.
+        """
+
+        return list(self.__returncodes)
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if not self.__returncodes:
+            return None
+
+        if not self.__pipefail:
+            return self.__returncodes[-1]
+
+        for returncode in reversed(self.__returncodes):
+            if returncode != 0:
+                return returncode
+
+        return 0
+
+    @property
+    def stdout_bytes(self) -> Optional[bytes]:
+        """
+        Output of the last stage.
+        """
+
+        return self.__stdout_bytes
+
+    @property
+    def stdout(self) -> Optional[str]:
+        if self.__stdout is None and self.__stdout_bytes is not None:
+            self.__stdout = self.__decode(self.__stdout_bytes)
+
+        return self.__stdout
+
+    @property
+    def stderrs_bytes(self) -> List[Optional[bytes]]:
+        """
+        Error outputs of the stages.
+        """
+
+        return list(self.__stderrs_bytes)
+
+    @property
+    def stderrs(self) -> List[Optional[str]]:
+        if self.__stderrs is None:
+            self.__stderrs = [
+                None if stderr is None else self.__decode(stderr) for stderr in self.__stderrs_bytes
+            ]
+
+        return list(self.__stderrs)
+
+    @property
+    def output_encoding(self) -> Optional[str]:
+        return self.__output_encoding
+
+    def pipe(
+        self,
+        command: RunnerSource,
+        env: Optional[EnvMapping] = None,
+        env_overrides: Optional[EnvMapping] = None,
+    ) -> "Pipeline":
+        """
+        Append a stage that reads the output of the current last stage and return ``self``.
+        ``env``/``env_overrides`` are the environment variables of the stage.
+        ``env`` defaults to the ``env`` passed to :py:meth:`.run`,
+        and ``env_overrides`` are merged onto the ``env_overrides`` passed to :py:meth:`.run`.
+        """
+
+        runner = command if isinstance(command, SubprocessRunner) else SubprocessRunner(command)
+        self.__stages.append(_Stage(runner=runner, env=env, env_overrides=env_overrides))
+
+        return self
+
+    def run(
+        self,
+        input: Input = None,
+        encoding: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        check: bool = False,
+        env: Optional[EnvMapping] = None,
+        env_overrides: Optional[EnvMapping] = None,
+    ) -> int:
+        """
+        Execute the pipeline and return the return code.
+
+        :param input:
+            Input of the first stage. The same types as the ``input`` of
+            :py:meth:`SubprocessRunner.run` are accepted.
+        :param timeout:
+            If the pipeline does not complete within ``timeout`` seconds, all of the stages are
+            terminated and :py:class:`subprocess.TimeoutExpired` is raised with the partial
+            outputs.
+        :param retry: Retry setting. The whole pipeline is executed again at a retry.
+        :param check: Raise :py:class:`CalledProcessError` if the pipeline failed.
+        :param env: Environment variables of the stages.
+        :param env_overrides: Environment variables merged onto ``env`` of the stages.
+        """
+
+        if not self.__stages:
+            raise ValueError("pipeline has no commands")
+
+        encoding = "ascii" if encoding is None else encoding
+
+        if retry is None:
+            self.__execute(input, encoding, timeout, env, env_overrides)
+
+            return self.__handle_returncode(check)
+
+        started = time.monotonic()
+        attempt = 0
+        backoff: Optional[float] = None
+
+        while True:
+            try:
+                is_trial = retry.before_attempt(self.command_str)
+            except CircuitOpenError:
+                if attempt == 0:
+                    raise
+
+                # the circuit was opened by the failures: keep the result of the last attempt
+                break
+
+            with retry.track_attempt(self.command_str, is_trial):
+                returncode = self.__execute(input, encoding, timeout, env, env_overrides)
+                is_retryable = retry.after_attempt(
+                    self.command_str,
+                    returncode,
+                    None if returncode == 0 else self.stderrs[self.__failed_stage_index()],
+                )
+
+            if not is_retryable:
+                break
+
+            attempt += 1
+            backoff = retry.next_backoff(attempt, started, backoff)
+            if backoff is None:
+                break
+
+            retry.sleep_before_retry(
+                attempt=attempt,
+                logging_method=self.__debug_logging_method,
+                retry_target=self.command_str,
+                backoff=backoff,
+            )
+
+        return self.__handle_returncode(check)
+
+    def raise_for_returncode(self) -> None:
+        returncode = self.returncode
+        if returncode in [None, 0]:
+            return
+
+        raise CalledProcessError(
+            returncode=cast(int, returncode),
+            cmd=self.command_str,
+            output=self.stdout,
+            stderr=self.stderrs[self.__failed_stage_index()],
+        )
+
+    def __execute(
+        self,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        env: Optional[EnvMapping],
+        env_overrides: Optional[EnvMapping],
+    ) -> int:
+        self.__returncodes = []
+        self.__set_output(None, [])
+
+        if self.dry_run:
+            for stage in self.__stages:
+                if stage.runner.dry_run:
+                    stage.runner.popen()
+
+            self.__returncodes = [0] * len(self.__stages)
+            self.__set_output(b"", [b""] * len(self.__stages))
+
+            return 0
+
+        input_fd, input_data = split_input(input, encoding)
+        procs = self.__spawn(input_fd, input_data, env, env_overrides)
+        chunks: Dict[Hashable, List[bytes]] = {STDOUT: []}
+        chunks.update({i: [] for i in range(len(procs))})
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            for key, chunk in iter_streams(
+                self.command_str,
+                stdin=procs[0].stdin,
+                readers=[(procs[-1].stdout, STDOUT)]
+                + [(proc.stderr, i) for i, proc in enumerate(procs)],
+                input=input_data,
+                timeout=timeout,
+            ):
+                chunks[key].append(chunk)
+
+            for proc in procs:
+                proc.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            self.__terminate(procs, chunks)
+
+            raise subprocess.TimeoutExpired(
+                cmd=self.command_str,
+                timeout=cast(float, timeout),
+                output=b"".join(chunks[STDOUT]),
+                stderr=b"".join(b"".join(chunks[i]) for i in range(len(procs))),
+            )
+        except BaseException:
+            self.__close(procs)
+            raise
+
+        self.__returncodes = [proc.returncode for proc in procs]
+        self.__set_output(
+            b"".join(chunks[STDOUT]), [b"".join(chunks[i]) for i in range(len(procs))]
+        )
+
+        return cast(int, self.returncode)
+
+    def __spawn(
+        self,
+        input_fd: Optional[int],
+        input_data: Union[bytes, Iterator[bytes], None],
+        env: Optional[EnvMapping],
+        env_overrides: Optional[EnvMapping],
+    ) -> List[subprocess.Popen]:
+        procs: List[subprocess.Popen] = []
+        stdin: Any = input_fd if input_fd is not None else PIPE if input_data else DEVNULL
+
+        try:
+            for stage in self.__stages:
+                proc = stage.runner.popen(
+                    std_in=stdin,
+                    env=stage.env if stage.env is not None else env,
+                    env_overrides=dict(env_overrides or {}, **(stage.env_overrides or {})),
+                )
+                if procs:
+                    # the pipe is held by the next stage:
+                    # close it so that the previous stage receives SIGPIPE if the next exits
+                    procs[-1].stdout.close()  # type: ignore
+
+                procs.append(cast(subprocess.Popen, proc))
+                stdin = proc.stdout
+        except BaseException:
+            self.__close(procs)
+            raise
+
+        return procs
+
+    def __terminate(
+        self, procs: List[subprocess.Popen], chunks: Dict[Hashable, List[bytes]]
+    ) -> None:
+        for proc, stage in zip(procs, self.__stages):
+            send_signal(proc, signal.SIGTERM, kill_group=stage.runner.start_new_session)
+
+        for i, (proc, stage) in enumerate(zip(procs, self.__stages)):
+            stdout, stderr = terminate_process(
+                proc,
+                grace_period=self.__kill_grace_period,
+                kill_group=stage.runner.start_new_session,
+            )
+            if proc is procs[-1]:
+                chunks[STDOUT].append(stdout)
+            chunks[i].append(stderr)
+
+    def __close(self, procs: List[subprocess.Popen]) -> None:
+        for proc, stage in zip(procs, self.__stages):
+            close_process(proc, kill_group=stage.runner.start_new_session)
+
+    def __failed_stage_index(self) -> int:
+        if self.__pipefail:
+            for i in reversed(range(len(self.__returncodes))):
+                if self.__returncodes[i] != 0:
+                    return i
+
+        return len(self.__returncodes) - 1
+
+    def __handle_returncode(self, check: bool) -> int:
+        returncode = cast(int, self.returncode)
+        if returncode == 0:
+            return 0
+
+        report_failure(
+            self.command_str,
+            returncode,
+            self.stderrs[self.__failed_stage_index()],
+            None,
+            self.__error_logging_method,
+        )
+
+        if check is True:
+            self.raise_for_returncode()
+
+        return returncode
+
+    def __set_output(self, stdout: Optional[bytes], stderrs: List[Optional[bytes]]) -> None:
+        self.__stdout_bytes = stdout
+        self.__stderrs_bytes = stderrs
+        self.__stdout = None
+        self.__stderrs = None
+
+    def __decode(self, data: bytes) -> str:
+        return decode_output(data, self.__output_encoding, self.__output_errors)
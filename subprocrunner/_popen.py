@@ -0,0 +1,79 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+
+class TrackedPopen(subprocess.Popen):
+    """
+    :py:class:`subprocess.Popen` that records the time spent to wait for the process,
+    and the resource usage of the process (POSIX only) when the process is reaped.
+    ``on_exit`` keyword argument is a callable that is called once when the process is reaped.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.wait_time = 0.0
+        self.rusage: Optional[Any] = None
+        self.__on_exit: Optional[Callable[[], None]] = kwargs.pop("on_exit", None)
+        self.__on_exit_lock = threading.Lock()
+
+        try:
+            super().__init__(*args, **kwargs)
+        except BaseException:
+            # the caller is responsible for the failed spawn
+            self.__on_exit = None
+            raise
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        started = time.perf_counter()
+        try:
+            return super().wait(timeout)
+        finally:
+            self.wait_time += time.perf_counter() - started
+            self.__notify_exit()
+
+    def poll(self) -> Optional[int]:
+        try:
+            return super().poll()
+        finally:
+            self.__notify_exit()
+
+    def __del__(self, *args: Any, **kwargs: Any) -> None:
+        try:
+            super().__del__(*args, **kwargs)  # type: ignore
+        finally:
+            # the process may be still running: notify anyway since the object is discarded
+            self.__notify_exit(force=True)
+
+    def __notify_exit(self, force: bool = False) -> None:
+        """
+        Call the ``on_exit`` callback once the process is reaped.
+        """
+
+        if self.__on_exit is None or (not force and self.returncode is None):
+            return
+
+        with self.__on_exit_lock:
+            on_exit, self.__on_exit = self.__on_exit, None
+
+        if on_exit is not None:
+            on_exit()
+
+    if hasattr(os, "wait4"):
+
+        def _try_wait(self, wait_flags: int) -> Tuple[int, int]:
+            # same as subprocess.Popen._try_wait except for collecting the resource usage
+            try:
+                (pid, sts, rusage) = os.wait4(self.pid, wait_flags)
+            except ChildProcessError:
+                return (self.pid, 0)
+
+            if pid == self.pid:
+                self.rusage = rusage
+
+            return (pid, sts)
@@ -0,0 +1,247 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, Tuple, Union
+
+from ._singleflight import SingleFlight
+from .typing import Command, EnvMapping
+
+
+def make_command_key(command: Command) -> Hashable:
+    if isinstance(command, (list, tuple)):
+        return tuple(str(item) for item in command)
+
+    return command
+
+
+def make_result_key(
+    command: Command, env: Optional[EnvMapping], input: Union[str, bytes, None]
+) -> Hashable:
+    """
+    Make a key to identify executions that produce the same result: the command,
+    the environment variables, the input, and the current working directory.
+    """
+
+    return (
+        make_command_key(command),
+        None if env is None else frozenset(env.items()),
+        input,
+        os.getcwd(),
+    )
+
+
+class ResultCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    shared: int
+    evictions: int
+    maxsize: int
+    currsize: int
+    currbytes: int
+
+
+class CachedResult(NamedTuple):
+    returncode: int
+    stdout: Optional[bytes]
+    stderr: Optional[bytes]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.stdout or b"") + len(self.stderr or b"")
+
+
+class _Entry(NamedTuple):
+    result: CachedResult
+    expires_at: Optional[float]
+
+
+class ResultCache:
+    """
+    Cache of command execution results for idempotent (read-only) commands.
+    Pass an instance to :py:class:`SubprocessRunner` to reuse the return code and outputs of
+    previous executions without spawning processes. An instance can be shared by runners.
+
+    Entries are keyed on the command, the environment variables, the input, and the current
+    working directory.
+
+    :param ttl: Seconds to keep an entry. Entries never expire if ``None``.
+    :param maxsize: Maximum number of entries. The least recently used entries are evicted.
+    :param max_bytes: Maximum total size of the cached outputs in bytes.
+    :param cache_failures: Cache the results of failed executions as well if ``True``.
+    :param singleflight: If ``True``, concurrent executions of an identical command
+        that missed the cache wait for the first one and share the result.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        maxsize: int = 256,
+        max_bytes: Optional[int] = None,
+        cache_failures: bool = False,
+        singleflight: bool = False,
+    ) -> None:
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be greater than zero")
+        if maxsize <= 0:
+            raise ValueError("maxsize must be greater than zero")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than zero")
+
+        self.__ttl = ttl
+        self.__maxsize = maxsize
+        self.__max_bytes = max_bytes
+        self.__cache_failures = cache_failures
+        self.__singleflight: Optional[SingleFlight[CachedResult]] = (
+            SingleFlight() if singleflight else None
+        )
+
+        self.__lock = threading.Lock()
+        self.__entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.__currbytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__shared = 0
+        self.__evictions = 0
+
+    def __repr__(self) -> str:
+        info = self.cache_info()
+
+        return (
+            f"ResultCache(ttl={self.__ttl}, maxsize={self.__maxsize}, "
+            f"max_bytes={self.__max_bytes}, hits={info.hits}, misses={info.misses}, "
+            f"currsize={info.currsize})"
+        )
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def ttl(self) -> Optional[float]:
+        return self.__ttl
+
+    @property
+    def maxsize(self) -> int:
+        return self.__maxsize
+
+    @property
+    def max_bytes(self) -> Optional[int]:
+        return self.__max_bytes
+
+    def cache_info(self) -> ResultCacheInfo:
+        with self.__lock:
+            return ResultCacheInfo(
+                hits=self.__hits,
+                misses=self.__misses,
+                shared=self.__shared,
+                evictions=self.__evictions,
+                maxsize=self.__maxsize,
+                currsize=len(self.__entries),
+                currbytes=self.__currbytes,
+            )
+
+    def clear(self) -> None:
+        """
+        Discard all of the entries and reset the statistics.
+        """
+
+        with self.__lock:
+            self.__entries.clear()
+            self.__currbytes = 0
+            self.__hits = 0
+            self.__misses = 0
+            self.__shared = 0
+            self.__evictions = 0
+
+    def invalidate(self, command: Command) -> int:
+        """
+        Discard the entries of a command regardless of the environment variables, the input,
+        and the working directory. Return the number of the discarded entries.
+        """
+
+        command_key = make_command_key(command)
+
+        with self.__lock:
+            keys = [key for key in self.__entries if key[0] == command_key]  # type: ignore
+            for key in keys:
+                self.__remove(key)
+
+        return len(keys)
+
+    def make_key(
+        self, command: Command, env: Optional[EnvMapping], input: Union[str, bytes, None]
+    ) -> Hashable:
+        return make_result_key(command, env, input)
+
+    def get(self, key: Hashable) -> Optional[CachedResult]:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                if entry.expires_at is None or entry.expires_at > time.monotonic():
+                    self.__entries.move_to_end(key)
+                    self.__hits += 1
+                    return entry.result
+
+                self.__remove(key)
+
+            self.__misses += 1
+
+        return None
+
+    def put(self, key: Hashable, result: CachedResult) -> None:
+        if result.returncode != 0 and not self.__cache_failures:
+            return
+        if self.__max_bytes is not None and result.nbytes > self.__max_bytes:
+            return
+
+        expires_at = None if self.__ttl is None else time.monotonic() + self.__ttl
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+            self.__entries[key] = _Entry(result, expires_at)
+            self.__currbytes += result.nbytes
+
+            while len(self.__entries) > self.__maxsize or (
+                self.__max_bytes is not None and self.__currbytes > self.__max_bytes
+            ):
+                self.__remove(next(iter(self.__entries)))
+                self.__evictions += 1
+
+    def get_or_execute(
+        self, key: Hashable, func: Callable[[], CachedResult]
+    ) -> Tuple[CachedResult, bool]:
+        """
+        Return ``(result, is_cached)``: the cached result of ``key``, or the result of ``func``
+        that is stored to the cache. ``is_cached`` is ``False`` if ``func`` was called
+        by the caller.
+        """
+
+        result = self.get(key)
+        if result is not None:
+            return (result, True)
+
+        if self.__singleflight is None:
+            return (self.__execute(key, func), False)
+
+        result, is_shared = self.__singleflight.do(key, lambda: self.__execute(key, func))
+        if is_shared:
+            with self.__lock:
+                self.__shared += 1
+
+        return (result, is_shared)
+
+    def __execute(self, key: Hashable, func: Callable[[], CachedResult]) -> CachedResult:
+        result = func()
+        self.put(key, result)
+
+        return result
+
+    def __remove(self, key: Hashable) -> None:
+        entry = self.__entries.pop(key)
+        self.__currbytes -= entry.result.nbytes
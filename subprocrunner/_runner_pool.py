@@ -0,0 +1,184 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_EXCEPTION,
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError,
+    as_completed,
+    wait,
+)
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+from ._cancel_scope import CancelScope
+from ._subprocess_runner import SubprocessRunner
+from .retry import Retry
+from .typing import Command
+
+
+RunnerSource = Union[Command, SubprocessRunner]
+
+
+class RunnerPool:
+    """
+    Execute multiple commands concurrently with a bounded number of worker threads.
+
+    Each command is executed by :py:meth:`SubprocessRunner.run`, so error logging,
+    ``check``, dry-run and command history behave the same as the single command execution.
+
+    :param max_workers:
+        Maximum number of commands executed at the same time.
+        Defaults to the :py:class:`concurrent.futures.ThreadPoolExecutor` default.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        if max_workers is not None and max_workers <= 0:
+            raise ValueError("max_workers must be greater than zero")
+
+        self.__max_workers = max_workers
+
+    def __repr__(self) -> str:
+        return f"RunnerPool(max_workers={self.__max_workers})"
+
+    @property
+    def max_workers(self) -> Optional[int]:
+        return self.__max_workers
+
+    def run_many(
+        self,
+        commands: Sequence[RunnerSource],
+        timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        fail_fast: bool = False,
+        **kwargs: Any,
+    ) -> List[SubprocessRunner]:
+        """
+        Execute commands and return the runners in the same order as ``commands``.
+
+        :param commands:
+            Commands to execute. ``SubprocessRunner`` instances are executed as they are.
+        :param timeout: Timeout for each command execution.
+        :param total_timeout:
+            Timeout for the whole batch. Raises :py:class:`concurrent.futures.TimeoutError`
+            when the timeout expired: the processes of the commands in progress are killed,
+            and commands that are not started yet are cancelled.
+        :param retry: Retry setting applied to each command.
+        :param fail_fast:
+            If ``True``, cancel pending commands, kill the processes of the commands
+            in progress, and raise at the first exception.
+            Otherwise, execute all of the commands and then raise the first exception
+            in ``commands`` order, if any.
+        :param kwargs: Keyword arguments passed to :py:meth:`SubprocessRunner.run`.
+        """
+
+        runners = [self.__to_runner(command) for command in commands]
+        executor = ThreadPoolExecutor(max_workers=self.__max_workers)
+        futures: List[Future] = []
+        cancel_scope = CancelScope()
+        kwargs[SubprocessRunner._CANCEL_SCOPE_KEY] = cancel_scope
+
+        try:
+            for runner in runners:
+                futures.append(executor.submit(runner.run, timeout=timeout, retry=retry, **kwargs))
+
+            done, not_done = wait(
+                futures,
+                timeout=total_timeout,
+                return_when=FIRST_EXCEPTION if fail_fast else ALL_COMPLETED,
+            )
+
+            for future in futures:
+                if future in done and future.exception() is not None:
+                    # kill the commands in progress in the case of fail_fast
+                    cancel_scope.cancel()
+                    raise future.exception()  # type: ignore
+
+            if not_done:
+                cancel_scope.cancel()
+                raise TimeoutError(
+                    f"{len(not_done)} of {len(futures)} commands not completed "
+                    f"within {total_timeout} seconds"
+                )
+        finally:
+            self.__shutdown(executor, futures)
+
+        return runners
+
+    def iter_completed(
+        self,
+        commands: Sequence[RunnerSource],
+        timeout: Optional[float] = None,
+        total_timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        fail_fast: bool = False,
+        **kwargs: Any,
+    ) -> Iterator[SubprocessRunner]:
+        """
+        Execute commands and yield the runners in the order of completion.
+        Parameters are the same as :py:meth:`.run_many`.
+        """
+
+        runners = [self.__to_runner(command) for command in commands]
+        executor = ThreadPoolExecutor(max_workers=self.__max_workers)
+        futures: List[Future] = []
+        future_to_runner: Dict[Future, SubprocessRunner] = {}
+        first_error: Optional[BaseException] = None
+        cancel_scope = CancelScope()
+        kwargs[SubprocessRunner._CANCEL_SCOPE_KEY] = cancel_scope
+
+        try:
+            for runner in runners:
+                future = executor.submit(runner.run, timeout=timeout, retry=retry, **kwargs)
+                futures.append(future)
+                future_to_runner[future] = runner
+
+            for future in as_completed(futures, timeout=total_timeout):
+                error = future.exception()
+                if error is not None:
+                    if fail_fast:
+                        cancel_scope.cancel()
+                        raise error
+
+                    if first_error is None:
+                        first_error = error
+                    continue
+
+                yield future_to_runner[future]
+        except TimeoutError:
+            cancel_scope.cancel()
+            raise
+        finally:
+            self.__shutdown(executor, futures)
+
+        if first_error is not None:
+            raise first_error
+
+    @staticmethod
+    def __to_runner(command: RunnerSource) -> SubprocessRunner:
+        if isinstance(command, SubprocessRunner):
+            return command
+
+        return SubprocessRunner(command)
+
+    @staticmethod
+    def __shutdown(executor: ThreadPoolExecutor, futures: List[Future]) -> None:
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+
+def run_many(
+    commands: Sequence[RunnerSource],
+    max_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> List[SubprocessRunner]:
+    """
+    Shorthand for ``RunnerPool(max_workers).run_many(commands, **kwargs)``.
+    """
+
+    return RunnerPool(max_workers=max_workers).run_many(commands, **kwargs)
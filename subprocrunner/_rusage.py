@@ -0,0 +1,113 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+from typing import Any, Dict
+
+
+class ResourceUsage:
+    """
+    Resource usage of executed processes collected by ``wait4`` (POSIX only).
+    Values are summed up over retry attempts, except for ``max_rss`` that is the maximum.
+
+    .. py:attribute:: user_time
+
+        User CPU time in seconds.
+
+    .. py:attribute:: system_time
+
+        System CPU time in seconds.
+
+    .. py:attribute:: max_rss
+
+        Maximum resident set size in bytes.
+
+    .. py:attribute:: minor_faults
+
+        Page faults serviced without any I/O activity.
+
+    .. py:attribute:: major_faults
+
+        Page faults that required I/O activity.
+
+    .. py:attribute:: voluntary_context_switches
+
+    .. py:attribute:: involuntary_context_switches
+    """
+
+    __slots__ = (
+        "user_time",
+        "system_time",
+        "max_rss",
+        "minor_faults",
+        "major_faults",
+        "voluntary_context_switches",
+        "involuntary_context_switches",
+    )
+
+    @classmethod
+    def from_struct_rusage(cls, rusage: Any) -> "ResourceUsage":
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        rss_unit = 1 if platform.system() == "Darwin" else 1024
+
+        return cls(
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * rss_unit,
+            minor_faults=rusage.ru_minflt,
+            major_faults=rusage.ru_majflt,
+            voluntary_context_switches=rusage.ru_nvcsw,
+            involuntary_context_switches=rusage.ru_nivcsw,
+        )
+
+    def __init__(
+        self,
+        user_time: float = 0.0,
+        system_time: float = 0.0,
+        max_rss: int = 0,
+        minor_faults: int = 0,
+        major_faults: int = 0,
+        voluntary_context_switches: int = 0,
+        involuntary_context_switches: int = 0,
+    ) -> None:
+        self.user_time = user_time
+        self.system_time = system_time
+        self.max_rss = max_rss
+        self.minor_faults = minor_faults
+        self.major_faults = major_faults
+        self.voluntary_context_switches = voluntary_context_switches
+        self.involuntary_context_switches = involuntary_context_switches
+
+    def __repr__(self) -> str:
+        return "ResourceUsage({})".format(
+            ", ".join(f"{key}={value}" for key, value in self.as_dict().items())
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ResourceUsage):
+            return NotImplemented
+
+        return self.as_dict() == other.as_dict()
+
+    def __add__(self, other: "ResourceUsage") -> "ResourceUsage":
+        return ResourceUsage(
+            user_time=self.user_time + other.user_time,
+            system_time=self.system_time + other.system_time,
+            max_rss=max(self.max_rss, other.max_rss),
+            minor_faults=self.minor_faults + other.minor_faults,
+            major_faults=self.major_faults + other.major_faults,
+            voluntary_context_switches=(
+                self.voluntary_context_switches + other.voluntary_context_switches
+            ),
+            involuntary_context_switches=(
+                self.involuntary_context_switches + other.involuntary_context_switches
+            ),
+        )
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
@@ -0,0 +1,434 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+import re
+import selectors
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from subprocess import PIPE
+from typing import Any, Dict, Optional, Pattern, Tuple, cast
+
+from ._env import get_env
+from ._logger import DEFAULT_ERROR_LOG_LEVEL, get_logging_method
+from ._output import decode_output, report_failure, resolve_error_log_level
+from ._stream import close_process
+from ._subprocess_runner import SubprocessRunner
+from .error import CalledProcessError, CommandError
+from .typing import EnvMapping
+
+
+_READ_SIZE = 32 * 1024
+_ENV_NAME_REGEXP = re.compile("[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class ShellSession:
+    """
+    Execute shell commands one after another through a long-lived shell process.
+    This avoids the startup cost of a shell for each command that
+    :py:class:`SubprocessRunner` pays for string commands.
+
+    Outputs and the return code of each command are separated by sentinels
+    that the session writes after the command. The stdin of commands is ``/dev/null``.
+    Commands are executed in the same shell, so shell variables and the working directory
+    changed by a command are preserved for the following commands
+    until the session is restarted. Changes made by :py:meth:`set_env` and :py:meth:`chdir`
+    are preserved over restarts.
+
+    The session is restarted when a command exits the shell or a command timed out.
+
+    .. py:attribute:: default_shell
+
+        Class wide default shell executable.
+
+    :param shell: Shell executable. Defaults to :py:attr:`default_shell`.
+    :param env: Environment variables for the shell.
+    :param cwd: Working directory of the shell.
+    :param output_encoding:
+        Codec used to decode outputs.
+        Defaults to :py:attr:`SubprocessRunner.default_output_encoding`.
+    :param output_errors:
+        Error handler used with ``output_encoding``.
+        Defaults to :py:attr:`SubprocessRunner.default_output_errors`.
+    """
+
+    default_shell = "/bin/sh"
+    default_error_log_level = DEFAULT_ERROR_LOG_LEVEL
+
+    def __init__(
+        self,
+        shell: Optional[str] = None,
+        env: Optional[EnvMapping] = None,
+        cwd: Optional[str] = None,
+        error_log_level: Optional[str] = None,
+        ignore_stderr_regexp: Optional[Pattern] = None,
+        quiet: bool = False,
+        output_encoding: Optional[str] = None,
+        output_errors: Optional[str] = None,
+    ) -> None:
+        if platform.system() == "Windows":
+            raise NotImplementedError("ShellSession is not supported on Windows")
+
+        self.__shell = shell if shell else self.default_shell
+        self.__env = env
+        self.__env_overrides: Dict[str, str] = {}
+        self.__cwd = cwd
+        self.__proc: Optional[subprocess.Popen] = None
+        self.__lock = threading.RLock()
+
+        self.__command: Optional[str] = None
+        self.__stdout: Optional[str] = None
+        self.__stderr: Optional[str] = None
+        self.__stdout_bytes: Optional[bytes] = None
+        self.__stderr_bytes: Optional[bytes] = None
+        self.__returncode: Optional[int] = None
+
+        self.__ignore_stderr_regexp = ignore_stderr_regexp
+        self.__output_encoding = (
+            output_encoding
+            if output_encoding is not None
+            else SubprocessRunner.default_output_encoding
+        )
+        self.__output_errors = (
+            output_errors if output_errors is not None else SubprocessRunner.default_output_errors
+        )
+        self.__debug_logging_method = get_logging_method("QUIET" if quiet else "DEBUG")
+        self.error_log_level = resolve_error_log_level(
+            error_log_level, quiet, self.default_error_log_level
+        )
+
+    def __repr__(self) -> str:
+        params = [f"shell='{self.__shell}'", f"pid={self.pid}"]
+        if self.__command is not None:
+            params.extend([f"command='{self.__command}'", f"returncode={self.__returncode}"])
+
+        return "ShellSession({})".format(", ".join(params))
+
+    def __enter__(self) -> "ShellSession":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def shell(self) -> str:
+        return self.__shell
+
+    @property
+    def pid(self) -> Optional[int]:
+        """
+        Process ID of the shell. ``None`` if the shell is not running.
+        """
+
+        if self.__proc is None:
+            return None
+
+        return self.__proc.pid
+
+    @property
+    def cwd(self) -> Optional[str]:
+        """
+        Working directory set by the constructor or :py:meth:`chdir`.
+        """
+
+        return self.__cwd
+
+    @property
+    def command(self) -> Optional[str]:
+        return self.__command
+
+    @property
+    def stdout(self) -> Optional[str]:
+        if self.__stdout is None and self.__stdout_bytes is not None:
+            self.__stdout = self.__decode(self.__stdout_bytes)
+
+        return self.__stdout
+
+    @property
+    def stderr(self) -> Optional[str]:
+        if self.__stderr is None and self.__stderr_bytes is not None:
+            self.__stderr = self.__decode(self.__stderr_bytes)
+
+        return self.__stderr
+
+    @property
+    def stdout_bytes(self) -> Optional[bytes]:
+        return self.__stdout_bytes
+
+    @property
+    def stderr_bytes(self) -> Optional[bytes]:
+        return self.__stderr_bytes
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.__returncode
+
+    @property
+    def output_encoding(self) -> Optional[str]:
+        return self.__output_encoding
+
+    @property
+    def error_log_level(self) -> None:
+        raise NotImplementedError()
+
+    @error_log_level.setter
+    def error_log_level(self, log_level: Optional[str]) -> None:
+        self.__error_logging_method = get_logging_method(log_level)
+
+    def run(self, command: str, timeout: Optional[float] = None, check: bool = False) -> int:
+        """
+        Execute a command in the shell and return the return code.
+
+        :param command: Shell command to execute.
+        :param timeout: Seconds to wait for the command. If the command does not complete
+            in time, the shell is killed and :py:class:`subprocess.TimeoutExpired` is raised.
+            The session is restarted on the next execution.
+        :param check: Raise :py:class:`CalledProcessError` if the command failed.
+        """
+
+        if not command:
+            raise ValueError("command is empty")
+
+        with self.__lock:
+            self.__command = command
+            self.__set_result(None, None, None)
+            self.__debug_logging_method(f"shell-session: {command}")
+
+            returncode, stdout, stderr = self.__execute(command, timeout)
+            self.__set_result(returncode, stdout, stderr)
+
+            return self.__handle_returncode(check)
+
+    def set_env(self, key: str, value: str) -> None:
+        """
+        Set an environment variable for the following commands.
+        """
+
+        if not _ENV_NAME_REGEXP.match(key):
+            raise ValueError(f"invalid environment variable name: {key}")
+
+        with self.__lock:
+            self.__env_overrides[key] = value
+
+            if self.__proc is not None:
+                self.__execute_internal(f"export {key}={shlex.quote(value)}")
+
+    def chdir(self, path: str) -> None:
+        """
+        Change the working directory for the following commands.
+        """
+
+        with self.__lock:
+            stdout = self.__execute_internal(f"cd -- {shlex.quote(path)} && pwd")
+            self.__cwd = stdout.rstrip("\n")
+
+    def restart(self) -> None:
+        """
+        Restart the shell. Shell variables and the working directory changed by commands
+        are discarded.
+        """
+
+        with self.__lock:
+            self.close()
+            self.__get_process()
+
+    def close(self) -> None:
+        """
+        Terminate the shell.
+        """
+
+        with self.__lock:
+            if self.__proc is None:
+                return
+
+            proc = self.__proc
+            self.__proc = None
+
+            try:
+                proc.stdin.close()  # type: ignore
+                proc.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+            self.__kill(proc)
+
+    def raise_for_returncode(self) -> None:
+        if self.__returncode in [None, 0]:
+            return
+
+        assert self.__returncode
+        assert self.__command
+
+        raise CalledProcessError(
+            returncode=self.__returncode,
+            cmd=self.__command,
+            output=self.stdout,
+            stderr=self.stderr,
+        )
+
+    def __get_process(self) -> subprocess.Popen:
+        if self.__proc is not None:
+            return self.__proc
+
+        self.__proc = subprocess.Popen(
+            [self.__shell],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            env=get_env(self.__env, self.__env_overrides),
+            cwd=self.__cwd,
+            start_new_session=True,
+        )
+
+        return self.__proc
+
+    def __kill(self, proc: subprocess.Popen) -> None:
+        # kill the processes started by the commands as well as the shell
+        if proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        close_process(proc)
+
+    def __execute_internal(self, command: str) -> str:
+        returncode, stdout, stderr = self.__execute(command, timeout=None)
+        if returncode != 0:
+            raise CommandError(
+                "failed to execute '{}': {}".format(command, self.__decode(stderr).strip()),
+                cmd=command,
+                errno=returncode,
+            )
+
+        return self.__decode(stdout)
+
+    def __execute(self, command: str, timeout: Optional[float]) -> Tuple[int, bytes, bytes]:
+        proc = self.__get_process()
+        sentinel = f"__subprocrunner_{uuid.uuid4().hex}__"
+        script = (
+            "eval {command} </dev/null; printf '%s%d\\n' {sentinel} $?; "
+            "printf '%s\\n' {sentinel} >&2\n"
+        ).format(command=shlex.quote(command), sentinel=sentinel)
+
+        try:
+            proc.stdin.write(script.encode())  # type: ignore
+            proc.stdin.flush()  # type: ignore
+        except BrokenPipeError:
+            pass
+
+        try:
+            stdout, stderr, returncode = self.__read_result(proc, sentinel.encode(), timeout)
+        except subprocess.TimeoutExpired:
+            self.__proc = None
+            self.__kill(proc)
+            raise
+
+        if returncode is None:
+            # the shell exited during the command: restart the session for the next command
+            self.__proc = None
+            self.__kill(proc)
+            returncode = proc.returncode
+
+        return (returncode, stdout, stderr)
+
+    def __read_result(
+        self, proc: subprocess.Popen, sentinel: bytes, timeout: Optional[float]
+    ) -> Tuple[bytes, bytes, Optional[int]]:
+        """
+        Read the outputs of a command until the sentinels are found in both of
+        stdout and stderr. The return code is ``None`` if the shell exited before that.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stdout_fd = proc.stdout.fileno()  # type: ignore
+        stderr_fd = proc.stderr.fileno()  # type: ignore
+        buffers = {stdout_fd: bytearray(), stderr_fd: bytearray()}
+        search_from = {stdout_fd: 0, stderr_fd: 0}
+        sentinel_pos: Dict[int, int] = {}
+        is_eof = False
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_fd, selectors.EVENT_READ)
+            selector.register(stderr_fd, selectors.EVENT_READ)
+
+            while selector.get_map():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise subprocess.TimeoutExpired(
+                        self.__command,  # type: ignore
+                        timeout,  # type: ignore
+                        output=bytes(buffers[stdout_fd]),
+                        stderr=bytes(buffers[stderr_fd]),
+                    )
+
+                for key, _events in selector.select(remaining):
+                    data = os.read(key.fd, _READ_SIZE)
+                    if not data:
+                        is_eof = True
+                        selector.unregister(key.fd)
+                        continue
+
+                    buffer = buffers[key.fd]
+                    buffer.extend(data)
+
+                    # the sentinel is followed by the return code and a newline on stdout,
+                    # and a newline on stderr
+                    pos = buffer.find(sentinel, search_from[key.fd])
+                    if pos < 0:
+                        search_from[key.fd] = max(0, len(buffer) - len(sentinel))
+                        continue
+                    search_from[key.fd] = pos
+                    if buffer.find(b"\n", pos) < 0:
+                        continue
+
+                    sentinel_pos[key.fd] = pos
+                    selector.unregister(key.fd)
+
+        stdout = buffers[stdout_fd]
+        stderr = buffers[stderr_fd]
+
+        if is_eof or len(sentinel_pos) < 2:
+            return (bytes(stdout), bytes(stderr), None)
+
+        stdout_pos = sentinel_pos[stdout_fd]
+        returncode = int(stdout[stdout_pos + len(sentinel) : stdout.find(b"\n", stdout_pos)])
+
+        return (bytes(stdout[:stdout_pos]), bytes(stderr[: sentinel_pos[stderr_fd]]), returncode)
+
+    def __handle_returncode(self, check: bool) -> int:
+        assert self.__returncode is not None
+
+        if self.__returncode == 0:
+            return 0
+
+        is_reported = report_failure(
+            cast(str, self.__command),
+            self.__returncode,
+            self.stderr,
+            self.__ignore_stderr_regexp,
+            self.__error_logging_method,
+        )
+
+        if is_reported and check is True:
+            self.raise_for_returncode()
+
+        return self.__returncode
+
+    def __set_result(
+        self, returncode: Optional[int], stdout: Optional[bytes], stderr: Optional[bytes]
+    ) -> None:
+        self.__returncode = returncode
+        self.__stdout_bytes = stdout
+        self.__stderr_bytes = stderr
+        self.__stdout = None
+        self.__stderr = None
+
+    def __decode(self, data: bytes) -> str:
+        return decode_output(data, self.__output_encoding, self.__output_errors)
@@ -0,0 +1,164 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import threading
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+
+T = TypeVar("T")
+
+
+class CoalesceInfo(NamedTuple):
+    executions: int
+    saved_spawns: int
+    in_flight: int
+
+
+class _Call(Generic[T]):
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    Execute a function at most once at a time for each key: concurrent calls with
+    the same key wait for the in-flight call, and share its result or exception.
+
+    .. py:attribute:: executions
+
+        Number of the calls that executed the function.
+
+    .. py:attribute:: shared
+
+        Number of the calls that shared the result of another call.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__calls: Dict[Hashable, _Call[T]] = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Return ``(result, shared)``. ``shared`` is ``True`` if the result was produced by
+        a call of another thread.
+        """
+
+        with self.__lock:
+            call = self.__calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self.__calls[key] = call
+                self.executions += 1
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return (call.result, True)  # type: ignore
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+        return (call.result, False)
+
+    def in_flight(self) -> int:
+        with self.__lock:
+            return len(self.__calls)
+
+    def __repr__(self) -> str:
+        return f"SingleFlight(in_flight={self.in_flight()})"
+
+
+class AsyncSingleFlight(Generic[T]):
+    """
+    Coroutine version of :py:class:`SingleFlight`. Calls are shared within an event loop.
+    If the in-flight call is cancelled, one of the waiting calls executes the function instead.
+    """
+
+    def __init__(self) -> None:
+        self.__calls: Dict[Tuple[int, Hashable], "asyncio.Future[T]"] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        loop = asyncio.get_event_loop()
+        call_key = (id(loop), key)
+
+        while True:
+            future = self.__calls.get(call_key)
+            if future is None:
+                break
+
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # the in-flight call was cancelled: take over the execution
+                    continue
+                raise
+            except BaseException:
+                self.shared += 1
+                raise
+
+            self.shared += 1
+
+            return (result, True)
+
+        future = loop.create_future()
+        self.__calls[call_key] = future
+        self.executions += 1
+
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark the exception as retrieved to avoid warnings if no one waits for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self.__calls[call_key]
+
+        return (result, False)
+
+    def in_flight(self) -> int:
+        return len(self.__calls)
+
+    def __repr__(self) -> str:
+        return f"AsyncSingleFlight(in_flight={self.in_flight()})"
@@ -0,0 +1,287 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import errno
+import functools
+import os
+import re
+import shlex
+import threading
+import time
+from typing import Dict, List, Mapping, NamedTuple, NoReturn, Optional, Tuple
+
+from .error import SpawnLimitError
+from .typing import Command
+
+
+# commands that execute the following arguments as a command
+_WRAPPER_COMMANDS = frozenset(["command", "env", "exec", "nohup"])
+_ASSIGNMENT_REGEXP = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+
+class SpawnLimiterInfo(NamedTuple):
+    in_flight: int
+    queued: int
+    admitted: int
+    rejected: int
+
+
+class SpawnLimiter:
+    """
+    Admission control of process creation: limit the number of running processes
+    and the spawn rate. A spawn waits for admission, and the slot is released when
+    the process is reaped.
+
+    :param max_concurrency: Maximum number of processes running at the same time.
+    :param rate: Maximum number of spawns per second.
+    :param burst: Number of spawns allowed in a burst within ``rate``. Defaults to ``rate``.
+    :param command_limits:
+        Maximum number of running processes for each command name
+        (the base name of the executable). e.g. ``{"ip": 4}``
+        For shell command strings, the name is taken from the first simple command
+        after variable assignments and ``exec``/``command``/``env``/``nohup``.
+        Commands in pipelines, lists, or subshells of the string are not counted:
+        pass argument lists to limit them reliably.
+    :param timeout:
+        Seconds to wait for admission. Waits without limit if ``None``, and fails immediately
+        if ``0``. :py:class:`SpawnLimitError` is raised when the admission was not granted.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        command_limits: Optional[Mapping[str, int]] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        if max_concurrency is not None and max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than zero")
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be greater than zero")
+        if burst is not None and burst <= 0:
+            raise ValueError("burst must be greater than zero")
+        if command_limits and any(limit <= 0 for limit in command_limits.values()):
+            raise ValueError("command limits must be greater than zero")
+        if timeout is not None and timeout < 0:
+            raise ValueError("timeout must be greater than or equal to zero")
+
+        self.__max_concurrency = max_concurrency
+        self.__rate = rate
+        self.__burst = float(burst if burst is not None else max(1.0, rate or 1.0))
+        self.__command_limits = dict(command_limits or {})
+        self.__timeout = timeout
+
+        self.__cond = threading.Condition()
+        self.__tokens = self.__burst
+        self.__refilled_at = time.monotonic()
+        self.__in_flight = 0
+        self.__command_in_flight: Dict[str, int] = {}
+        self.__queued = 0
+        self.__admitted = 0
+        self.__rejected = 0
+        # futures of coroutines waiting for a release, with their event loops
+        self.__async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def __repr__(self) -> str:
+        info = self.limiter_info()
+
+        return "SpawnLimiter(max_concurrency={}, rate={}, in_flight={}, queued={})".format(
+            self.__max_concurrency, self.__rate, info.in_flight, info.queued
+        )
+
+    @property
+    def max_concurrency(self) -> Optional[int]:
+        return self.__max_concurrency
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.__rate
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self.__timeout
+
+    def limiter_info(self) -> SpawnLimiterInfo:
+        with self.__cond:
+            return SpawnLimiterInfo(
+                in_flight=self.__in_flight,
+                queued=self.__queued,
+                admitted=self.__admitted,
+                rejected=self.__rejected,
+            )
+
+    def in_flight(self, name: str) -> int:
+        """
+        Number of the running processes of a command name.
+        """
+
+        with self.__cond:
+            return self.__command_in_flight.get(name, 0)
+
+    def acquire(self, name: str = "", timeout: Optional[float] = None) -> None:
+        """
+        Wait for admission to spawn a process of the command ``name``.
+        ``timeout`` overrides the ``timeout`` of the constructor.
+        Raises :py:class:`SpawnLimitError` if the admission was not granted within the timeout.
+        """
+
+        timeout = self.__timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.__cond:
+            self.__queued += 1
+            try:
+                while True:
+                    wait_time = self.__try_admit(name)
+                    if wait_time is None:
+                        return
+
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.__reject(name, timeout)
+                        wait_time = remaining if wait_time < 0 else min(wait_time, remaining)
+
+                    self.__cond.wait(None if wait_time < 0 else wait_time)
+            finally:
+                self.__queued -= 1
+
+    async def aacquire(self, name: str = "", timeout: Optional[float] = None) -> None:
+        """
+        Coroutine version of :py:meth:`.acquire` that does not block the event loop.
+        """
+
+        timeout = self.__timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        loop = asyncio.get_running_loop()
+
+        with self.__cond:
+            self.__queued += 1
+        try:
+            while True:
+                with self.__cond:
+                    wait_time = self.__try_admit(name)
+                    if wait_time is None:
+                        return
+
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.__reject(name, timeout)
+                        wait_time = remaining if wait_time < 0 else min(wait_time, remaining)
+
+                    # woken up by release() that may be called from other threads
+                    waiter = (loop, loop.create_future())
+                    self.__async_waiters.append(waiter)
+
+                try:
+                    await asyncio.wait([waiter[1]], timeout=None if wait_time < 0 else wait_time)
+                finally:
+                    with self.__cond:
+                        if waiter in self.__async_waiters:
+                            self.__async_waiters.remove(waiter)
+        finally:
+            with self.__cond:
+                self.__queued -= 1
+
+    def release(self, name: str = "") -> None:
+        with self.__cond:
+            self.__in_flight -= 1
+
+            count = self.__command_in_flight.get(name, 0) - 1
+            if count > 0:
+                self.__command_in_flight[name] = count
+            else:
+                self.__command_in_flight.pop(name, None)
+
+            self.__cond.notify_all()
+            async_waiters, self.__async_waiters = self.__async_waiters, []
+
+        for loop, future in async_waiters:
+            try:
+                loop.call_soon_threadsafe(_set_done, future)
+            except RuntimeError:
+                # the event loop is closed
+                pass
+
+    def __try_admit(self, name: str) -> Optional[float]:
+        """
+        Admit a spawn if possible. Otherwise, return seconds to wait for a rate token,
+        or a negative value to wait for a release.
+        """
+
+        if self.__max_concurrency is not None and self.__in_flight >= self.__max_concurrency:
+            return -1
+
+        limit = self.__command_limits.get(name)
+        if limit is not None and self.__command_in_flight.get(name, 0) >= limit:
+            return -1
+
+        if self.__rate is not None:
+            now = time.monotonic()
+            self.__tokens = min(
+                self.__burst, self.__tokens + (now - self.__refilled_at) * self.__rate
+            )
+            self.__refilled_at = now
+
+            if self.__tokens < 1:
+                return (1 - self.__tokens) / self.__rate
+
+            self.__tokens -= 1
+
+        self.__in_flight += 1
+        self.__command_in_flight[name] = self.__command_in_flight.get(name, 0) + 1
+        self.__admitted += 1
+
+        return None
+
+    def __reject(self, name: str, timeout: Optional[float]) -> NoReturn:
+        self.__rejected += 1
+
+        raise SpawnLimitError(
+            f"spawn is not admitted within {timeout} seconds", cmd=name, errno=errno.EAGAIN
+        )
+
+
+def _set_done(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def get_command_name(command: Command) -> str:
+    """
+    Return the name of a command for :py:class:`SpawnLimiter` (the base name of the executable).
+    """
+
+    if isinstance(command, str):
+        return _get_shell_command_name(command)
+
+    return os.path.basename(command[0])
+
+
+@functools.lru_cache(maxsize=256)
+def _get_shell_command_name(command: str) -> str:
+    try:
+        words = shlex.split(command)
+    except ValueError:
+        words = command.split()
+
+    is_wrapped = False
+    for word in words:
+        word = word.lstrip("(")
+        if not word or _ASSIGNMENT_REGEXP.match(word):
+            continue
+        if is_wrapped and word.startswith("-"):
+            # options of the wrapper command
+            continue
+        if word in _WRAPPER_COMMANDS:
+            is_wrapped = True
+            continue
+
+        return os.path.basename(word)
+
+    return ""
@@ -0,0 +1,458 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import io
+import os
+import platform
+import select
+import selectors
+import signal
+import subprocess
+import time
+from typing import (
+    IO,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .capture import CaptureBuffer
+
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+_READ_SIZE = 32 * 1024
+_PIPE_BUF = getattr(select, "PIPE_BUF", 512)
+_DRAIN_TIMEOUT = 1.0
+_POLL_INTERVAL = 0.05
+
+
+class LineSplitter:
+    """
+    Split incrementally fed byte chunks into lines without the line terminators.
+    """
+
+    def __init__(self) -> None:
+        self.__pending = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        lines = (self.__pending + chunk).split(b"\n")
+        self.__pending = lines.pop()
+
+        return [line[:-1] if line.endswith(b"\r") else line for line in lines]
+
+    def flush(self) -> Optional[bytes]:
+        pending = self.__pending
+        self.__pending = b""
+
+        return pending if pending else None
+
+
+class OutputWriter:
+    """
+    Write the chunks of an output stream to ``buffer``, and pass each line
+    (without the line terminator) to ``on_line``.
+    """
+
+    def __init__(
+        self, buffer: Optional[CaptureBuffer], on_line: Optional[Callable[[bytes], None]]
+    ) -> None:
+        self.__buffer = buffer
+        self.__on_line = on_line
+        self.__splitter = LineSplitter()
+
+    def write(self, chunk: bytes) -> None:
+        if self.__buffer is not None:
+            self.__buffer.write(chunk)
+
+        if self.__on_line is None:
+            return
+
+        for line in self.__splitter.feed(chunk):
+            self.__on_line(line)
+
+    def flush(self) -> None:
+        """
+        Pass the last line that is not terminated to ``on_line``.
+        """
+
+        rest = self.__splitter.flush()
+        if rest is not None and self.__on_line is not None:
+            self.__on_line(rest)
+
+
+def iter_output(
+    proc: subprocess.Popen,
+    input: Union[bytes, Iterator[bytes], None] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Write ``input`` to the stdin of ``proc`` and yield ``(stream name, chunk)`` tuples
+    as the data is read from the stdout/stderr pipes until both of them reached EOF.
+
+    Raises :py:class:`subprocess.TimeoutExpired` if the pipes are not closed within
+    ``timeout`` seconds. This does not kill the process.
+    """
+
+    return iter_streams(  # type: ignore
+        proc.args,
+        stdin=proc.stdin,
+        readers=[(proc.stdout, STDOUT), (proc.stderr, STDERR)],
+        input=input,
+        timeout=timeout,
+    )
+
+
+def iter_streams(
+    cmd: Any,
+    stdin: Optional[IO[bytes]],
+    readers: Sequence[Tuple[Optional[IO[bytes]], Hashable]],
+    input: Union[bytes, Iterator[bytes], None] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[Hashable, bytes]]:
+    """
+    Write ``input`` (the whole data or an iterator of chunks) to ``stdin``,
+    and yield ``(key, chunk)`` tuples as the data is read from the ``(stream, key)`` pairs
+    of ``readers`` until all of the streams reached EOF.
+    ``stdin`` and the streams are closed when they are done.
+
+    Raises :py:class:`subprocess.TimeoutExpired` for ``cmd`` if the streams are not closed
+    within ``timeout`` seconds.
+    Chunks of the iterator are fetched as the pipe becomes writable,
+    so that only a chunk is held in memory at a time.
+    """
+
+    if platform.system() == "Windows":
+        raise NotImplementedError("reading pipes incrementally is not supported on Windows")
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    chunks = iter([input]) if isinstance(input, bytes) else input
+    input_view = _next_chunk(chunks)
+
+    with selectors.DefaultSelector() as selector:
+        if stdin:
+            if input_view:
+                selector.register(stdin, selectors.EVENT_WRITE)
+            else:
+                stdin.close()
+        for stream, key in readers:
+            if stream and not stream.closed:
+                selector.register(stream, selectors.EVENT_READ, key)
+
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(cmd, timeout)  # type: ignore
+
+            for key, _events in selector.select(remaining):
+                if key.fileobj is stdin:
+                    try:
+                        input_view = input_view[os.write(key.fd, input_view[:_PIPE_BUF]) :]
+                        if not input_view:
+                            input_view = _next_chunk(chunks)
+                    except BrokenPipeError:
+                        # the process exited without reading the rest of the input
+                        input_view = memoryview(b"")
+
+                    if not input_view:
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()  # type: ignore
+                    continue
+
+                data = os.read(key.fd, _READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()  # type: ignore
+                    continue
+
+                yield key.data, data
+
+
+def _next_chunk(chunks: Optional[Iterator[bytes]]) -> memoryview:
+    if chunks is not None:
+        for chunk in chunks:
+            if chunk:
+                return memoryview(chunk)
+
+    return memoryview(b"")
+
+
+def get_input_fd(input: Any) -> Optional[int]:
+    """
+    Return the file descriptor of ``input`` if ``input`` is a file descriptor or
+    an unbuffered binary file object (:py:class:`io.FileIO`). Otherwise, ``None``.
+
+    Buffered and text file objects are not passed as file descriptors:
+    the data that is read ahead into the buffer of the file object, and the position of
+    the text wrapper, are not reflected in the file descriptor.
+    """
+
+    if isinstance(input, bool):
+        return None
+
+    if isinstance(input, int):
+        return input
+
+    if isinstance(input, io.FileIO) and not input.closed:
+        return input.fileno()
+
+    return None
+
+
+def iter_input_chunks(input: Any, encoding: str) -> Iterator[bytes]:
+    """
+    Yield byte chunks of ``input``: a file object (that is read by chunks)
+    or an iterable of ``str``/``bytes`` chunks. ``str`` chunks are encoded with ``encoding``,
+    or with the encoding of the text file object.
+    """
+
+    if hasattr(input, "read"):
+        encoding = getattr(input, "encoding", None) or encoding
+        # read until an empty str/bytes (depending on the mode of the file object) is returned
+        chunks: Iterator[Union[str, bytes]] = iter(lambda: input.read(_READ_SIZE), input.read(0))
+    else:
+        chunks = iter(input)
+
+    for chunk in chunks:
+        yield chunk.encode(encoding) if isinstance(chunk, str) else chunk
+
+
+def is_one_shot_input(input: Any) -> bool:
+    """
+    Return ``True`` if ``input`` is consumed by an execution:
+    a file descriptor, a file object, or an iterator.
+    """
+
+    if input is None or isinstance(input, (str, bytes)):
+        return False
+
+    if get_input_fd(input) is not None or hasattr(input, "read"):
+        return True
+
+    return iter(input) is input
+
+
+def split_input(
+    input: Any, encoding: str
+) -> Tuple[Optional[int], Union[bytes, Iterator[bytes], None]]:
+    """
+    Return ``(file descriptor, data)`` of an input of a command.
+    A file descriptor (or an unbuffered binary file object) is passed to the process
+    as the stdin as it is. ``str``/``bytes`` are written to the stdin pipe as a whole,
+    and the other file objects and iterables are written chunk by chunk.
+    """
+
+    fd = get_input_fd(input)
+    if fd is not None:
+        return (fd, None)
+
+    if input is None or isinstance(input, bytes):
+        return (None, input)
+
+    if isinstance(input, str):
+        return (None, input.encode(encoding))
+
+    return (None, iter_input_chunks(input, encoding))
+
+
+def close_process(proc: subprocess.Popen, kill_group: bool = False) -> None:
+    """
+    Kill ``proc`` if it is still running, then close the pipes and reap the process.
+    The whole process group of ``proc`` is killed if ``kill_group`` is ``True``.
+    """
+
+    if kill_group:
+        send_signal(proc, signal.SIGKILL, kill_group=True)
+    elif proc.poll() is None:
+        proc.kill()
+
+    for stream in (proc.stdin, proc.stdout, proc.stderr):
+        if stream:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    proc.wait()
+
+
+def send_signal(proc: Any, sig: int, kill_group: bool = False) -> None:
+    """
+    Send a signal to ``proc``, or to the process group of ``proc`` if ``kill_group`` is ``True``.
+    ``proc`` is either of :py:class:`subprocess.Popen` or :py:class:`asyncio.subprocess.Process`.
+    """
+
+    try:
+        if kill_group:
+            # the process group may still have members even if the leader already exited
+            os.killpg(proc.pid, sig)
+        elif proc.returncode is None:
+            proc.send_signal(sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def terminate_process(
+    proc: subprocess.Popen, grace_period: float, kill_group: bool = False
+) -> Tuple[bytes, bytes]:
+    """
+    Terminate ``proc`` gracefully: send ``SIGTERM``, and ``SIGKILL`` if the process does not
+    exit within ``grace_period`` seconds. The signals are sent to the whole process group
+    of ``proc`` if ``kill_group`` is ``True``, and the group is killed at the end.
+    The pipes are drained while waiting for the process, then closed, and the process is reaped.
+
+    Return the stdout/stderr data that were read from the pipes.
+    """
+
+    chunks: Dict[str, List[bytes]] = {STDOUT: [], STDERR: []}
+
+    if platform.system() == "Windows":
+        proc.kill()
+        stdout, stderr = proc.communicate()
+
+        return (stdout or b"", stderr or b"")
+
+    for sig, timeout in ((signal.SIGTERM, grace_period), (signal.SIGKILL, _DRAIN_TIMEOUT)):
+        send_signal(proc, sig, kill_group=kill_group)
+
+        if _drain_until_exit(proc, chunks, time.monotonic() + timeout, kill_group):
+            break
+
+    close_process(proc, kill_group=kill_group)
+
+    return (b"".join(chunks[STDOUT]), b"".join(chunks[STDERR]))
+
+
+def _drain_until_exit(
+    proc: subprocess.Popen, chunks: Dict[str, List[bytes]], deadline: float, kill_group: bool
+) -> bool:
+    """
+    Read the pipes until the process exited and the pipes are closed.
+    Without ``kill_group``, the pipes may be kept open by processes out of the process group
+    (e.g. background processes of a shell), so that stop reading when the process exited.
+
+    Return ``True`` if the process exited before ``deadline``.
+    """
+
+    while True:
+        remaining = max(0.0, deadline - time.monotonic())
+
+        try:
+            for name, chunk in iter_output(proc, timeout=min(_POLL_INTERVAL, remaining)):
+                chunks[name].append(chunk)
+        except subprocess.TimeoutExpired:
+            if not kill_group and proc.poll() is not None:
+                return True
+            if remaining <= 0:
+                return False
+            continue
+
+        try:
+            proc.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            return False
+
+        return True
+
+
+async def aterminate_process(
+    proc: "asyncio.subprocess.Process",
+    grace_period: float,
+    writers: Dict[str, Callable[[bytes], None]],
+    kill_group: bool = False,
+) -> None:
+    """
+    Asynchronous version of :py:func:`terminate_process` for
+    :py:class:`asyncio.subprocess.Process`. The data read from the pipes are passed to
+    ``writers``.
+    """
+
+    for sig, timeout in ((signal.SIGTERM, grace_period), (signal.SIGKILL, _DRAIN_TIMEOUT)):
+        send_signal(proc, sig, kill_group=kill_group)
+
+        # see _drain_until_exit for the case of not kill_group
+        awaitables: List[Awaitable[Any]] = [proc.wait()]
+        if kill_group:
+            awaitables.extend(
+                [
+                    aread_stream(proc.stdout, writers[STDOUT]),
+                    aread_stream(proc.stderr, writers[STDERR]),
+                ]
+            )
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*awaitables), timeout)
+            break
+        except asyncio.TimeoutError:
+            continue
+
+    if kill_group:
+        send_signal(proc, signal.SIGKILL, kill_group=True)
+
+    await proc.wait()
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                aread_stream(proc.stdout, writers[STDOUT]),
+                aread_stream(proc.stderr, writers[STDERR]),
+            ),
+            _POLL_INTERVAL,
+        )
+    except asyncio.TimeoutError:
+        pass
+
+    # close the pipes that may be kept open by processes out of the process group.
+    # asyncio.subprocess.Process exposes neither the subprocess transport nor the transports
+    # of the stdout/stderr readers, so that the private attribute is the only way to close them.
+    transport = getattr(proc, "_transport", None)
+    if transport is not None:
+        transport.close()
+        return
+
+    # fallback: stop waiting for the pipes. the pipes are closed when the process object
+    # is garbage collected
+    for stream in (proc.stdout, proc.stderr):
+        if stream is not None:
+            stream.feed_eof()
+
+
+async def aread_stream(
+    stream: Optional[asyncio.StreamReader], write: Callable[[bytes], None]
+) -> None:
+    if stream is None:
+        return
+
+    while True:
+        chunk = await stream.read(_READ_SIZE)
+        if not chunk:
+            return
+
+        write(chunk)
+
+
+async def awrite_stream(
+    stream: Optional[asyncio.StreamWriter], input: Union[bytes, Iterator[bytes], None]
+) -> None:
+    if stream is None:
+        return
+
+    try:
+        for chunk in [input] if isinstance(input, bytes) else input or []:
+            if chunk:
+                stream.write(chunk)
+                await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
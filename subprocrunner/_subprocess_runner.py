@@ -2,24 +2,66 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
+import asyncio
 import errno
-import os
+import functools
 import platform
 import subprocess
+import time
 import traceback
+from contextlib import contextmanager
 from subprocess import PIPE
-from typing import Any, Dict, List, Optional, Pattern, Sequence, Union, cast
-
-from mbstrdecoder import MultiByteStrDecoder
-
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+from ._cancel_scope import CancelScope
+from ._completed_run import CompletedRun
+from ._env import get_env
+from ._history import CommandHistory, HistoryRecord
+from ._launcher import LauncherPopen
 from ._logger import DEFAULT_ERROR_LOG_LEVEL, get_logging_method
+from ._output import decode_output, report_failure, resolve_error_log_level
+from ._popen import TrackedPopen
+from ._result_cache import CachedResult, ResultCache, make_result_key
+from ._rusage import ResourceUsage
+from ._singleflight import AsyncSingleFlight, CoalesceInfo, SingleFlight
+from ._spawn_limiter import SpawnLimiter, get_command_name
+from ._stream import (
+    STDERR,
+    STDOUT,
+    LineSplitter,
+    OutputWriter,
+    aread_stream,
+    aterminate_process,
+    awrite_stream,
+    close_process,
+    is_one_shot_input,
+    iter_output,
+    split_input,
+    terminate_process,
+)
+from ._timings import ExecutionTimings
 from ._which import Which
-from .error import CalledProcessError, CommandError
+from .capture import Capture, CaptureBuffer
+from .error import CalledProcessError, CircuitOpenError, CommandError
 from .retry import Retry
-from .typing import Command
+from .typing import Command, EnvMapping, Input
 
 
-Env = Dict[str, str]
+ExecutionHook = Callable[["SubprocessRunner", ExecutionTimings], None]
 
 
 class SubprocessRunner:
@@ -29,31 +71,110 @@ class SubprocessRunner:
         Class wide dry-run setting default value.
         dry-run if ``True``.
 
+    .. py:attribute:: default_output_encoding
+
+        Class wide codec used to decode command outputs.
+        If ``None``, outputs that are not ASCII are decoded by detecting the encoding
+        with ``MultiByteStrDecoder``.
+
+    .. py:attribute:: default_output_errors
+
+        Class wide error handler used with ``default_output_encoding``.
+
+    .. py:attribute:: default_kill_grace_period
+
+        Class wide seconds to wait for a timed out command to exit after ``SIGTERM``
+        before sending ``SIGKILL``.
+
     .. py:attribute:: is_save_history
 
         Save executed command history if ``True``.
+
+    .. py:attribute:: history_size
+
+        Maximum number of history records. Older records are discarded.
+
+    .. py:attribute:: spawn_limiter
+
+        Process wide :py:class:`SpawnLimiter` that the process creations of runners pass
+        through. Processes are created without limits if ``None``.
     """
 
     _DRY_RUN_OUTPUT = ""
+    __DEFAULT_CAPTURE = Capture()
+    __ITER_LINES_STDERR_CAPTURE = Capture.tail(max_bytes=64 * 1024)
     _RETRY_ATTEMPT_KEY = "__retry_attempt__"
+    _CANCEL_SCOPE_KEY = "__cancel_scope__"
 
     default_error_log_level = DEFAULT_ERROR_LOG_LEVEL
     default_is_dry_run = False
+    default_output_encoding: Optional[str] = None
+    default_output_errors = "replace"
+    default_kill_grace_period = 1.0
 
     is_output_stacktrace = False
 
     is_save_history = False
     history_size = 512
 
-    __command_history: List[Command] = []
+    spawn_limiter: Optional[SpawnLimiter] = None
+
+    __command_history = CommandHistory(maxlen=history_size)
+    __single_flight: SingleFlight[CachedResult] = SingleFlight()
+    __async_single_flight: AsyncSingleFlight[CachedResult] = AsyncSingleFlight()
+    __execution_hooks: List[ExecutionHook] = []
+
+    @classmethod
+    def add_execution_hook(cls, hook: ExecutionHook) -> None:
+        """
+        Register a callable that is called with ``(runner, timings)`` when each
+        :py:meth:`.run`/:py:meth:`.arun` call completed (including failures).
+        Exceptions raised by hooks are logged and ignored.
+        """
+
+        cls.__execution_hooks.append(hook)
+
+    @classmethod
+    def remove_execution_hook(cls, hook: ExecutionHook) -> None:
+        cls.__execution_hooks.remove(hook)
+
+    @classmethod
+    def get_history(cls) -> List[str]:
+        return [record.command for record in cls.__command_history.records()]
 
     @classmethod
-    def get_history(cls) -> List[Command]:
-        return cls.__command_history
+    def get_history_records(cls) -> List[HistoryRecord]:
+        return cls.__command_history.records()
+
+    @classmethod
+    def get_slowest_history(cls, n: int) -> List[HistoryRecord]:
+        return cls.__command_history.slowest(n)
+
+    @classmethod
+    def get_failed_history(cls) -> List[HistoryRecord]:
+        return cls.__command_history.failures()
+
+    @classmethod
+    def find_history(cls, prefix: str) -> List[HistoryRecord]:
+        return cls.__command_history.find(prefix)
 
     @classmethod
     def clear_history(cls) -> None:
-        cls.__command_history = []
+        cls.__command_history.clear()
+
+    @classmethod
+    def coalesce_info(cls) -> CoalesceInfo:
+        """
+        Statistics of the runners with ``coalesce=True``:
+        the number of executions, the number of calls that shared an in-flight execution
+        instead of spawning processes, and the number of in-flight executions.
+        """
+
+        return CoalesceInfo(
+            executions=cls.__single_flight.executions + cls.__async_single_flight.executions,
+            saved_spawns=cls.__single_flight.shared + cls.__async_single_flight.shared,
+            in_flight=cls.__single_flight.in_flight() + cls.__async_single_flight.in_flight(),
+        )
 
     def __init__(
         self,
@@ -62,6 +183,16 @@ class SubprocessRunner:
         ignore_stderr_regexp: Optional[Pattern] = None,
         dry_run: Optional[bool] = None,
         quiet: bool = False,
+        output_encoding: Optional[str] = None,
+        output_errors: Optional[str] = None,
+        raw: bool = False,
+        use_abspath: bool = False,
+        fast_spawn: bool = False,
+        use_launcher: bool = False,
+        start_new_session: bool = False,
+        kill_grace_period: Optional[float] = None,
+        result_cache: Optional[ResultCache] = None,
+        coalesce: bool = False,
     ) -> None:
         self.__command: Union[str, Sequence[str]] = []
 
@@ -75,23 +206,44 @@ class SubprocessRunner:
             self.__is_shell = True
             self.__command = command
 
+        self.__exec_command = self.__command
+        self.__command_str: Optional[str] = None
+        self.__is_resolved = False
+        self.__use_abspath = use_abspath
+        self.__fast_spawn = fast_spawn
+        self.__use_launcher = use_launcher
+        self.__start_new_session = start_new_session
+        self.__result_cache = result_cache
+        self.__coalesce = coalesce
+        self.__kill_grace_period = (
+            kill_grace_period if kill_grace_period is not None else self.default_kill_grace_period
+        )
+
         if dry_run is not None:
             self.__dry_run = dry_run
         else:
             self.__dry_run = self.default_is_dry_run
         self.__stdout: Optional[str] = None
         self.__stderr: Optional[str] = None
+        self.__stdout_bytes: Optional[bytes] = None
+        self.__stderr_bytes: Optional[bytes] = None
         self.__returncode: Optional[int] = None
+        self.__timings = ExecutionTimings()
+        self.__rusage: Optional[ResourceUsage] = None
 
         self.__ignore_stderr_regexp = ignore_stderr_regexp
+        self.__output_encoding = (
+            output_encoding if output_encoding is not None else self.default_output_encoding
+        )
+        self.__output_errors = (
+            output_errors if output_errors is not None else self.default_output_errors
+        )
+        self.__raw = raw
         self.__debug_logging_method = get_logging_method("QUIET" if quiet else "DEBUG")
 
-        if quiet:
-            self.error_log_level = "QUIET"
-        elif error_log_level is not None:
-            self.error_log_level = error_log_level
-        else:
-            self.error_log_level = self.default_error_log_level
+        self.error_log_level = resolve_error_log_level(
+            error_log_level, quiet, self.default_error_log_level
+        )
 
         self.__quiet = quiet
 
@@ -120,16 +272,128 @@ class SubprocessRunner:
         if self.__is_shell:
             return cast(str, self.__command)
 
-        return " ".join(self.__command)
+        if self.__command_str is None:
+            self.__command_str = " ".join(self.__command)
+
+        return self.__command_str
 
     @property
     def stdout(self) -> Optional[str]:
+        if self.__stdout is None and self.__stdout_bytes is not None:
+            started = time.perf_counter()
+            self.__stdout = self.__decode(self.__stdout_bytes)
+            self.__timings.decode += time.perf_counter() - started
+
         return self.__stdout
 
     @property
     def stderr(self) -> Optional[str]:
+        if self.__stderr is None and self.__stderr_bytes is not None:
+            started = time.perf_counter()
+            self.__stderr = self.__decode(self.__stderr_bytes)
+            self.__timings.decode += time.perf_counter() - started
+
         return self.__stderr
 
+    @property
+    def stdout_bytes(self) -> Optional[bytes]:
+        return self.__stdout_bytes
+
+    @property
+    def stderr_bytes(self) -> Optional[bytes]:
+        return self.__stderr_bytes
+
+    @property
+    def timings(self) -> ExecutionTimings:
+        """
+        Timing breakdown of the last :py:meth:`.run`/:py:meth:`.arun` call.
+        """
+
+        return self.__timings
+
+    @property
+    def rusage(self) -> Optional[ResourceUsage]:
+        """
+        Resource usage of the processes executed by the last :py:meth:`.run` call,
+        summed up over retry attempts. ``None`` if not available
+        (Windows, :py:meth:`.arun`, or dry-run).
+        """
+
+        return self.__rusage
+
+    @property
+    def output_encoding(self) -> Optional[str]:
+        return self.__output_encoding
+
+    @property
+    def raw(self) -> bool:
+        return self.__raw
+
+    @property
+    def fast_spawn(self) -> bool:
+        """
+        If ``True``, launch commands with settings that allow ``subprocess`` to use
+        ``posix_spawn``/``vfork`` instead of ``fork``, which is much faster for parent
+        processes with large memory usage: list commands are executed with the resolved
+        absolute path, file descriptors are not closed in the child (file descriptors
+        created by Python are not inheritable), and stdin pipe is not created when
+        no ``input``.
+        """
+
+        return self.__fast_spawn
+
+    @property
+    def use_launcher(self) -> bool:
+        """
+        If ``True``, delegate the process creation to a launcher: a small helper process
+        that is started at the first use and shared by runners. The spawn cost does not depend on
+        the memory usage of the caller process. Processes are created in the caller
+        process if the launcher is not available (e.g. Windows).
+        Not applied to :py:meth:`arun`.
+        """
+
+        return self.__use_launcher
+
+    @property
+    def start_new_session(self) -> bool:
+        """
+        If ``True``, commands are executed in a new session (POSIX only).
+        When a command timed out, the signals are sent to the whole process group,
+        so that the processes started by the command (e.g. by a shell) are terminated as well.
+        """
+
+        return self.__start_new_session
+
+    @property
+    def kill_grace_period(self) -> float:
+        return self.__kill_grace_period
+
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        """
+        :py:class:`ResultCache` to reuse the results of :py:meth:`.run`.
+        Executions with ``on_stdout_line``/``on_stderr_line``, ``buffer_output=False``,
+        or captures are not cached.
+        """
+
+        return self.__result_cache
+
+    @property
+    def coalesce(self) -> bool:
+        """
+        If ``True``, concurrent :py:meth:`.run`/:py:meth:`.arun` calls of runners that execute
+        an identical command (with the same environment variables, input, and working directory)
+        share a single in-flight execution instead of spawning processes for each call.
+        Shared calls receive the result of the in-flight execution, which is executed with its
+        ``timeout`` and ``retry``. The same conditions as :py:attr:`.result_cache` are applied.
+        """
+
+        return self.__coalesce
+
+    @property
+    def __popen_class(self) -> Callable[..., Any]:
+        return LauncherPopen if self.__use_launcher else TrackedPopen
+
     @property
     def returncode(self) -> Optional[int]:
         return self.__returncode
@@ -144,162 +408,999 @@ class SubprocessRunner:
 
     def _run(
         self,
-        env: Optional[Env],
+        env: Optional[EnvMapping],
         check: bool,
-        input: Union[str, bytes, None] = None,
+        input: Input = None,
         encoding: str = "ascii",
         timeout: Optional[float] = None,
         **kwargs: Any,
     ) -> int:
-        self.__save_command()
-        self.__debug_print_command(retry_attept=kwargs.get(self._RETRY_ATTEMPT_KEY))
+        retry_attempt = kwargs.pop(self._RETRY_ATTEMPT_KEY, None)
+        self.__debug_print_command(retry_attept=retry_attempt)
+        self.__returncode = None
 
-        if self._RETRY_ATTEMPT_KEY in kwargs:
-            kwargs.pop(self._RETRY_ATTEMPT_KEY)
+        with self.__save_history(retry_attempt):
+            return self.__execute(
+                env=env, check=check, input=input, encoding=encoding, timeout=timeout, **kwargs
+            )
 
+    def __execute(
+        self,
+        env: Optional[EnvMapping],
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        **kwargs: Any,
+    ) -> int:
+        on_stdout_line = kwargs.pop("on_stdout_line", None)
+        on_stderr_line = kwargs.pop("on_stderr_line", None)
+        buffer_output = kwargs.pop("buffer_output", True)
+        cancel_scope: Optional[CancelScope] = kwargs.pop(self._CANCEL_SCOPE_KEY, None)
+        captures = {
+            STDOUT: kwargs.pop("stdout_capture", None) or self.__DEFAULT_CAPTURE,
+            STDERR: kwargs.pop("stderr_capture", None) or self.__DEFAULT_CAPTURE,
+        }
+        streams = {name: capture.open_stream() for name, capture in captures.items()}
+        input_fd, input_data = split_input(input, encoding)
+
+        try:
+            with self.__spawn_slot() as on_exit:
+                spawn_started = time.perf_counter()
+                try:
+                    proc = self.__popen_class(
+                        self.__exec_command,
+                        shell=self.__is_shell,
+                        env=env,
+                        stdin=self.__get_stdin(input_fd, input_data),
+                        stdout=streams[STDOUT],
+                        stderr=streams[STDERR],
+                        close_fds=not self.__fast_spawn,
+                        start_new_session=self.__start_new_session,
+                        on_exit=on_exit,
+                    )
+                except TypeError:
+                    proc = self.__popen_class(
+                        self.__exec_command,
+                        shell=self.__is_shell,
+                        stdin=self.__get_stdin(input_fd, input_data),
+                        stdout=streams[STDOUT],
+                        stderr=streams[STDERR],
+                        close_fds=not self.__fast_spawn,
+                        start_new_session=self.__start_new_session,
+                        on_exit=on_exit,
+                    )
+        finally:
+            self.__close_capture_streams(captures, streams)
+
+        io_started = time.perf_counter()
+        self.__timings.spawn += io_started - spawn_started
+        self.__timings.attempts += 1
+
+        if cancel_scope is not None:
+            cancel_scope.add(proc, kill_group=self.__start_new_session)
         try:
-            proc = subprocess.Popen(
-                self.command,
-                shell=self.__is_shell,
-                env=env,
-                stdin=PIPE,
-                stdout=PIPE,
-                stderr=PIPE,
+            if (
+                on_stdout_line
+                or on_stderr_line
+                or not buffer_output
+                or any(capture.is_bounded for capture in captures.values())
+                or not isinstance(input_data, (bytes, type(None)))
+            ):
+                stdout, stderr = self.__read_output(
+                    proc,
+                    input=input_data,
+                    timeout=timeout,
+                    callbacks={STDOUT: on_stdout_line, STDERR: on_stderr_line},
+                    buffers={
+                        name: capture.make_buffer() if buffer_output else None
+                        for name, capture in captures.items()
+                    },
+                )
+            else:
+                try:
+                    stdout, stderr = proc.communicate(input=input_data, timeout=timeout)  # type: ignore
+                except subprocess.TimeoutExpired as e:
+                    self.__raise_timeout(proc, timeout, e.output, e.stderr)
+        finally:
+            if cancel_scope is not None:
+                cancel_scope.discard(proc)
+
+        self.__returncode = proc.returncode
+        self.__record_process_stats(proc, io_started)
+
+        self.__set_output(stdout, stderr)
+
+        return self.__handle_returncode(check)
+
+    @staticmethod
+    def __close_capture_streams(
+        captures: Dict[str, Capture], streams: Dict[str, Union[int, IO[Any]]]
+    ) -> None:
+        # files opened from the paths are inherited by the process
+        for name, capture in captures.items():
+            if capture.mode == Capture.FILE and isinstance(capture.target, str):
+                streams[name].close()  # type: ignore
+
+    def __read_output(
+        self,
+        proc: subprocess.Popen,
+        input: Union[bytes, Iterator[bytes], None],
+        timeout: Optional[float],
+        callbacks: Dict[str, Optional[Callable[[str], None]]],
+        buffers: Dict[str, Optional[CaptureBuffer]],
+    ) -> Tuple[Optional[bytes], Optional[bytes]]:
+        writers = self.__make_output_writers(callbacks, buffers)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        try:
+            for name, chunk in iter_output(proc, input=input, timeout=timeout):
+                writers[name].write(chunk)
+
+            for writer in writers.values():
+                writer.flush()
+
+            # the process may keep running after closing the pipes
+            proc.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            self.__raise_timeout(
+                proc,
+                timeout,
+                *(
+                    None if buffer is None else buffer.getvalue()
+                    for buffer in (buffers[STDOUT], buffers[STDERR])
+                ),
+            )
+        except BaseException:
+            close_process(proc, kill_group=self.__start_new_session)
+            raise
+
+        stdout_buffer = buffers[STDOUT] if proc.stdout else None
+        stderr_buffer = buffers[STDERR] if proc.stderr else None
+
+        return (
+            None if stdout_buffer is None else stdout_buffer.getvalue(),
+            None if stderr_buffer is None else stderr_buffer.getvalue(),
+        )
+
+    def __make_output_writers(
+        self,
+        callbacks: Dict[str, Optional[Callable[[str], None]]],
+        buffers: Dict[str, Optional[CaptureBuffer]],
+    ) -> Dict[str, OutputWriter]:
+        def decode_to(
+            callback: Optional[Callable[[str], None]],
+        ) -> Optional[Callable[[bytes], None]]:
+            if callback is None:
+                return None
+
+            return lambda line: callback(self.__decode(line))  # type: ignore
+
+        return {
+            name: OutputWriter(buffers[name], decode_to(callbacks[name]))
+            for name in (STDOUT, STDERR)
+        }
+
+    async def _arun(
+        self,
+        env: Optional[EnvMapping],
+        check: bool,
+        input: Input = None,
+        encoding: str = "ascii",
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> int:
+        retry_attempt = kwargs.pop(self._RETRY_ATTEMPT_KEY, None)
+        self.__debug_print_command(retry_attept=retry_attempt)
+        self.__returncode = None
+
+        with self.__save_history(retry_attempt):
+            release = await self.__aacquire_spawn_slot()
+            try:
+                return await self.__aexecute(
+                    env=env, check=check, input=input, encoding=encoding, timeout=timeout, **kwargs
+                )
+            finally:
+                if release is not None:
+                    release()
+
+    async def __aexecute(
+        self,
+        env: Optional[EnvMapping],
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        **kwargs: Any,
+    ) -> int:
+        callbacks = {
+            STDOUT: kwargs.pop("on_stdout_line", None),
+            STDERR: kwargs.pop("on_stderr_line", None),
+        }
+        buffer_output = kwargs.pop("buffer_output", True)
+        captures = {
+            STDOUT: kwargs.pop("stdout_capture", None) or self.__DEFAULT_CAPTURE,
+            STDERR: kwargs.pop("stderr_capture", None) or self.__DEFAULT_CAPTURE,
+        }
+        streams = {name: capture.open_stream() for name, capture in captures.items()}
+        input_fd, input_data = split_input(input, encoding)
+        stdin = input_fd if input_fd is not None else PIPE
+
+        try:
+            spawn_started = time.perf_counter()
+            if self.__is_shell:
+                proc = await asyncio.create_subprocess_shell(
+                    cast(str, self.command),
+                    env=env,
+                    stdin=stdin,
+                    stdout=streams[STDOUT],
+                    stderr=streams[STDERR],
+                    start_new_session=self.__start_new_session,
+                )
+            else:
+                proc = await asyncio.create_subprocess_exec(
+                    *self.__exec_command,
+                    env=env,
+                    stdin=stdin,
+                    stdout=streams[STDOUT],
+                    stderr=streams[STDERR],
+                    start_new_session=self.__start_new_session,
+                )
+        finally:
+            self.__close_capture_streams(captures, streams)
+
+        io_started = time.perf_counter()
+        self.__timings.spawn += io_started - spawn_started
+        self.__timings.attempts += 1
+
+        buffers = {
+            name: capture.make_buffer() if buffer_output else None
+            for name, capture in captures.items()
+        }
+        output_writers = self.__make_output_writers(callbacks, buffers)
+        writers: Dict[str, Callable[[bytes], None]] = {
+            name: writer.write for name, writer in output_writers.items()
+        }
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    awrite_stream(proc.stdin, input_data),
+                    aread_stream(proc.stdout, writers[STDOUT]),
+                    aread_stream(proc.stderr, writers[STDERR]),
+                    proc.wait(),
+                ),
+                timeout,
             )
-        except TypeError:
-            proc = subprocess.Popen(
-                self.command,
-                shell=self.__is_shell,
-                stdin=PIPE,
-                stdout=PIPE,
-                stderr=PIPE,
+        except asyncio.TimeoutError:
+            await aterminate_process(
+                proc,
+                grace_period=self.__kill_grace_period,
+                writers=writers,
+                kill_group=self.__start_new_session,
             )
+            partial_stdout, partial_stderr = (
+                b"" if buffer is None else buffer.getvalue() for buffer in buffers.values()
+            )
+            raise subprocess.TimeoutExpired(
+                cmd=self.command_str,
+                timeout=cast(float, timeout),
+                output=partial_stdout,
+                stderr=partial_stderr,
+            )
+        except BaseException:
+            # e.g. the task was cancelled: do not leave the process running
+            await aterminate_process(
+                proc,
+                grace_period=self.__kill_grace_period,
+                writers=writers,
+                kill_group=self.__start_new_session,
+            )
+            raise
+
+        for writer in output_writers.values():
+            writer.flush()
+        stdout_buffer = buffers[STDOUT] if proc.stdout else None
+        stderr_buffer = buffers[STDERR] if proc.stderr else None
+        stdout = None if stdout_buffer is None else stdout_buffer.getvalue()
+        stderr = None if stderr_buffer is None else stderr_buffer.getvalue()
 
-        if input and isinstance(input, str) and encoding:
-            input = input.encode(encoding)
-        stdout, stderr = proc.communicate(input=input, timeout=timeout)  # type: ignore
         self.__returncode = proc.returncode
+        self.__timings.read += time.perf_counter() - io_started
+
+        self.__set_output(stdout, stderr)
 
-        self.__stdout = MultiByteStrDecoder(stdout).unicode_str
-        self.__stderr = MultiByteStrDecoder(stderr).unicode_str
+        return self.__handle_returncode(check)
 
+    def __raise_timeout(
+        self,
+        proc: subprocess.Popen,
+        timeout: Optional[float],
+        stdout: Optional[bytes],
+        stderr: Optional[bytes],
+    ) -> NoReturn:
+        rest_stdout, rest_stderr = terminate_process(
+            proc, grace_period=self.__kill_grace_period, kill_group=self.__start_new_session
+        )
+
+        raise subprocess.TimeoutExpired(
+            cmd=self.command_str,
+            timeout=cast(float, timeout),
+            output=(stdout or b"") + rest_stdout,
+            stderr=(stderr or b"") + rest_stderr,
+        )
+
+    def __handle_returncode(self, check: bool) -> int:
         if self.returncode == 0:
             return 0
 
+        is_reported = report_failure(
+            self.command_str,
+            self.__returncode,  # type: ignore
+            self.stderr_bytes if self.__raw else self.stderr,
+            self.__ignore_stderr_regexp,
+            self.__error_logging_method,
+        )
+
+        if is_reported and check is True:
+            self.raise_for_returncode()
+
+        return self.__returncode  # type: ignore
+
+    def run(
+        self,
+        input: Input = None,
+        encoding: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        **kwargs: Any,
+    ) -> int:
+        """
+        Execute the command and return the return code.
+
+        ``input`` is either of:
+
+        - ``str``/``bytes``: written to the stdin of the command
+        - an iterable of ``str``/``bytes`` chunks, or a file object
+          (e.g. :py:class:`io.BytesIO`, a file opened by :py:func:`open`):
+          written to the stdin chunk by chunk while reading the outputs,
+          so that only a chunk of the input is held in memory at a time.
+          File objects are read from the current position.
+        - a file descriptor, or an unbuffered binary file object
+          (``open(path, "rb", buffering=0)``): passed to the command as the stdin as it is
+
+        ``str`` inputs are encoded with ``encoding``
+        (text file objects are encoded with the encoding of the file object).
+        The results of the executions with streamed inputs are not cached/coalesced.
+        File descriptors, file objects, and iterators are consumed by an execution:
+        :py:class:`ValueError` is raised if they are given with ``retry``.
+
+        If the command does not complete within ``timeout`` seconds, the command is terminated
+        (``SIGTERM``, then ``SIGKILL`` after :py:attr:`.kill_grace_period` seconds) and
+        :py:class:`subprocess.TimeoutExpired` is raised with the partial outputs.
+
+        Keyword arguments:
+
+        - ``check``: raise :py:class:`CalledProcessError` if the command failed
+        - ``env``: environment variables for the command.
+          Defaults to the current ``os.environ`` (with ``LC_ALL=C`` on Linux).
+          Pass a shared :py:class:`Env` to reuse a prebuilt environment.
+        - ``env_overrides``: environment variables merged onto ``env``
+        - ``on_stdout_line``/``on_stderr_line``: callables invoked with each decoded line
+          (without the line terminator) while the command is running.
+          Not available on Windows.
+        - ``buffer_output``: keep the output for :py:attr:`.stdout`/:py:attr:`.stderr`
+          (defaults to ``True``). If ``False``, the output is only passed to the callbacks
+          and the properties become ``None``.
+        - ``stdout_capture``/``stderr_capture``: :py:class:`Capture` policies of the streams.
+          Streams that are discarded or written to a file become ``None``.
+        """
+
+        started = self.__start_timings()
         try:
-            if (
-                self.__ignore_stderr_regexp
-                and self.__ignore_stderr_regexp.search(self.stderr) is not None
-            ):
-                return self.__returncode
-        except AttributeError:
-            pass
+            return self.__run_with_retry(input, encoding, timeout, retry, **kwargs)
+        finally:
+            self.__finish_timings(started)
+
+    def __run_with_retry(
+        self,
+        input: Input,
+        encoding: Optional[str],
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        self.__verify_retry_input(input, retry)
+
+        env = self.__prepare(kwargs)
+        if env is None:
+            return 0
 
-        self.__error_logging_method(
-            "command='{}', returncode={}, stderr={!r}".format(
-                self.command_str, self.returncode, self.stderr
+        check = kwargs.pop("check", False)
+        encoding = "ascii" if encoding is None else encoding
+
+        if self.__is_result_shareable(input, kwargs):
+            if self.__result_cache is not None:
+                return self.__run_with_cache(
+                    self.__result_cache,
+                    env,
+                    check,
+                    cast(Union[str, bytes, None], input),
+                    encoding,
+                    timeout,
+                    retry,
+                    **kwargs,
+                )
+            if self.__coalesce:
+                return self.__run_coalesced(
+                    env,
+                    check,
+                    cast(Union[str, bytes, None], input),
+                    encoding,
+                    timeout,
+                    retry,
+                    **kwargs,
+                )
+
+        return self.__execute_with_retry(env, check, input, encoding, timeout, retry, **kwargs)
+
+    def __execute_with_retry(
+        self,
+        env: EnvMapping,
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        if retry is None:
+            return self._run(
+                env=env, check=check, input=input, encoding=encoding, timeout=timeout, **kwargs
             )
-        )
+
+        started = time.monotonic()
+        attempt = 0
+        backoff: Optional[float] = None
+
+        while True:
+            try:
+                is_trial = retry.before_attempt(self.command_str)
+            except CircuitOpenError:
+                if attempt == 0:
+                    raise
+
+                # the circuit was opened by the failures: keep the result of the last attempt
+                break
+
+            with retry.track_attempt(self.command_str, is_trial):
+                returncode = self._run(
+                    env=env, check=False, input=input, encoding=encoding, timeout=timeout, **kwargs
+                )
+                is_retryable = retry.after_attempt(
+                    self.command_str, returncode, None if returncode == 0 else self.stderr
+                )
+
+            cancel_scope = kwargs.get(self._CANCEL_SCOPE_KEY)
+            if not is_retryable or (cancel_scope is not None and cancel_scope.is_cancelled):
+                break
+
+            attempt += 1
+            backoff = retry.next_backoff(attempt, started, backoff)
+            if backoff is None:
+                break
+
+            retry.sleep_before_retry(
+                attempt=attempt,
+                logging_method=self.__debug_logging_method,
+                retry_target=self.command_str,
+                backoff=backoff,
+            )
+            kwargs[self._RETRY_ATTEMPT_KEY] = attempt
 
         if check is True:
             self.raise_for_returncode()
 
-        return self.__returncode
+        return returncode
 
-    def run(
+    def __run_with_cache(
+        self,
+        cache: ResultCache,
+        env: EnvMapping,
+        check: bool,
+        input: Union[str, bytes, None],
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        errors: List[CalledProcessError] = []
+        result, is_cached = cache.get_or_execute(
+            cache.make_key(self.__command, env, input),
+            lambda: self.__execute_for_result(
+                env, check, input, encoding, timeout, retry, errors, **kwargs
+            ),
+        )
+
+        return self.__apply_result(result, is_cached, check, errors, "cached result")
+
+    def __run_coalesced(
         self,
-        input: Union[str, bytes, None] = None,
+        env: EnvMapping,
+        check: bool,
+        input: Union[str, bytes, None],
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        errors: List[CalledProcessError] = []
+        result, is_shared = self.__single_flight.do(
+            make_result_key(self.__command, env, input),
+            lambda: self.__execute_for_result(
+                env, check, input, encoding, timeout, retry, errors, **kwargs
+            ),
+        )
+
+        return self.__apply_result(result, is_shared, check, errors, "coalesced result")
+
+    def __execute_for_result(
+        self,
+        env: EnvMapping,
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        errors: List[CalledProcessError],
+        **kwargs: Any,
+    ) -> CachedResult:
+        """
+        Execute the command in the same way as the other executions.
+        The error of ``check`` is appended to ``errors`` instead of raised,
+        so that the result is shared with the other runners.
+        """
+
+        try:
+            self.__execute_with_retry(env, check, input, encoding, timeout, retry, **kwargs)
+        except CalledProcessError as e:
+            errors.append(e)
+
+        return self.__make_result()
+
+    def __make_result(self) -> CachedResult:
+        return CachedResult(
+            returncode=self.__returncode,  # type: ignore
+            stdout=self.__stdout_bytes,
+            stderr=self.__stderr_bytes,
+        )
+
+    def __apply_result(
+        self,
+        result: CachedResult,
+        is_reused: bool,
+        check: bool,
+        errors: List[CalledProcessError],
+        description: str,
+    ) -> int:
+        """
+        Apply the result of an execution that may be executed by another runner.
+        """
+
+        if not is_reused:
+            if errors:
+                raise errors[0]
+
+            return self.__returncode  # type: ignore
+
+        self.__debug_logging_method(f"{description}: {self.command_str}")
+        self.__returncode = result.returncode
+        self.__set_output(result.stdout, result.stderr)
+
+        return self.__handle_returncode(check)
+
+    @staticmethod
+    def __verify_retry_input(input: Input, retry: Optional[Retry]) -> None:
+        if retry is not None and is_one_shot_input(input):
+            raise ValueError(
+                "retry is not available with an input that is consumed by an execution: "
+                f"{type(input).__name__}"
+            )
+
+    @staticmethod
+    def __is_result_shareable(input: Input, kwargs: Dict[str, Any]) -> bool:
+        # results of the executions that stream the input, or stream or redirect the outputs
+        # are not shareable
+        if not (input is None or isinstance(input, (str, bytes))):
+            return False
+
+        return kwargs.get("buffer_output", True) and not any(
+            kwargs.get(key) is not None
+            for key in ("on_stdout_line", "on_stderr_line", "stdout_capture", "stderr_capture")
+        )
+
+    async def arun(
+        self,
+        input: Input = None,
         encoding: Optional[str] = None,
         timeout: Optional[float] = None,
         retry: Optional[Retry] = None,
         **kwargs: Any,
     ) -> int:
-        self.__verify_command()
-
-        if self.dry_run:
-            self.__stdout = self._DRY_RUN_OUTPUT
-            self.__stderr = self._DRY_RUN_OUTPUT
-            self.__returncode = 0
+        """
+        Coroutine version of :py:meth:`.run`.
+        The command is executed with ``asyncio`` subprocesses, and backoff waits between
+        retries do not block the event loop.
+        ``on_stdout_line``/``on_stderr_line`` are invoked in the event loop.
+        """
+
+        started = self.__start_timings()
+        try:
+            return await self.__arun_with_retry(input, encoding, timeout, retry, **kwargs)
+        finally:
+            self.__finish_timings(started)
 
-            self.__save_command()
-            self.__debug_print_command()
+    async def __arun_with_retry(
+        self,
+        input: Input,
+        encoding: Optional[str],
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        self.__verify_retry_input(input, retry)
 
-            return self.__returncode
+        env = self.__prepare(kwargs)
+        if env is None:
+            return 0
 
         check = kwargs.pop("check", False)
-        env = self.__get_env(kwargs.pop("env", None))
         encoding = "ascii" if encoding is None else encoding
 
-        returncode = self._run(
-            env=env,
-            check=check if retry is None else False,
-            input=input,
-            encoding=encoding,
-            timeout=timeout,
-            **kwargs,
+        if self.__coalesce and self.__is_result_shareable(input, kwargs):
+            errors: List[CalledProcessError] = []
+            result, is_shared = await self.__async_single_flight.do(
+                make_result_key(self.__command, env, cast(Union[str, bytes, None], input)),
+                lambda: self.__aexecute_for_result(
+                    env, check, input, encoding, timeout, retry, errors, **kwargs
+                ),
+            )
+
+            return self.__apply_result(result, is_shared, check, errors, "coalesced result")
+
+        return await self.__aexecute_with_retry(
+            env, check, input, encoding, timeout, retry, **kwargs
         )
-        if retry is None or returncode in [0] + retry.no_retry_returncodes:
-            return returncode
 
-        for i in range(retry.total):
-            retry.sleep_before_retry(
-                attempt=i + 1,
+    async def __aexecute_for_result(
+        self,
+        env: EnvMapping,
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        errors: List[CalledProcessError],
+        **kwargs: Any,
+    ) -> CachedResult:
+        try:
+            await self.__aexecute_with_retry(env, check, input, encoding, timeout, retry, **kwargs)
+        except CalledProcessError as e:
+            errors.append(e)
+
+        return self.__make_result()
+
+    async def __aexecute_with_retry(
+        self,
+        env: EnvMapping,
+        check: bool,
+        input: Input,
+        encoding: str,
+        timeout: Optional[float],
+        retry: Optional[Retry],
+        **kwargs: Any,
+    ) -> int:
+        if retry is None:
+            return await self._arun(
+                env=env, check=check, input=input, encoding=encoding, timeout=timeout, **kwargs
+            )
+
+        started = time.monotonic()
+        attempt = 0
+        backoff: Optional[float] = None
+
+        while True:
+            try:
+                is_trial = retry.before_attempt(self.command_str)
+            except CircuitOpenError:
+                if attempt == 0:
+                    raise
+
+                # the circuit was opened by the failures: keep the result of the last attempt
+                break
+
+            with retry.track_attempt(self.command_str, is_trial):
+                returncode = await self._arun(
+                    env=env, check=False, input=input, encoding=encoding, timeout=timeout, **kwargs
+                )
+                is_retryable = retry.after_attempt(
+                    self.command_str, returncode, None if returncode == 0 else self.stderr
+                )
+
+            if not is_retryable:
+                break
+
+            attempt += 1
+            backoff = retry.next_backoff(attempt, started, backoff)
+            if backoff is None:
+                break
+
+            await retry.async_sleep_before_retry(
+                attempt=attempt,
                 logging_method=self.__debug_logging_method,
                 retry_target=self.command_str,
+                backoff=backoff,
             )
-            kwargs[self._RETRY_ATTEMPT_KEY] = i + 1
-
-            returncode = self._run(
-                env=env,
-                check=False,
-                input=input,
-                encoding=encoding,
-                timeout=timeout,
-                **kwargs,
-            )
-            if returncode in [0] + retry.no_retry_returncodes:
-                return returncode
+            kwargs[self._RETRY_ATTEMPT_KEY] = attempt
 
         if check is True:
             self.raise_for_returncode()
 
-        return self.__returncode  # type: ignore
+        return returncode
+
+    def execute(
+        self,
+        input: Input = None,
+        encoding: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        **kwargs: Any,
+    ) -> CompletedRun:
+        """
+        Execute the command as :py:meth:`.run` does, and return the result as
+        an immutable :py:class:`CompletedRun`.
+
+        The execution does not modify the state of the runner
+        (:py:attr:`.returncode`, :py:attr:`.stdout`, :py:attr:`.timings`, etc.).
+        Thus, a runner can be used as a reusable command template that is executed
+        from multiple threads at the same time.
+        """
+
+        runner = self.__fork()
+        runner.run(input, encoding, timeout, retry, **kwargs)
+
+        return runner.__to_completed_run()
+
+    async def aexecute(
+        self,
+        input: Input = None,
+        encoding: Optional[str] = None,
+        timeout: Optional[float] = None,
+        retry: Optional[Retry] = None,
+        **kwargs: Any,
+    ) -> CompletedRun:
+        """
+        Coroutine version of :py:meth:`.execute`.
+        """
+
+        runner = self.__fork()
+        await runner.arun(input, encoding, timeout, retry, **kwargs)
+
+        return runner.__to_completed_run()
+
+    def __to_completed_run(self) -> CompletedRun:
+        return CompletedRun(
+            command=self.command_str,
+            returncode=self.__returncode,  # type: ignore
+            stdout_bytes=self.__stdout_bytes,
+            stderr_bytes=self.__stderr_bytes,
+            duration=self.__timings.wall,
+            attempts=self.__timings.attempts,
+            output_encoding=self.__output_encoding,
+            output_errors=self.__output_errors,
+            stdout=self.__stdout,
+            stderr=self.__stderr,
+            raw=self.__raw,
+        )
+
+    def _bind(
+        self, command: List[str], exec_command: List[str], command_str: str
+    ) -> "SubprocessRunner":
+        """
+        Return a copy of the runner that executes an argv already validated and resolved
+        by a :py:class:`CommandTemplate`.
+        """
+
+        runner = self.__fork()
+        runner.__command = command
+        runner.__is_shell = False
+        runner.__exec_command = exec_command
+        runner.__command_str = command_str
+        runner.__is_resolved = True
+
+        return runner
+
+    def __fork(self) -> "SubprocessRunner":
+        """
+        Return a runner with the same settings and without the execution results.
+        """
+
+        # skip the constructor and copy.copy(): only the settings are shared with the runner
+        runner = SubprocessRunner.__new__(SubprocessRunner)
+        runner.__command = self.__command
+        runner.__is_shell = self.__is_shell
+        runner.__exec_command = self.__exec_command
+        runner.__command_str = self.__command_str
+        runner.__is_resolved = self.__is_resolved
+        runner.__use_abspath = self.__use_abspath
+        runner.__fast_spawn = self.__fast_spawn
+        runner.__use_launcher = self.__use_launcher
+        runner.__start_new_session = self.__start_new_session
+        runner.__result_cache = self.__result_cache
+        runner.__coalesce = self.__coalesce
+        runner.__kill_grace_period = self.__kill_grace_period
+        runner.__dry_run = self.__dry_run
+        runner.__stdout = None
+        runner.__stderr = None
+        runner.__stdout_bytes = None
+        runner.__stderr_bytes = None
+        runner.__returncode = None
+        runner.__timings = ExecutionTimings()
+        runner.__rusage = None
+        runner.__ignore_stderr_regexp = self.__ignore_stderr_regexp
+        runner.__output_encoding = self.__output_encoding
+        runner.__output_errors = self.__output_errors
+        runner.__raw = self.__raw
+        runner.__debug_logging_method = self.__debug_logging_method
+        runner.__error_logging_method = self.__error_logging_method
+        runner.__quiet = self.__quiet
+
+        return runner
+
+    def iter_lines(
+        self,
+        input: Input = None,
+        encoding: Optional[str] = None,
+        timeout: Optional[float] = None,
+        include_stderr: bool = False,
+        **kwargs: Any,
+    ) -> Iterator[Union[str, Tuple[str, str]]]:
+        """
+        Execute the command and yield decoded stdout lines (without line terminators)
+        as they are written by the command. The whole stdout is not kept in memory,
+        so :py:attr:`.stdout` is ``None`` after the iteration.
+        Not available on Windows.
+
+        :param include_stderr:
+            If ``True``, yield ``("stdout", line)``/``("stderr", line)`` tuples
+            for both of the streams.
+
+        ``returncode`` and ``stderr`` are set, and ``check=True`` is applied,
+        when the command exited. Only the last 64 KiB of stderr are kept by default:
+        ``stderr_capture`` keyword argument changes the :py:class:`Capture` policy of stderr.
+        Raises :py:class:`subprocess.TimeoutExpired` and terminates the process if the command
+        does not complete within ``timeout`` seconds.
+        """
+
+        self.__verify_command()
+
+        if self.dry_run:
+            self.__set_dry_run_result()
+
+            self.__append_history(start_time=time.time(), duration=0.0)
+            self.__debug_print_command()
+
+            return
+
+        check = kwargs.pop("check", False)
+        env = get_env(kwargs.pop("env", None), kwargs.pop("env_overrides", None))
+        stderr_capture = kwargs.pop("stderr_capture", None) or self.__ITER_LINES_STDERR_CAPTURE
+        encoding = "ascii" if encoding is None else encoding
+
+        self.__debug_print_command()
+
+        input_fd, input_data = split_input(input, encoding)
+
+        self.__set_output(None, None)
+        self.__returncode = None
+
+        with self.__save_history():
+            stderr_stream = stderr_capture.open_stream()
+            try:
+                with self.__spawn_slot() as on_exit:
+                    proc = self.__popen_class(
+                        self.__exec_command,
+                        shell=self.__is_shell,
+                        env=env,
+                        stdin=self.__get_stdin(input_fd, input_data),
+                        stdout=PIPE,
+                        stderr=stderr_stream,
+                        close_fds=not self.__fast_spawn,
+                        start_new_session=self.__start_new_session,
+                        on_exit=on_exit,
+                    )
+            finally:
+                if stderr_capture.mode == Capture.FILE and isinstance(stderr_capture.target, str):
+                    stderr_stream.close()  # type: ignore
+            stderr_buffer = stderr_capture.make_buffer()
+            splitters = {STDOUT: LineSplitter(), STDERR: LineSplitter()}
+            deadline = None if timeout is None else time.monotonic() + timeout
+            is_completed = False
+
+            try:
+                for name, chunk in iter_output(proc, input=input_data, timeout=timeout):
+                    if name == STDERR:
+                        stderr_buffer.write(chunk)
+                        if not include_stderr:
+                            continue
+
+                    for line in splitters[name].feed(chunk):
+                        yield (name, self.__decode(line)) if include_stderr else self.__decode(line)
+
+                for name, splitter in splitters.items():
+                    rest = splitter.flush()
+                    if rest is None or (name == STDERR and not include_stderr):
+                        continue
+
+                    yield (name, self.__decode(rest)) if include_stderr else self.__decode(rest)
+
+                # the process may keep running after closing the pipes
+                proc.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                is_completed = True
+            except subprocess.TimeoutExpired:
+                self.__raise_timeout(proc, timeout, None, stderr_buffer.getvalue())
+            finally:
+                # the process group is killed only when the iteration did not complete
+                # (error, or the generator closed early) as run() does
+                close_process(proc, kill_group=self.__start_new_session and not is_completed)
+
+            self.__returncode = proc.returncode
+            self.__set_output(None, stderr_buffer.getvalue() if proc.stderr is not None else None)
+
+            self.__handle_returncode(check)
 
     def popen(
-        self, std_in: Optional[int] = None, env: Optional[Env] = None
+        self,
+        std_in: Union[int, IO[Any], None] = None,
+        env: Optional[EnvMapping] = None,
+        env_overrides: Optional[EnvMapping] = None,
     ) -> Union[subprocess.Popen, subprocess.CompletedProcess]:
         self.__verify_command()
         self.__debug_print_command()
 
         if self.dry_run:
-            self.__stdout = self._DRY_RUN_OUTPUT
-            self.__stderr = self._DRY_RUN_OUTPUT
-            self.__returncode = 0
+            self.__set_dry_run_result()
 
             return subprocess.CompletedProcess(
                 args=[],
-                returncode=self.__returncode,
-                stdout=self.__stdout,
-                stderr=self.__stderr,
+                returncode=0,
+                stdout=self.stdout,
+                stderr=self.stderr,
             )
 
-        try:
-            process = subprocess.Popen(
-                self.command,
-                env=self.__get_env(env),
-                shell=self.__is_shell,
-                stdin=std_in,
-                stdout=PIPE,
-                stderr=PIPE,
-            )
-        except TypeError:
-            process = subprocess.Popen(
-                self.command,
-                shell=self.__is_shell,
-                stdin=std_in,
-                stdout=PIPE,
-                stderr=PIPE,
-            )
+        with self.__spawn_slot() as on_exit:
+            try:
+                process = self.__popen_class(
+                    self.__exec_command,
+                    env=get_env(env, env_overrides),
+                    shell=self.__is_shell,
+                    stdin=std_in,
+                    stdout=PIPE,
+                    stderr=PIPE,
+                    close_fds=not self.__fast_spawn,
+                    start_new_session=self.__start_new_session,
+                    on_exit=on_exit,
+                )
+            except TypeError:
+                process = self.__popen_class(
+                    self.__exec_command,
+                    shell=self.__is_shell,
+                    stdin=std_in,
+                    stdout=PIPE,
+                    stderr=PIPE,
+                    close_fds=not self.__fast_spawn,
+                    start_new_session=self.__start_new_session,
+                    on_exit=on_exit,
+                )
 
         return process
 
@@ -312,8 +1413,8 @@ class SubprocessRunner:
         raise CalledProcessError(
             returncode=self.__returncode,
             cmd=self.command_str,
-            output=self.stdout,
-            stderr=self.stderr,
+            output=self.stdout_bytes if self.__raw else self.stdout,
+            stderr=self.stderr_bytes if self.__raw else self.stderr,
         )
 
     def __verify_command(self) -> None:
@@ -324,7 +1425,7 @@ class SubprocessRunner:
                 errno=errno.EINVAL,
             )
 
-        if self.dry_run or platform.system() == "Windows":
+        if self.dry_run or self.__is_resolved or platform.system() == "Windows":
             return
 
         if self.__is_shell:
@@ -332,26 +1433,172 @@ class SubprocessRunner:
         else:
             base_command = self.command[0]
 
-        Which(base_command).verify()
+        which = Which(base_command)
+        which.verify()
+
+        if (self.__use_abspath or self.__fast_spawn) and not self.__is_shell:
+            self.__exec_command = [cast(str, which.abspath())] + list(self.command[1:])
+
+    @contextmanager
+    def __save_history(self, retry_attempt: Optional[int] = None) -> Iterator[None]:
+        """
+        Save an execution of the command to the history when the context exited.
+        """
+
+        if not self.is_save_history:
+            yield
+            return
+
+        start_time = time.time()
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.__append_history(
+                start_time=start_time,
+                duration=time.perf_counter() - started,
+                retry_attempt=retry_attempt,
+            )
 
-    def __save_command(self):
+    def __append_history(
+        self, start_time: float, duration: float, retry_attempt: Optional[int] = None
+    ) -> None:
         if not self.is_save_history:
             return
 
-        if len(self.__command_history) >= self.history_size:
-            self.__command_history.pop(0)
+        self.__command_history.append(
+            HistoryRecord(
+                command=self.command_str,
+                returncode=self.__returncode,
+                start_time=start_time,
+                duration=duration,
+                retry_attempt=retry_attempt,
+                dry_run=self.dry_run,
+            ),
+            maxlen=self.history_size,
+        )
 
-        self.__command_history.append(self.command_str)
+    def __prepare(self, kwargs: Dict[str, Any]) -> Optional[EnvMapping]:
+        """
+        Verify the command and build the environment variables for an execution.
+        Returns ``None`` if the execution is a dry-run.
+        """
 
-    @staticmethod
-    def __get_env(env: Optional[Env] = None) -> Env:
-        if env is not None:
-            return env
+        started = time.perf_counter()
+        self.__verify_command()
+        self.__timings.resolve += time.perf_counter() - started
+
+        if self.dry_run:
+            self.__set_dry_run_result()
+
+            self.__append_history(start_time=time.time(), duration=0.0)
+            self.__debug_print_command()
+
+            return None
+
+        started = time.perf_counter()
+        env = get_env(kwargs.pop("env", None), kwargs.pop("env_overrides", None))
+        self.__timings.env += time.perf_counter() - started
+
+        return env
+
+    def __start_timings(self) -> float:
+        self.__timings = ExecutionTimings()
+        self.__rusage = None
 
-        if platform.system() == "Linux":
-            return dict(os.environ, LC_ALL="C")
+        return time.perf_counter()
 
-        return cast(Env, os.environ)
+    def __finish_timings(self, started: float) -> None:
+        self.__timings.wall = time.perf_counter() - started
+
+        for hook in list(self.__execution_hooks):
+            try:
+                hook(self, self.__timings)
+            except Exception as e:
+                self.__debug_logging_method(f"failed to call an execution hook {hook!r}: {e}")
+
+    def __record_process_stats(
+        self, proc: Union[TrackedPopen, LauncherPopen], io_started: float
+    ) -> None:
+        io_time = time.perf_counter() - io_started
+        wait_time = min(proc.wait_time, io_time)
+
+        self.__timings.read += io_time - wait_time
+        self.__timings.wait += wait_time
+
+        if proc.rusage is None:
+            return
+
+        self.__timings.user_cpu += proc.rusage.ru_utime
+        self.__timings.system_cpu += proc.rusage.ru_stime
+
+        rusage = ResourceUsage.from_struct_rusage(proc.rusage)
+        self.__rusage = rusage if self.__rusage is None else self.__rusage + rusage
+
+    @property
+    def __command_name(self) -> str:
+        return get_command_name(self.__command)
+
+    @contextmanager
+    def __spawn_slot(self) -> Iterator[Optional[Callable[[], None]]]:
+        """
+        Wait for admission of :py:attr:`.spawn_limiter` and yield a callable to release the slot,
+        that is called when the process is reaped. The slot is released if the spawn failed.
+        """
+
+        limiter = self.spawn_limiter
+        if limiter is None:
+            yield None
+            return
+
+        name = self.__command_name
+        started = time.perf_counter()
+        limiter.acquire(name)
+        self.__timings.queue += time.perf_counter() - started
+
+        try:
+            yield functools.partial(limiter.release, name)
+        except BaseException:
+            limiter.release(name)
+            raise
+
+    async def __aacquire_spawn_slot(self) -> Optional[Callable[[], None]]:
+        limiter = self.spawn_limiter
+        if limiter is None:
+            return None
+
+        name = self.__command_name
+        started = time.perf_counter()
+        await limiter.aacquire(name)
+        self.__timings.queue += time.perf_counter() - started
+
+        return functools.partial(limiter.release, name)
+
+    def __get_stdin(
+        self, input_fd: Optional[int], input_data: Union[bytes, Iterator[bytes], None]
+    ) -> int:
+        if input_fd is not None:
+            return input_fd
+        if self.__fast_spawn and not input_data:
+            return subprocess.DEVNULL
+
+        return PIPE
+
+    def __set_output(self, stdout: Optional[bytes], stderr: Optional[bytes]) -> None:
+        self.__stdout_bytes = stdout
+        self.__stderr_bytes = stderr
+        self.__stdout = None
+        self.__stderr = None
+
+    def __set_dry_run_result(self) -> None:
+        self.__set_output(b"", b"")
+        self.__stdout = self._DRY_RUN_OUTPUT
+        self.__stderr = self._DRY_RUN_OUTPUT
+        self.__returncode = 0
+
+    def __decode(self, data: Union[bytes, str]) -> str:
+        return decode_output(data, self.__output_encoding, self.__output_errors)
 
     def __debug_print_command(self, retry_attept: Optional[int] = None) -> None:
         if self.__quiet:
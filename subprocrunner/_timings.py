@@ -0,0 +1,95 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+from typing import Dict
+
+
+class ExecutionTimings:
+    """
+    Timing breakdown of a command execution in seconds.
+    Durations are summed up over retry attempts.
+
+    .. py:attribute:: resolve
+
+        Time to verify the command exists.
+
+    .. py:attribute:: env
+
+        Time to build the environment variables.
+
+    .. py:attribute:: queue
+
+        Time to wait for admission of the spawn limiter.
+
+    .. py:attribute:: spawn
+
+        Time to create the processes.
+
+    .. py:attribute:: read
+
+        Time to write the input and to read the outputs.
+
+    .. py:attribute:: wait
+
+        Time to wait for the processes to exit after the outputs reached EOF.
+
+    .. py:attribute:: decode
+
+        Time spent to decode the outputs so far. Outputs are decoded lazily,
+        so the value increases when ``stdout``/``stderr`` are accessed for the first time.
+
+    .. py:attribute:: wall
+
+        Elapsed time of the whole execution including backoff times between retries.
+
+    .. py:attribute:: user_cpu
+
+        User CPU time consumed by the processes (POSIX only).
+
+    .. py:attribute:: system_cpu
+
+        System CPU time consumed by the processes (POSIX only).
+
+    .. py:attribute:: attempts
+
+        Number of the processes executed.
+    """
+
+    __slots__ = (
+        "resolve",
+        "env",
+        "queue",
+        "spawn",
+        "read",
+        "wait",
+        "decode",
+        "wall",
+        "user_cpu",
+        "system_cpu",
+        "attempts",
+    )
+
+    def __init__(self) -> None:
+        self.resolve = 0.0
+        self.env = 0.0
+        self.queue = 0.0
+        self.spawn = 0.0
+        self.read = 0.0
+        self.wait = 0.0
+        self.decode = 0.0
+        self.wall = 0.0
+        self.user_cpu = 0.0
+        self.system_cpu = 0.0
+        self.attempts = 0
+
+    def __repr__(self) -> str:
+        return "ExecutionTimings({})".format(
+            ", ".join(
+                f"{key}={value}" if key == "attempts" else f"{key}={value:.6f}"
+                for key, value in self.as_dict().items()
+            )
+        )
+
+    def as_dict(self) -> Dict[str, float]:
+        return {key: getattr(self, key) for key in self.__slots__}
@@ -5,18 +5,110 @@
 import errno
 import os
 import shutil
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
 
 from .error import CommandError
 from .typing import Command
 
 
+class WhichCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class _WhichCache:
+    """
+    LRU cache of resolved command paths shared in the process.
+    Entries are keyed on ``(command, PATH, follow_symlinks)``: all of the entries are
+    discarded when ``PATH`` changed, and an entry is discarded when the cached file
+    no longer exists.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__entries: "OrderedDict[Tuple[str, str, bool], str]" = OrderedDict()
+        self.__path: Optional[str] = None
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, command: str, follow_symlinks: bool) -> Optional[str]:
+        path = os.environ.get("PATH", os.defpath)
+        key = (command, path, follow_symlinks)
+
+        with self.__lock:
+            if path != self.__path:
+                self.__entries.clear()
+                self.__path = path
+
+            abspath = self.__entries.get(key)
+            if abspath is not None:
+                if os.path.exists(abspath):
+                    self.__entries.move_to_end(key)
+                    self.__hits += 1
+                    return abspath
+
+                del self.__entries[key]
+
+            self.__misses += 1
+
+        return None
+
+    def put(self, command: str, follow_symlinks: bool, abspath: str, maxsize: int) -> None:
+        path = os.environ.get("PATH", os.defpath)
+
+        with self.__lock:
+            if path != self.__path or maxsize <= 0:
+                return
+
+            self.__entries[(command, path, follow_symlinks)] = abspath
+            while len(self.__entries) > maxsize:
+                self.__entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+    def info(self, maxsize: int) -> WhichCacheInfo:
+        with self.__lock:
+            return WhichCacheInfo(
+                hits=self.__hits,
+                misses=self.__misses,
+                maxsize=maxsize,
+                currsize=len(self.__entries),
+            )
+
+
 class Which:
+    """
+    .. py:attribute:: cache_maxsize
+
+        Maximum number of entries of the command path cache shared in the process.
+        The cache is disabled if the value is ``0``.
+    """
+
+    cache_maxsize = 256
+
+    __cache = _WhichCache()
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        cls.__cache.clear()
+
+    @classmethod
+    def cache_info(cls) -> WhichCacheInfo:
+        return cls.__cache.info(cls.cache_maxsize)
+
     @property
     def command(self) -> Command:
         return self.__command
 
-    def __init__(self, command: str, follow_symlinks: bool = False) -> None:
+    def __init__(self, command: str, follow_symlinks: bool = False, use_cache: bool = True) -> None:
         if not command:
             raise ValueError("require a command")
 
@@ -25,6 +117,7 @@ class Which:
 
         self.__command = command
         self.__follow_symlinks = follow_symlinks
+        self.__use_cache = use_cache
         self.__abspath: Optional[str] = None
 
     def __repr__(self) -> str:
@@ -54,6 +147,12 @@ class Which:
         if self.__abspath:
             return self.__abspath
 
+        use_cache = self.__use_cache and self.cache_maxsize > 0
+        if use_cache:
+            self.__abspath = self.__cache.get(self.__command, self.__follow_symlinks)
+            if self.__abspath:
+                return self.__abspath
+
         self.__abspath = shutil.which(self.command)  # type: ignore
         if self.__abspath is None:
             return self.__abspath
@@ -61,4 +160,9 @@ class Which:
         if self.__follow_symlinks and os.path.islink(self.__abspath):
             self.__abspath = os.path.realpath(self.__abspath)
 
+        if use_cache:
+            self.__cache.put(
+                self.__command, self.__follow_symlinks, self.__abspath, self.cache_maxsize
+            )
+
         return self.__abspath
@@ -0,0 +1,222 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import subprocess
+from collections import deque
+from typing import IO, Any, Deque, List, Optional, Union
+
+
+CaptureTarget = Union[str, int, IO[Any]]
+
+# lines longer than this retain only the last bytes in the tail capture by lines
+_MAX_LINE_BYTES = 1024 * 1024
+
+
+class CaptureBuffer:
+    """
+    Retain all of the data written to the buffer.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, chunk: bytes) -> None:
+        self._chunks.append(chunk)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+class _HeadBuffer(CaptureBuffer):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+
+        self.__remaining = max_bytes
+
+    def write(self, chunk: bytes) -> None:
+        if self.__remaining <= 0:
+            return
+
+        chunk = chunk[: self.__remaining]
+        self.__remaining -= len(chunk)
+        self._chunks.append(chunk)
+
+
+class _TailBytesBuffer(CaptureBuffer):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+
+        self.__max_bytes = max_bytes
+        self.__buffer = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        self.__buffer += chunk[-self.__max_bytes :]
+        if len(self.__buffer) > self.__max_bytes:
+            del self.__buffer[: -self.__max_bytes]
+
+    def getvalue(self) -> bytes:
+        return bytes(self.__buffer)
+
+
+class _TailLinesBuffer(CaptureBuffer):
+    def __init__(self, max_lines: int) -> None:
+        super().__init__()
+
+        self.__max_lines = max_lines
+        self.__lines: Deque[bytes] = deque(maxlen=max_lines)
+        # a line that is not terminated yet
+        self.__pending = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        lines = chunk.split(b"\n")
+        rest = lines.pop()
+
+        if lines:
+            self.__pending += lines[0]
+            lines[0] = bytes(self.__pending)
+            del self.__pending[:]
+            self.__lines.extend(
+                line[-_MAX_LINE_BYTES:] + b"\n" for line in lines[-self.__max_lines :]
+            )
+
+        self.__pending += rest
+        if len(self.__pending) > _MAX_LINE_BYTES:
+            del self.__pending[:-_MAX_LINE_BYTES]
+
+    def getvalue(self) -> bytes:
+        lines = list(self.__lines)
+        if self.__pending:
+            lines.append(bytes(self.__pending))
+
+        return b"".join(lines[-self.__max_lines :])
+
+
+class Capture:
+    """
+    Output capture policy for a stdout/stderr stream of a command.
+
+    .. py:attribute:: mode
+
+        One of ``"pipe"`` (retain the whole output: default), ``"discard"``,
+        ``"file"``, ``"head"``, and ``"tail"``.
+    """
+
+    PIPE = "pipe"
+    DISCARD = "discard"
+    FILE = "file"
+    HEAD = "head"
+    TAIL = "tail"
+
+    @classmethod
+    def discard(cls) -> "Capture":
+        """
+        Discard the output by redirecting it to ``/dev/null``.
+        """
+
+        return cls(mode=cls.DISCARD)
+
+    @classmethod
+    def to_file(cls, target: CaptureTarget, append: bool = False) -> "Capture":
+        """
+        Write the output directly to a file without passing through Python.
+
+        :param target: A file path, a file descriptor, or a file object.
+        :param append: Append to the file if ``target`` is a file path.
+        """
+
+        return cls(mode=cls.FILE, target=target, append=append)
+
+    @classmethod
+    def head(cls, max_bytes: int) -> "Capture":
+        """
+        Retain only the first ``max_bytes`` bytes of the output.
+        """
+
+        return cls(mode=cls.HEAD, max_bytes=max_bytes)
+
+    @classmethod
+    def tail(cls, max_bytes: Optional[int] = None, max_lines: Optional[int] = None) -> "Capture":
+        """
+        Retain only the last ``max_bytes`` bytes, or the last ``max_lines`` lines,
+        of the output. Lines longer than 1 MiB retain only the last 1 MiB.
+        """
+
+        return cls(mode=cls.TAIL, max_bytes=max_bytes, max_lines=max_lines)
+
+    def __init__(
+        self,
+        mode: str = PIPE,
+        max_bytes: Optional[int] = None,
+        max_lines: Optional[int] = None,
+        target: Optional[CaptureTarget] = None,
+        append: bool = False,
+    ) -> None:
+        if mode not in (self.PIPE, self.DISCARD, self.FILE, self.HEAD, self.TAIL):
+            raise ValueError(f"unknown capture mode: {mode}")
+
+        if mode == self.FILE and target is None:
+            raise ValueError("target is required for the file capture mode")
+
+        if mode == self.HEAD and max_bytes is None:
+            raise ValueError("max_bytes is required for the head capture mode")
+
+        if mode == self.TAIL and (max_bytes is None) == (max_lines is None):
+            raise ValueError("either max_bytes or max_lines is required for the tail capture mode")
+
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than zero")
+
+        if max_lines is not None and max_lines <= 0:
+            raise ValueError("max_lines must be greater than zero")
+
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.target = target
+        self.append = append
+
+    def __repr__(self) -> str:
+        msgs = [f"mode={self.mode}"]
+
+        if self.max_bytes is not None:
+            msgs.append(f"max-bytes={self.max_bytes}")
+        if self.max_lines is not None:
+            msgs.append(f"max-lines={self.max_lines}")
+        if self.target is not None:
+            msgs.append(f"target={self.target}")
+
+        return "Capture({})".format(", ".join(msgs))
+
+    @property
+    def is_bounded(self) -> bool:
+        return self.mode in (self.HEAD, self.TAIL)
+
+    def open_stream(self) -> Union[int, IO[Any]]:
+        """
+        Return a value for the ``stdout``/``stderr`` argument of :py:class:`subprocess.Popen`.
+        A file opened from a path must be closed by the caller after the process started.
+        """
+
+        if self.mode == self.DISCARD:
+            return subprocess.DEVNULL
+
+        if self.mode == self.FILE:
+            if isinstance(self.target, str):
+                return open(self.target, "ab" if self.append else "wb")
+
+            return self.target  # type: ignore
+
+        return subprocess.PIPE
+
+    def make_buffer(self) -> CaptureBuffer:
+        if self.mode == self.HEAD:
+            return _HeadBuffer(self.max_bytes)  # type: ignore
+
+        if self.mode == self.TAIL:
+            if self.max_lines is not None:
+                return _TailLinesBuffer(self.max_lines)
+
+            return _TailBytesBuffer(self.max_bytes)  # type: ignore
+
+        return CaptureBuffer()
@@ -23,3 +23,28 @@ class CommandError(Exception):
         self.__errno = kwargs.pop("errno", None)
 
         super().__init__(*args)
+
+
+class CircuitOpenError(CommandError):
+    """
+    Raised when a command is not executed because the circuit of the command is open.
+    """
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        """
+        Seconds until the circuit allows a trial execution.
+        """
+
+        return self.__retry_after
+
+    def __init__(self, *args: str, **kwargs: Any) -> None:
+        self.__retry_after = kwargs.pop("retry_after", None)
+
+        super().__init__(*args, **kwargs)
+
+
+class SpawnLimitError(CommandError):
+    """
+    Raised when a command is not executed because the spawn limiter did not admit it.
+    """
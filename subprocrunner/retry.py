@@ -1,9 +1,247 @@
+import asyncio
+import re
+import threading
 import time
+from contextlib import contextmanager
 from random import uniform
-from typing import Callable, List, Optional
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Union
+
+from .error import CircuitOpenError
+
+
+class RetryBudgetInfo(NamedTuple):
+    tokens: float
+    max_tokens: float
+    acquired: int
+    denied: int
+
+
+class RetryBudget:
+    """
+    Token bucket that bounds the number of retries across the runners that share the instance.
+    A retry consumes a token, and is not attempted if no token is left.
+    Successful executions refill ``token_ratio`` tokens, so that retries are allowed at most
+    for ``token_ratio`` of successful executions on average after the initial tokens are spent.
+
+    :param max_tokens: Initial and maximum number of tokens.
+    :param token_ratio: Number of tokens refilled by a successful execution.
+    """
+
+    def __init__(self, max_tokens: float = 10, token_ratio: float = 0.1) -> None:
+        if max_tokens < 1:
+            raise ValueError("max_tokens must be greater than or equal to one")
+        if token_ratio <= 0:
+            raise ValueError("token_ratio must be greater than zero")
+
+        self.__max_tokens = max_tokens
+        self.__token_ratio = token_ratio
+        self.__lock = threading.Lock()
+        self.__tokens = float(max_tokens)
+        self.__acquired = 0
+        self.__denied = 0
+
+    def __repr__(self) -> str:
+        info = self.budget_info()
+
+        return "RetryBudget(tokens={:.1f}, max_tokens={}, token_ratio={}, denied={})".format(
+            info.tokens, self.__max_tokens, self.__token_ratio, info.denied
+        )
+
+    @property
+    def max_tokens(self) -> float:
+        return self.__max_tokens
+
+    @property
+    def token_ratio(self) -> float:
+        return self.__token_ratio
+
+    def budget_info(self) -> RetryBudgetInfo:
+        with self.__lock:
+            return RetryBudgetInfo(
+                tokens=self.__tokens,
+                max_tokens=self.__max_tokens,
+                acquired=self.__acquired,
+                denied=self.__denied,
+            )
+
+    def try_acquire(self) -> bool:
+        """
+        Consume a token for a retry. Return ``False`` if no token is left.
+        """
+
+        with self.__lock:
+            if self.__tokens < 1:
+                self.__denied += 1
+                return False
+
+            self.__tokens -= 1
+            self.__acquired += 1
+
+            return True
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.__tokens = min(self.__max_tokens, self.__tokens + self.__token_ratio)
+
+    def reset(self) -> None:
+        """
+        Fill the tokens and reset the statistics.
+        """
+
+        with self.__lock:
+            self.__tokens = float(self.__max_tokens)
+            self.__acquired = 0
+            self.__denied = 0
+
+
+class CircuitBreaker:
+    """
+    Stop executing a command that keeps failing.
+    A circuit of a command is opened when the command failed (exited with a non-zero
+    return code, or raised an exception) ``failure_threshold`` times in a row,
+    and executions of the command raise :py:class:`CircuitOpenError` without
+    spawning processes while the circuit is open. After ``reset_timeout`` seconds,
+    an execution is allowed as a trial (half-open): the circuit is closed if the trial
+    succeeded, and opened again otherwise.
+    An instance can be shared by runners; circuits are kept for each command.
+
+    :param failure_threshold: Number of consecutive failures to open a circuit.
+    :param reset_timeout: Seconds to keep a circuit open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        if failure_threshold <= 0:
+            raise ValueError("failure_threshold must be greater than zero")
+        if reset_timeout <= 0:
+            raise ValueError("reset_timeout must be greater than zero")
+
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__lock = threading.Lock()
+        self.__failures: Dict[str, int] = {}
+        self.__opened_at: Dict[str, float] = {}
+        self.__trials: Dict[str, bool] = {}
+
+    def __repr__(self) -> str:
+        return "CircuitBreaker(failure_threshold={}, reset_timeout={}, open={})".format(
+            self.__failure_threshold, self.__reset_timeout, len(self.__opened_at)
+        )
+
+    @property
+    def failure_threshold(self) -> int:
+        return self.__failure_threshold
+
+    @property
+    def reset_timeout(self) -> float:
+        return self.__reset_timeout
+
+    def state(self, key: str) -> str:
+        with self.__lock:
+            opened_at = self.__opened_at.get(key)
+            if opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - opened_at < self.__reset_timeout:
+                return self.OPEN
+
+            return self.HALF_OPEN
+
+    def before_call(self, key: str) -> bool:
+        """
+        Raise :py:class:`CircuitOpenError` if the circuit of ``key`` is open,
+        or a trial of the half-open circuit is in progress.
+        Return ``True`` if the call is a trial of the half-open circuit:
+        the trial must be ended by :py:meth:`.record_success`, :py:meth:`.record_failure`
+        or :py:meth:`.release_trial`.
+        """
+
+        with self.__lock:
+            opened_at = self.__opened_at.get(key)
+            if opened_at is None:
+                return False
+
+            retry_after = opened_at + self.__reset_timeout - time.monotonic()
+            if retry_after <= 0 and not self.__trials.get(key):
+                self.__trials[key] = True
+                return True
+
+        raise CircuitOpenError(
+            f"circuit is open: failed {self.__failure_threshold} times in a row",
+            cmd=key,
+            retry_after=max(0.0, retry_after),
+        )
+
+    def record_success(self, key: str) -> None:
+        with self.__lock:
+            self.__failures.pop(key, None)
+            self.__opened_at.pop(key, None)
+            self.__trials.pop(key, None)
+
+    def record_failure(self, key: str) -> None:
+        with self.__lock:
+            failures = self.__failures.get(key, 0) + 1
+            self.__failures[key] = failures
+
+            if self.__trials.pop(key, False) or failures >= self.__failure_threshold:
+                self.__opened_at[key] = time.monotonic()
+
+    def release_trial(self, key: str) -> None:
+        """
+        End a trial of the half-open circuit of ``key`` without changing the state,
+        so that another call can be a trial.
+        """
+
+        with self.__lock:
+            self.__trials.pop(key, None)
+
+    def reset(self, key: Optional[str] = None) -> None:
+        """
+        Close the circuit of ``key``, or all of the circuits if ``key`` is ``None``.
+        """
+
+        if key is not None:
+            self.record_success(key)
+            return
+
+        with self.__lock:
+            self.__failures.clear()
+            self.__opened_at.clear()
+            self.__trials.clear()
 
 
 class Retry:
+    """
+    :param total: Maximum number of retries.
+    :param backoff_factor: Base seconds of the backoff waits between retries.
+    :param jitter: Random seconds added to the exponential backoff waits.
+    :param no_retry_returncodes: Return codes that are not retried.
+    :param retry_on_returncodes:
+        If specified, failures are retried only with the return codes
+        (or stderr that matches ``retry_on_stderr``).
+    :param retry_on_stderr:
+        If specified, failures are retried only when stderr matches either of the regexps
+        (or the return code is in ``retry_on_returncodes``).
+        e.g. ``["Resource temporarily unavailable"]``
+    :param backoff_strategy:
+        :py:attr:`.EXPONENTIAL`: ``backoff_factor * 2 ** (attempt - 1)`` plus ``jitter``.
+        :py:attr:`.DECORRELATED_JITTER`: a random value between ``backoff_factor`` and
+        three times of the previous wait.
+    :param max_backoff: Maximum seconds of a backoff wait.
+    :param deadline:
+        Seconds of the time budget across the attempts from the start of the first attempt.
+        Retries that would start after the deadline are not attempted.
+    :param circuit_breaker: :py:class:`CircuitBreaker` consulted before each attempt.
+    :param budget:
+        :py:class:`RetryBudget` consulted before each retry. Retries are not attempted
+        if the budget is exhausted.
+    """
+
+    EXPONENTIAL = "exponential"
+    DECORRELATED_JITTER = "decorrelated-jitter"
+
     def __init__(
         self,
         total: int = 3,
@@ -11,11 +249,23 @@ class Retry:
         jitter: float = 0.2,
         no_retry_returncodes: Optional[List[int]] = None,
         quiet: bool = False,
+        retry_on_returncodes: Optional[List[int]] = None,
+        retry_on_stderr: Optional[Sequence[Union[str, Pattern]]] = None,
+        backoff_strategy: str = EXPONENTIAL,
+        max_backoff: Optional[float] = None,
+        deadline: Optional[float] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        budget: Optional[RetryBudget] = None,
     ) -> None:
         self.total = total
         self.__backoff_factor = backoff_factor
         self.__jitter = jitter
         self.__quiet = quiet
+        self.__backoff_strategy = backoff_strategy
+        self.__max_backoff = max_backoff
+        self.deadline = deadline
+        self.circuit_breaker = circuit_breaker
+        self.budget = budget
 
         if self.total <= 0:
             raise ValueError("total must be greater than zero")
@@ -26,11 +276,30 @@ class Retry:
         if self.__jitter <= 0:
             raise ValueError("jitter must be greater than zero")
 
+        if self.__backoff_strategy not in (self.EXPONENTIAL, self.DECORRELATED_JITTER):
+            raise ValueError(f"unknown backoff_strategy: {backoff_strategy}")
+
+        if self.__max_backoff is not None and self.__max_backoff <= 0:
+            raise ValueError("max_backoff must be greater than zero")
+
+        if self.deadline is not None and self.deadline <= 0:
+            raise ValueError("deadline must be greater than zero")
+
         if no_retry_returncodes:
             self.no_retry_returncodes = no_retry_returncodes
         else:
             self.no_retry_returncodes = []
 
+        self.retry_on_returncodes = retry_on_returncodes
+        self.retry_on_stderr: Optional[List[Pattern]] = (
+            None
+            if retry_on_stderr is None
+            else [
+                re.compile(pattern) if isinstance(pattern, str) else pattern
+                for pattern in retry_on_stderr
+            ]
+        )
+
     def __repr__(self) -> str:
         msgs = [
             f"total={self.total}",
@@ -40,22 +309,175 @@ class Retry:
 
         if self.no_retry_returncodes:
             msgs.append(f"no-retry-returncodes={self.no_retry_returncodes}")
+        if self.retry_on_returncodes is not None:
+            msgs.append(f"retry-on-returncodes={self.retry_on_returncodes}")
+        if self.retry_on_stderr is not None:
+            msgs.append(
+                "retry-on-stderr={}".format([pattern.pattern for pattern in self.retry_on_stderr])
+            )
+        if self.__backoff_strategy != self.EXPONENTIAL:
+            msgs.append(f"backoff-strategy={self.__backoff_strategy}")
+        if self.__max_backoff is not None:
+            msgs.append(f"max-backoff={self.__max_backoff}")
+        if self.deadline is not None:
+            msgs.append(f"deadline={self.deadline}")
 
         return "Retry({})".format(", ".join(msgs))
 
-    def calc_backoff_time(self, attempt: int) -> float:
-        sleep_duration = self.__backoff_factor * (2 ** max(0, attempt - 1))
-        sleep_duration += uniform(0.5 * self.__jitter, 1.5 * self.__jitter)
+    def is_retryable(self, returncode: int, stderr: Optional[str] = None) -> bool:
+        """
+        Return ``True`` if a failed execution with ``returncode`` and ``stderr`` is retried.
+        """
+
+        if returncode == 0 or returncode in self.no_retry_returncodes:
+            return False
+
+        if self.retry_on_returncodes is None and self.retry_on_stderr is None:
+            return True
+
+        if self.retry_on_returncodes is not None and returncode in self.retry_on_returncodes:
+            return True
+
+        return bool(
+            self.retry_on_stderr is not None
+            and stderr
+            and any(pattern.search(stderr) for pattern in self.retry_on_stderr)
+        )
+
+    def calc_backoff_time(self, attempt: int, previous: Optional[float] = None) -> float:
+        """
+        :param previous: Previous backoff wait. Used by :py:attr:`.DECORRELATED_JITTER`.
+        """
+
+        if self.__backoff_strategy == self.DECORRELATED_JITTER:
+            upper = max(self.__backoff_factor, (previous or self.__backoff_factor) * 3)
+            sleep_duration = uniform(self.__backoff_factor, upper)
+        else:
+            sleep_duration = self.__backoff_factor * (2 ** max(0, attempt - 1))
+            sleep_duration += uniform(0.5 * self.__jitter, 1.5 * self.__jitter)
+
+        if self.__max_backoff is not None:
+            sleep_duration = min(self.__max_backoff, sleep_duration)
 
         return sleep_duration
 
+    def next_backoff(
+        self, attempt: int, started: float, previous: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        Return the backoff wait before the ``attempt``-th retry, or ``None`` if the retry is
+        not attempted: retries are exhausted, the retry would start after the deadline,
+        or the retry budget is exhausted.
+
+        :param started: :py:func:`time.monotonic` at the start of the first attempt.
+        """
+
+        if attempt > self.total:
+            return None
+
+        sleep_duration = self.calc_backoff_time(attempt, previous)
+        if (
+            self.deadline is not None
+            and time.monotonic() - started + sleep_duration >= self.deadline
+        ):
+            return None
+
+        if self.budget is not None and not self.budget.try_acquire():
+            return None
+
+        return sleep_duration
+
+    def before_attempt(self, key: str) -> bool:
+        """
+        Raise :py:class:`CircuitOpenError` if the circuit of the command ``key`` is open.
+        Return ``True`` if the attempt is a trial of the half-open circuit.
+        """
+
+        if self.circuit_breaker is not None:
+            return self.circuit_breaker.before_call(key)
+
+        return False
+
+    @contextmanager
+    def track_attempt(self, key: str, is_trial: bool = False) -> Iterator[None]:
+        """
+        Context manager of an attempt of the command ``key`` that is followed by
+        :py:meth:`.before_attempt`. An exception raised in the context is recorded as
+        a failure, and the half-open trial is released when the context exited
+        even if the attempt was not recorded (e.g. cancelled).
+        """
+
+        try:
+            yield
+        except Exception:
+            self.record_failure(key)
+            raise
+        finally:
+            if is_trial and self.circuit_breaker is not None:
+                self.circuit_breaker.release_trial(key)
+
+    def after_attempt(self, key: str, returncode: int, stderr: Optional[str] = None) -> bool:
+        """
+        Record the result of an attempt to the circuit breaker and the retry budget,
+        and return ``True`` if the attempt failed and is retryable.
+        """
+
+        is_retryable = self.is_retryable(returncode, stderr)
+
+        if self.budget is not None and returncode == 0:
+            self.budget.record_success()
+
+        if self.circuit_breaker is not None:
+            if returncode == 0:
+                self.circuit_breaker.record_success(key)
+            else:
+                self.circuit_breaker.record_failure(key)
+
+        return is_retryable
+
+    def record_failure(self, key: str) -> None:
+        """
+        Record an attempt that failed with an exception (e.g. timed out, failed to spawn)
+        to the circuit breaker.
+        """
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure(key)
+
     def sleep_before_retry(
         self,
         attempt: int,
         logging_method: Optional[Callable] = None,
         retry_target: Optional[str] = None,
+        backoff: Optional[float] = None,
+    ) -> float:
+        sleep_duration = self.__prepare_sleep(attempt, logging_method, retry_target, backoff)
+
+        time.sleep(sleep_duration)
+
+        return sleep_duration
+
+    async def async_sleep_before_retry(
+        self,
+        attempt: int,
+        logging_method: Optional[Callable] = None,
+        retry_target: Optional[str] = None,
+        backoff: Optional[float] = None,
+    ) -> float:
+        sleep_duration = self.__prepare_sleep(attempt, logging_method, retry_target, backoff)
+
+        await asyncio.sleep(sleep_duration)
+
+        return sleep_duration
+
+    def __prepare_sleep(
+        self,
+        attempt: int,
+        logging_method: Optional[Callable],
+        retry_target: Optional[str],
+        backoff: Optional[float],
     ) -> float:
-        sleep_duration = self.calc_backoff_time(attempt)
+        sleep_duration = self.calc_backoff_time(attempt) if backoff is None else backoff
 
         if logging_method and not self.__quiet:
             if retry_target:
@@ -67,6 +489,4 @@ class Retry:
 
             logging_method(msg)
 
-        time.sleep(sleep_duration)
-
         return sleep_duration
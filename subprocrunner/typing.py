@@ -1,4 +1,6 @@
-from typing import Sequence, Union
+from typing import IO, Any, Iterable, Mapping, Sequence, Union
 
 
 Command = Union[str, Sequence[str]]
+EnvMapping = Mapping[str, str]
+Input = Union[str, bytes, int, IO[Any], Iterable[Union[str, bytes]], None]
@@ -0,0 +1,81 @@
+import subprocess
+
+import pytest
+
+import subprocrunner.capture
+from subprocrunner.capture import Capture
+
+
+class Test_Capture_constructor:
+    @pytest.mark.parametrize(
+        ["kwargs", "expected"],
+        [
+            [{"mode": "unknown"}, ValueError],
+            [{"mode": Capture.FILE}, ValueError],
+            [{"mode": Capture.HEAD}, ValueError],
+            [{"mode": Capture.TAIL}, ValueError],
+            [{"mode": Capture.TAIL, "max_bytes": 1, "max_lines": 1}, ValueError],
+            [{"mode": Capture.HEAD, "max_bytes": 0}, ValueError],
+            [{"mode": Capture.TAIL, "max_lines": 0}, ValueError],
+        ],
+    )
+    def test_exception(self, kwargs, expected):
+        with pytest.raises(expected):
+            Capture(**kwargs)
+
+
+class Test_Capture_repr:
+    @pytest.mark.parametrize(
+        ["value", "expected"],
+        [
+            [Capture(), "Capture(mode=pipe)"],
+            [Capture.tail(max_lines=10), "Capture(mode=tail, max-lines=10)"],
+            [Capture.head(100), "Capture(mode=head, max-bytes=100)"],
+        ],
+    )
+    def test_normal(self, value, expected):
+        assert str(value) == expected
+
+
+class Test_Capture_open_stream:
+    def test_normal(self, tmp_path):
+        assert Capture().open_stream() == subprocess.PIPE
+        assert Capture.discard().open_stream() == subprocess.DEVNULL
+        assert Capture.to_file(1).open_stream() == 1
+
+        stream = Capture.to_file(str(tmp_path / "out.txt")).open_stream()
+        stream.close()
+
+
+class Test_Capture_make_buffer:
+    @pytest.mark.parametrize(
+        ["capture", "chunks", "expected"],
+        [
+            [Capture(), [b"abc", b"def"], b"abcdef"],
+            [Capture.head(4), [b"abc", b"def", b"ghi"], b"abcd"],
+            [Capture.tail(max_bytes=4), [b"abc", b"def", b"ghi"], b"fghi"],
+            [Capture.tail(max_bytes=4), [b"abcdefghi"], b"fghi"],
+            [Capture.tail(max_lines=2), [b"a\nb", b"c\nd\n", b"e"], b"d\ne"],
+            [Capture.tail(max_lines=2), [b"a\nb", b"c\nd\n"], b"bc\nd\n"],
+            [Capture.tail(max_lines=2), [b"a\n", b"", b"b\nc\n"], b"b\nc\n"],
+            [Capture.tail(max_lines=2), [b"a\r\nb\rc\n"], b"a\r\nb\rc\n"],
+            [Capture.tail(max_lines=1), [b"a\nb\nc\nd"], b"d"],
+        ],
+    )
+    def test_normal(self, capture, chunks, expected):
+        buffer = capture.make_buffer()
+        for chunk in chunks:
+            buffer.write(chunk)
+
+        assert buffer.getvalue() == expected
+
+    def test_normal_long_line(self, monkeypatch):
+        monkeypatch.setattr(subprocrunner.capture, "_MAX_LINE_BYTES", 4)
+        buffer = Capture.tail(max_lines=2).make_buffer()
+
+        for chunk in [b"abc", b"def", b"ghi"]:
+            buffer.write(chunk)
+        assert buffer.getvalue() == b"fghi"
+
+        buffer.write(b"jkl\nmnopqr\n")
+        assert buffer.getvalue() == b"ijkl\nopqr\n"
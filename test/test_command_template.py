@@ -0,0 +1,123 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+
+import pytest
+
+from subprocrunner import CommandError, CommandTemplate, RunnerPool, SubprocessRunner, Which
+
+
+class Test_CommandTemplate_constructor:
+    def test_normal(self):
+        template = CommandTemplate(["tc", "class", "show", "dev", "{dev}"], dry_run=True)
+
+        assert template.command == ["tc", "class", "show", "dev", "{dev}"]
+        assert template.fields == frozenset(["dev"])
+        assert template.dry_run
+
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            ["echo {value}", TypeError],
+            [["{command}", "hoge"], ValueError],
+            [["echo", "{value.__class__}"], ValueError],
+            [["echo", "{0}"], ValueError],
+            [["echo", "{}"], ValueError],
+            [["echo", "{value:{width}}"], ValueError],
+            [["echo", "{value"], ValueError],
+            [[], ValueError],
+        ],
+    )
+    def test_exception(self, command, expected):
+        with pytest.raises(expected):
+            CommandTemplate(command, dry_run=True)
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_exception_not_found(self):
+        with pytest.raises(CommandError):
+            CommandTemplate(["__not_exist_command__", "{value}"])
+
+
+class Test_CommandTemplate_format:
+    @pytest.mark.parametrize(
+        ["command", "params", "expected"],
+        [
+            [["echo", "{value}"], {"value": "a; rm -rf /"}, ["echo", "a; rm -rf /"]],
+            [["echo", "{value}"], {"value": 1}, ["echo", "1"]],
+            [["echo", "--opt={a}:{b}"], {"a": "x", "b": 2}, ["echo", "--opt=x:2"]],
+            [["echo", "{n:03d}", "{s!r}"], {"n": 7, "s": "x"}, ["echo", "007", "'x'"]],
+            [["echo", "{{literal}}", "{value}"], {"value": ""}, ["echo", "{literal}", ""]],
+            [["echo", "hoge"], {}, ["echo", "hoge"]],
+        ],
+    )
+    def test_normal(self, command, params, expected):
+        assert CommandTemplate(command, dry_run=True).format(**params) == expected
+
+    @pytest.mark.parametrize(
+        ["params"],
+        [
+            [{}],
+            [{"dev": "eth0", "unknown": 1}],
+        ],
+    )
+    def test_exception(self, params):
+        template = CommandTemplate(["tc", "class", "show", "dev", "{dev}"], dry_run=True)
+
+        with pytest.raises(ValueError):
+            template.format(**params)
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_CommandTemplate_runner:
+    def test_normal(self):
+        template = CommandTemplate(["echo", "{value}"])
+        runner = template.runner(value="hoge $HOME")
+
+        assert runner.command == ["echo", "hoge $HOME"]
+        assert runner.command_str == "echo hoge $HOME"
+        assert runner.run() == 0
+        assert runner.stdout.strip() == "hoge $HOME"
+
+        # runners are independent of each other
+        assert template.runner(value="foo").execute().stdout.strip() == "foo"
+        assert runner.stdout.strip() == "hoge $HOME"
+
+    def test_normal_attributes(self):
+        kwargs = {"quiet": True, "output_encoding": "utf-8", "start_new_session": True}
+        runner = CommandTemplate(["echo", "{value}"], **kwargs).runner(value="hoge")
+        expected = SubprocessRunner(["echo", "hoge"], **kwargs)
+
+        # the bound runner is built without the constructor
+        assert vars(runner).keys() == vars(expected).keys()
+        assert runner.output_encoding == expected.output_encoding
+        assert runner.start_new_session
+
+    def test_normal_resolve_once(self, mocker):
+        spy = mocker.spy(Which, "verify")
+        template = CommandTemplate(["echo", "{value}"], use_abspath=True)
+
+        for i in range(3):
+            runner = template.runner(value=i)
+            assert runner.run() == 0
+            assert runner.stdout.strip() == str(i)
+
+        assert spy.call_count == 1
+
+    def test_normal_dry_run(self):
+        template = CommandTemplate(["__not_exist_command__", "{value}"], dry_run=True)
+        runner = template.runner(value="hoge")
+
+        assert runner.dry_run
+        assert runner.run() == 0
+        assert runner.stdout == ""
+
+    def test_normal_runner_pool(self):
+        template = CommandTemplate(["echo", "{value}"])
+        runners = RunnerPool(max_workers=4).run_many(
+            template.runners({"value": i} for i in range(10))
+        )
+
+        assert all(isinstance(runner, SubprocessRunner) for runner in runners)
+        assert [runner.stdout.strip() for runner in runners] == [str(i) for i in range(10)]
@@ -0,0 +1,87 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+
+import pytest
+
+from subprocrunner import Env, SubprocessRunner
+from subprocrunner._env import get_env
+
+
+class Test_Env:
+    def test_normal(self, monkeypatch):
+        monkeypatch.setenv("SUBPROCRUNNER_TEST", "base")
+
+        env = Env({"A": "1"})
+        assert env["A"] == "1"
+        assert env["SUBPROCRUNNER_TEST"] == "base"
+
+        overlay = env.overlay({"A": "2", "B": "3"})
+        assert isinstance(overlay, Env)
+        assert (overlay["A"], overlay["B"]) == ("2", "3")
+        assert env["A"] == "1"
+
+        assert Env({"A": "1"}, base={}) == {"A": "1"}
+
+
+class Test_get_env:
+    def test_normal(self):
+        env = {"A": "1"}
+
+        assert get_env(env) is env
+        assert get_env(env, {"B": "2"}) == {"A": "1", "B": "2"}
+        assert env == {"A": "1"}
+
+    @pytest.mark.skipif(platform.system() != "Linux", reason="platform dependent tests")
+    def test_normal_default(self, monkeypatch):
+        monkeypatch.setenv("SUBPROCRUNNER_TEST", "1")
+        env = get_env()
+        assert env["LC_ALL"] == "C"
+        assert env["SUBPROCRUNNER_TEST"] == "1"
+
+        # changes of os.environ are applied to the next call
+        monkeypatch.setenv("SUBPROCRUNNER_TEST", "2")
+        assert get_env()["SUBPROCRUNNER_TEST"] == "2"
+
+        overlay = get_env(overrides={"SUBPROCRUNNER_TEST": "3"})
+        assert overlay["SUBPROCRUNNER_TEST"] == "3"
+        assert overlay["LC_ALL"] == "C"
+        assert os.environ["SUBPROCRUNNER_TEST"] == "2"
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_env:
+    @pytest.mark.parametrize(
+        ["kwargs", "expected"],
+        [
+            [{"env_overrides": {"SUBPROCRUNNER_TEST": "overrides"}}, "overrides"],
+            [{"env": Env({"SUBPROCRUNNER_TEST": "env"})}, "env"],
+            [
+                {
+                    "env": Env({"SUBPROCRUNNER_TEST": "env"}),
+                    "env_overrides": {"SUBPROCRUNNER_TEST": "overrides"},
+                },
+                "overrides",
+            ],
+        ],
+    )
+    def test_normal(self, kwargs, expected):
+        runner = SubprocessRunner('echo "$SUBPROCRUNNER_TEST"')
+        runner.run(**kwargs)
+        assert runner.stdout.strip() == expected
+
+        proc = SubprocessRunner('echo "$SUBPROCRUNNER_TEST"').popen(**kwargs)
+        stdout, _stderr = proc.communicate()
+        assert stdout.decode().strip() == expected
+
+    def test_normal_environ_changed(self, monkeypatch):
+        runner = SubprocessRunner('echo "$SUBPROCRUNNER_TEST"')
+
+        monkeypatch.setenv("SUBPROCRUNNER_TEST", "a")
+        assert runner.execute().stdout.strip() == "a"
+
+        monkeypatch.setenv("SUBPROCRUNNER_TEST", "b")
+        assert runner.execute().stdout.strip() == "b"
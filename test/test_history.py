@@ -0,0 +1,137 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+import subprocess
+import threading
+
+import pytest
+
+from subprocrunner import HistoryRecord, Retry, SubprocessRunner
+from subprocrunner._history import CommandHistory
+
+
+def make_record(command, returncode=0, duration=0.0):
+    return HistoryRecord(command=command, returncode=returncode, start_time=0, duration=duration)
+
+
+class Test_HistoryRecord_repr:
+    def test_normal(self):
+        assert str(
+            HistoryRecord(
+                command="ls",
+                returncode=0,
+                start_time=1,
+                duration=0.5,
+                retry_attempt=1,
+                dry_run=True,
+            )
+        ) == (
+            "HistoryRecord(command='ls', returncode=0, start_time=1.000000, "
+            "duration=0.500000, retry_attempt=1, dry_run=True)"
+        )
+
+
+class Test_CommandHistory:
+    def test_normal_maxlen(self):
+        history = CommandHistory(maxlen=3)
+        for i in range(5):
+            history.append(make_record(str(i)), maxlen=3)
+        assert [record.command for record in history.records()] == ["2", "3", "4"]
+
+        history.append(make_record("5"), maxlen=2)
+        assert [record.command for record in history.records()] == ["4", "5"]
+
+        history.clear()
+        assert len(history) == 0
+
+    def test_normal_query(self):
+        history = CommandHistory(maxlen=10)
+        for record in [
+            make_record("ip link show", duration=0.3),
+            make_record("ip addr show", returncode=1, duration=0.1),
+            make_record("tc qdisc show", returncode=None, duration=0.5),
+        ]:
+            history.append(record, maxlen=10)
+
+        assert [record.command for record in history.slowest(2)] == [
+            "tc qdisc show",
+            "ip link show",
+        ]
+        assert [record.command for record in history.failures()] == [
+            "ip addr show",
+            "tc qdisc show",
+        ]
+        assert [record.command for record in history.find("ip ")] == [
+            "ip link show",
+            "ip addr show",
+        ]
+
+    def test_normal_threads(self):
+        history = CommandHistory(maxlen=100)
+
+        def append():
+            for i in range(1000):
+                history.append(make_record(str(i)), maxlen=100)
+
+        threads = [threading.Thread(target=append) for _i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(history) == 100
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_history_records:
+    @pytest.fixture(autouse=True)
+    def save_history(self, monkeypatch):
+        monkeypatch.setattr(SubprocessRunner, "is_save_history", True)
+        SubprocessRunner.clear_history()
+        yield
+        SubprocessRunner.clear_history()
+
+    def test_normal(self):
+        SubprocessRunner(["echo", "test"]).run()
+        SubprocessRunner(["ls", "__not_exist_dir__"]).run(
+            retry=Retry(total=1, backoff_factor=0.01, jitter=0.01)
+        )
+        SubprocessRunner(["echo", "dry-run"], dry_run=True).run()
+
+        records = SubprocessRunner.get_history_records()
+        assert [
+            (record.command, record.returncode == 0, record.retry_attempt, record.dry_run)
+            for record in records
+        ] == [
+            ("echo test", True, None, False),
+            ("ls __not_exist_dir__", False, None, False),
+            ("ls __not_exist_dir__", False, 1, False),
+            ("echo dry-run", True, None, True),
+        ]
+        assert all(record.duration >= 0 for record in records)
+        assert [record.command for record in SubprocessRunner.get_failed_history()] == [
+            "ls __not_exist_dir__"
+        ] * 2
+        assert len(SubprocessRunner.find_history("echo")) == 2
+        assert len(SubprocessRunner.get_slowest_history(1)) == 1
+
+    def test_normal_timeout(self):
+        runner = SubprocessRunner(["sleep", "10"])
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            list(runner.iter_lines(timeout=0.1))
+
+        records = SubprocessRunner.get_history_records()
+        assert len(records) == 1
+        assert records[0].returncode is None
+        assert records[0].duration >= 0.1
+
+    def test_normal_history_size(self, monkeypatch):
+        monkeypatch.setattr(SubprocessRunner, "history_size", 2)
+
+        for i in range(3):
+            SubprocessRunner(["echo", str(i)]).run()
+
+        assert SubprocessRunner.get_history() == ["echo 1", "echo 2"]
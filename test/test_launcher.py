@@ -0,0 +1,134 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+from subprocess import PIPE
+
+import pytest
+
+from subprocrunner._launcher import LauncherPopen, launcher
+
+
+pytestmark = pytest.mark.skipif(
+    platform.system() == "Windows", reason="launcher is not supported on Windows"
+)
+
+
+class Test_LauncherPopen:
+    @pytest.mark.parametrize(
+        ["args", "shell", "input", "expected"],
+        [
+            [
+                ["sh", "-c", "echo hoge; echo foo >&2; exit 3"],
+                False,
+                None,
+                (b"hoge\n", b"foo\n", 3),
+            ],
+            ["cat", True, b"test", (b"test", b"", 0)],
+            ["exit 1", True, None, (b"", b"", 1)],
+        ],
+    )
+    def test_normal(self, args, shell, input, expected):
+        proc = LauncherPopen(args, shell=shell, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = proc.communicate(input)
+
+        assert proc.is_launched
+        assert (stdout, stderr, proc.returncode) == expected
+        assert proc.rusage is not None
+
+    def test_normal_env_cwd(self, tmpdir):
+        proc = LauncherPopen(
+            "echo $SUBPROCRUNNER_TEST; pwd",
+            shell=True,
+            stdout=PIPE,
+            env={"SUBPROCRUNNER_TEST": "hoge", "PATH": os.environ["PATH"]},
+            cwd=str(tmpdir),
+        )
+        stdout, _stderr = proc.communicate()
+
+        assert stdout.decode().splitlines() == ["hoge", os.path.realpath(str(tmpdir))]
+
+    def test_normal_timeout(self):
+        proc = LauncherPopen(["sleep", "10"])
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            proc.wait(timeout=0.1)
+        assert proc.poll() is None
+
+        proc.kill()
+        assert proc.wait() == -signal.SIGKILL
+
+    def test_normal_signal_after_exit(self):
+        proc = LauncherPopen(["sh", "-c", "exit 3"], stdout=PIPE)
+        assert proc.stdout.read() == b""
+        time.sleep(0.1)
+
+        # the exited process is not reaped until the exit is acknowledged
+        os.kill(proc.pid, 0)
+        proc.kill()
+
+        assert proc.wait() == 3
+        proc.kill()
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requires procfs")
+    def test_normal_fds_not_inherited(self):
+        proc = LauncherPopen(["ls", "/proc/self/fd"], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+        stdout, _stderr = proc.communicate()
+
+        assert proc.is_launched
+        # the standard streams and the directory opened by ls
+        assert len(stdout.split()) <= 4
+
+    def test_normal_restart(self):
+        assert LauncherPopen(["true"]).wait() == 0
+        pid = launcher.pid
+
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+        # fall back to create the process in the caller, or restart the launcher
+        assert LauncherPopen(["true"]).wait() == 0
+        assert LauncherPopen(["true"]).wait() == 0
+        assert launcher.is_running()
+        assert launcher.pid != pid
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requires procfs")
+    def test_normal_launcher_exited(self):
+        proc = LauncherPopen(["sleep", "10"])
+        pid = launcher.pid
+
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+        # the exit status is unknown: the orphaned process is killed
+        assert proc.wait(timeout=5) == -signal.SIGKILL
+        for _i in range(50):
+            try:
+                with open(f"/proc/{proc.pid}/stat") as f:
+                    state = f.read().rsplit(")", 1)[1].split()[0]
+            except FileNotFoundError:
+                break
+            if state == "Z":
+                break
+            time.sleep(0.1)
+        else:
+            pytest.fail("the orphaned process is still running")
+
+    def test_normal_fallback(self, monkeypatch):
+        launcher.stop()
+        monkeypatch.setattr(sys, "executable", "")
+
+        proc = LauncherPopen(["sh", "-c", "exit 2"])
+
+        assert not proc.is_launched
+        assert proc.wait() == 2
+
+    def test_exception(self):
+        with pytest.raises(FileNotFoundError):
+            LauncherPopen(["__not_exist_command__"], stdout=PIPE, stderr=PIPE)
@@ -0,0 +1,147 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+import subprocess
+import time
+
+import pytest
+
+import subprocrunner._pipeline
+import subprocrunner._subprocess_runner
+from subprocrunner import CalledProcessError, Pipeline, SubprocessRunner
+from subprocrunner.retry import Retry
+
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+
+
+class Test_Pipeline_repr:
+    def test_normal(self):
+        pipeline = Pipeline([["echo", "hoge"], "tr a-z A-Z"])
+
+        assert len(pipeline) == 2
+        assert pipeline.command_str == "echo hoge | tr a-z A-Z"
+        assert (
+            str(pipeline)
+            == "Pipeline(command='echo hoge | tr a-z A-Z', returncodes='not yet executed')"
+        )
+
+
+class Test_Pipeline_run:
+    def test_normal(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        pipeline = Pipeline([["printf", "b\\na\\nc\\n"], ["sort"], ["head", "-n", "2"]])
+
+        assert pipeline.run() == 0
+        assert pipeline.stdout == "a\nb\n"
+        assert pipeline.returncodes == [0, 0, 0]
+        assert pipeline.stderrs == ["", "", ""]
+        assert spy.call_count == 3
+
+    def test_normal_input(self):
+        pipeline = Pipeline([["cat"], ["tr", "a-z", "A-Z"]])
+
+        assert pipeline.run(input="hoge") == 0
+        assert pipeline.stdout == "HOGE"
+
+    def test_normal_input_stream(self):
+        pipeline = Pipeline([["cat"], ["tr", "a-z", "A-Z"]])
+
+        assert pipeline.run(input=iter(["ho", "ge"])) == 0
+        assert pipeline.stdout == "HOGE"
+
+    def test_normal_large_output(self):
+        pipeline = Pipeline([["head", "-c", "1000000", "/dev/zero"], ["cat"], ["wc", "-c"]])
+
+        assert pipeline.run() == 0
+        assert pipeline.stdout.strip() == "1000000"
+
+    def test_normal_output_encoding(self, mocker):
+        spy = mocker.spy(subprocrunner._pipeline, "decode_output")
+        pipeline = Pipeline([["printf", "h\\000i\\000"], ["cat"]], output_encoding="utf-16-le")
+
+        assert pipeline.run() == 0
+        assert pipeline.output_encoding == "utf-16-le"
+        assert pipeline.stdout == "hi"
+        assert pipeline.stdout == "hi"
+        # decoded once
+        assert [call[0][0] for call in spy.call_args_list] == [b"h\x00i\x00"]
+
+    @pytest.mark.parametrize(
+        ["kwargs", "default_error_log_level", "expected"],
+        [
+            [{}, "ERROR", "ERROR"],
+            [{"error_log_level": "INFO"}, "ERROR", "INFO"],
+            [{"quiet": True}, "ERROR", "QUIET"],
+        ],
+    )
+    def test_normal_error_log_level(
+        self, mocker, monkeypatch, kwargs, default_error_log_level, expected
+    ):
+        monkeypatch.setattr(SubprocessRunner, "default_error_log_level", default_error_log_level)
+        spy = mocker.spy(subprocrunner._pipeline, "get_logging_method")
+
+        Pipeline([["false"]], **kwargs)
+
+        assert spy.call_args_list[0][0][0] == expected
+
+    def test_normal_env(self):
+        pipeline = Pipeline()
+        pipeline.pipe(["sh", "-c", "echo $A-$B"], env_overrides={"B": "stage"})
+        pipeline.pipe(["sh", "-c", "cat; echo $A-$B"])
+
+        assert pipeline.run(env_overrides={"A": "pipeline"}) == 0
+        assert pipeline.stdout == "pipeline-stage\npipeline-\n"
+
+    @pytest.mark.parametrize(
+        ["pipefail", "expected"],
+        [[True, 3], [False, 0]],
+    )
+    def test_normal_pipefail(self, pipefail, expected):
+        pipeline = Pipeline([["sh", "-c", "echo hoge >&2; exit 3"], ["cat"]], pipefail=pipefail)
+
+        assert pipeline.run() == expected
+        assert pipeline.returncodes == [3, 0]
+        assert pipeline.stderrs == ["hoge\n", ""]
+
+    def test_normal_dry_run(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        pipeline = Pipeline([SubprocessRunner(["false"], dry_run=True), ["cat"]])
+
+        assert pipeline.run() == 0
+        assert pipeline.returncodes == [0, 0]
+        assert spy.call_count == 0
+
+    def test_normal_retry(self, tmp_path):
+        counter = tmp_path / "counter"
+        command = f"echo x >> {counter}; test $(wc -l < {counter}) -ge 2"
+        pipeline = Pipeline([command, ["cat"]])
+
+        assert pipeline.run(retry=Retry(total=3, backoff_factor=0.01, jitter=0.01)) == 0
+        assert counter.read_text() == "x\nx\n"
+
+    def test_exception_check(self):
+        pipeline = Pipeline([["sh", "-c", "echo hoge >&2; exit 2"], ["cat"]])
+
+        with pytest.raises(CalledProcessError) as e:
+            pipeline.run(check=True)
+
+        assert e.value.returncode == 2
+        assert e.value.cmd == pipeline.command_str
+        assert e.value.stderr == "hoge\n"
+
+    def test_exception_timeout(self):
+        pipeline = Pipeline([["sh", "-c", "echo hoge; exec sleep 10"], ["cat"]])
+
+        started = time.monotonic()
+        with pytest.raises(subprocess.TimeoutExpired) as e:
+            pipeline.run(timeout=0.5)
+
+        assert time.monotonic() - started < 5
+        assert e.value.output == b"hoge\n"
+
+    def test_exception_empty(self):
+        with pytest.raises(ValueError):
+            Pipeline().run()
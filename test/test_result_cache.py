@@ -0,0 +1,223 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+import re
+import threading
+import time
+
+import pytest
+
+import subprocrunner._subprocess_runner
+from subprocrunner import CalledProcessError, ResultCache, SubprocessRunner
+from subprocrunner._result_cache import CachedResult
+
+
+def make_result(stdout=b"", returncode=0):
+    return CachedResult(returncode=returncode, stdout=stdout, stderr=b"")
+
+
+class Test_ResultCache_constructor:
+    @pytest.mark.parametrize(
+        ["kwargs"],
+        [[{"ttl": 0}], [{"maxsize": 0}], [{"max_bytes": 0}]],
+    )
+    def test_exception(self, kwargs):
+        with pytest.raises(ValueError):
+            ResultCache(**kwargs)
+
+
+class Test_ResultCache_get:
+    def test_normal(self):
+        cache = ResultCache()
+        key = cache.make_key(["echo", "hoge"], None, None)
+
+        assert cache.get(key) is None
+        cache.put(key, make_result(b"hoge\n"))
+        assert cache.get(key) == make_result(b"hoge\n")
+
+        info = cache.cache_info()
+        assert (info.hits, info.misses, info.currsize, info.currbytes) == (1, 1, 1, 5)
+
+    def test_normal_key(self):
+        cache = ResultCache()
+        keys = [
+            cache.make_key(["echo", "hoge"], None, None),
+            cache.make_key("echo hoge", None, None),
+            cache.make_key(["echo", "hoge"], {"A": "1"}, None),
+            cache.make_key(["echo", "hoge"], None, "input"),
+        ]
+
+        assert len(set(keys)) == len(keys)
+        assert cache.make_key(("echo", "hoge"), {"A": "1"}, None) == keys[2]
+
+    def test_normal_ttl(self):
+        cache = ResultCache(ttl=0.1)
+        key = cache.make_key("true", None, None)
+
+        cache.put(key, make_result())
+        assert cache.get(key) is not None
+
+        time.sleep(0.2)
+        assert cache.get(key) is None
+        assert len(cache) == 0
+
+    def test_normal_lru(self):
+        cache = ResultCache(maxsize=2)
+        keys = [cache.make_key(str(i), None, None) for i in range(3)]
+
+        cache.put(keys[0], make_result())
+        cache.put(keys[1], make_result())
+        cache.get(keys[0])
+        cache.put(keys[2], make_result())
+
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) is not None
+        assert cache.cache_info().evictions == 1
+
+    def test_normal_max_bytes(self):
+        cache = ResultCache(max_bytes=10)
+        keys = [cache.make_key(str(i), None, None) for i in range(3)]
+
+        cache.put(keys[0], make_result(b"12345"))
+        cache.put(keys[1], make_result(b"12345"))
+        cache.put(keys[2], make_result(b"1"))
+        assert cache.get(keys[0]) is None
+        assert cache.cache_info().currbytes == 6
+
+        # larger than max_bytes
+        cache.put(keys[0], make_result(b"1" * 11))
+        assert cache.get(keys[0]) is None
+
+    @pytest.mark.parametrize(
+        ["cache_failures", "expected"],
+        [[False, None], [True, make_result(returncode=1)]],
+    )
+    def test_normal_failures(self, cache_failures, expected):
+        cache = ResultCache(cache_failures=cache_failures)
+        key = cache.make_key("false", None, None)
+
+        cache.put(key, make_result(returncode=1))
+        assert cache.get(key) == expected
+
+
+class Test_ResultCache_invalidate:
+    def test_normal(self):
+        cache = ResultCache()
+        for input in ["a", "b"]:
+            cache.put(cache.make_key(["cat"], None, input), make_result())
+        cache.put(cache.make_key(["true"], None, None), make_result())
+
+        assert cache.invalidate(["cat"]) == 2
+        assert len(cache) == 1
+
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.cache_info().misses == 0
+
+
+class Test_ResultCache_get_or_execute:
+    def test_normal_singleflight(self):
+        cache = ResultCache(singleflight=True)
+        key = cache.make_key("sleep", None, None)
+        started = threading.Event()
+        call_count = 0
+        results = []
+
+        def execute():
+            nonlocal call_count
+            call_count += 1
+            started.set()
+            time.sleep(0.3)
+            return make_result(b"done")
+
+        def run():
+            results.append(cache.get_or_execute(key, execute))
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run) for _i in range(3)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert call_count == 1
+        assert sorted(is_cached for _result, is_cached in results) == [False, True, True, True]
+        assert cache.cache_info().shared == 3
+
+    def test_exception_singleflight(self):
+        cache = ResultCache(singleflight=True)
+
+        def execute():
+            raise RuntimeError()
+
+        with pytest.raises(RuntimeError):
+            cache.get_or_execute(cache.make_key("x", None, None), execute)
+        assert len(cache) == 0
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_result_cache:
+    def test_normal(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        cache = ResultCache(ttl=60)
+
+        for _i in range(3):
+            runner = SubprocessRunner(["echo", "hoge"], result_cache=cache)
+            assert runner.run() == 0
+            assert runner.stdout == "hoge\n"
+            assert runner.stderr == ""
+
+        assert spy.call_count == 1
+        assert cache.cache_info().hits == 2
+
+        # different inputs/environment variables
+        SubprocessRunner(["echo", "hoge"], result_cache=cache).run(env_overrides={"A": "1"})
+        SubprocessRunner(["cat"], result_cache=cache).run(input="a")
+        SubprocessRunner(["cat"], result_cache=cache).run(input="b")
+        assert spy.call_count == 4
+
+        # not cacheable
+        SubprocessRunner(["echo", "hoge"], result_cache=cache).run(on_stdout_line=print)
+        assert spy.call_count == 5
+
+        cache.invalidate(["echo", "hoge"])
+        SubprocessRunner(["echo", "hoge"], result_cache=cache).run()
+        assert spy.call_count == 6
+
+    def test_normal_check(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        cache = ResultCache(cache_failures=True)
+        command = ["sh", "-c", "echo hoge >&2; exit 2"]
+
+        for _i in range(2):
+            runner = SubprocessRunner(command, result_cache=cache)
+            with pytest.raises(CalledProcessError) as e:
+                runner.run(check=True)
+
+            assert e.value.returncode == 2
+            assert runner.stderr == "hoge\n"
+
+        assert spy.call_count == 1
+
+    def test_normal_ignore_stderr_regexp(self):
+        cache = ResultCache(cache_failures=True)
+        command = ["sh", "-c", "echo hoge >&2; exit 2"]
+
+        for _i in range(2):
+            runner = SubprocessRunner(
+                command, ignore_stderr_regexp=re.compile("hoge"), result_cache=cache
+            )
+            assert runner.run(check=True) == 2
+
+        assert cache.cache_info().hits == 1
+
+    def test_normal_dry_run(self):
+        cache = ResultCache()
+
+        assert SubprocessRunner(["echo", "hoge"], dry_run=True, result_cache=cache).run() == 0
+        assert len(cache) == 0
@@ -1,6 +1,11 @@
+import asyncio
+import re
+import time
+
 import pytest
 
-from subprocrunner.retry import Retry
+from subprocrunner import CircuitOpenError
+from subprocrunner.retry import CircuitBreaker, Retry, RetryBudget
 
 
 class Test_Retry_repr:
@@ -9,6 +14,52 @@ class Test_Retry_repr:
             str(Retry(backoff_factor=0.5, jitter=0.5))
             == "Retry(total=3, backoff-factor=0.5, jitter=0.5)"
         )
+        assert str(
+            Retry(retry_on_returncodes=[75], retry_on_stderr=["again"], max_backoff=1, deadline=5)
+        ) == (
+            "Retry(total=3, backoff-factor=0.2, jitter=0.2, retry-on-returncodes=[75], "
+            "retry-on-stderr=['again'], max-backoff=1, deadline=5)"
+        )
+
+
+class Test_Retry_constructor:
+    @pytest.mark.parametrize(
+        ["kwargs"],
+        [
+            [{"total": 0}],
+            [{"backoff_strategy": "linear"}],
+            [{"max_backoff": 0}],
+            [{"deadline": 0}],
+        ],
+    )
+    def test_exception(self, kwargs):
+        with pytest.raises(ValueError):
+            Retry(**kwargs)
+
+
+class Test_Retry_is_retryable:
+    @pytest.mark.parametrize(
+        ["kwargs", "returncode", "stderr", "expected"],
+        [
+            [{}, 0, None, False],
+            [{}, 1, None, True],
+            [{"no_retry_returncodes": [2]}, 2, None, False],
+            [{"retry_on_returncodes": [75]}, 75, None, True],
+            [{"retry_on_returncodes": [75]}, 1, None, False],
+            [
+                {"retry_on_stderr": ["temporarily unavailable"]},
+                1,
+                "Resource temporarily unavailable",
+                True,
+            ],
+            [{"retry_on_stderr": [re.compile("^busy")]}, 1, "not busy", False],
+            [{"retry_on_stderr": ["busy"]}, 1, None, False],
+            [{"retry_on_returncodes": [75], "retry_on_stderr": ["busy"]}, 1, "busy", True],
+            [{"retry_on_returncodes": [75], "no_retry_returncodes": [75]}, 75, None, False],
+        ],
+    )
+    def test_normal(self, kwargs, returncode, stderr, expected):
+        assert Retry(**kwargs).is_retryable(returncode, stderr) is expected
 
 
 class Test_Retry_calc_backoff_time:
@@ -38,6 +89,163 @@ class Test_Retry_calc_backoff_time:
             )
 
 
+class Test_Retry_calc_backoff_time_strategy:
+    def test_normal_decorrelated_jitter(self):
+        retry = Retry(backoff_factor=0.1, backoff_strategy=Retry.DECORRELATED_JITTER)
+        previous = None
+
+        for attempt in range(1, 100):
+            backoff = retry.calc_backoff_time(attempt, previous)
+            assert 0.1 <= backoff <= max(0.1, (previous or 0.1) * 3)
+            previous = backoff
+
+    @pytest.mark.parametrize(
+        ["backoff_strategy"],
+        [[Retry.EXPONENTIAL], [Retry.DECORRELATED_JITTER]],
+    )
+    def test_normal_max_backoff(self, backoff_strategy):
+        retry = Retry(backoff_factor=1, backoff_strategy=backoff_strategy, max_backoff=1.5)
+
+        assert retry.calc_backoff_time(10, previous=100) <= 1.5
+
+
+class Test_Retry_next_backoff:
+    def test_normal(self):
+        retry = Retry(total=2, backoff_factor=0.1, jitter=0.1)
+        started = time.monotonic()
+
+        assert retry.next_backoff(1, started) is not None
+        assert retry.next_backoff(2, started) is not None
+        assert retry.next_backoff(3, started) is None
+
+    def test_normal_deadline(self):
+        retry = Retry(total=10, backoff_factor=1, jitter=0.1, deadline=2)
+        started = time.monotonic()
+
+        assert retry.next_backoff(1, started) is not None
+        assert retry.next_backoff(1, started - 1) is None
+
+
+class Test_RetryBudget:
+    def test_normal(self):
+        budget = RetryBudget(max_tokens=2, token_ratio=0.5)
+
+        assert budget.try_acquire()
+        assert budget.try_acquire()
+        assert not budget.try_acquire()
+
+        budget.record_success()
+        assert not budget.try_acquire()
+        budget.record_success()
+        assert budget.try_acquire()
+
+        info = budget.budget_info()
+        assert (info.tokens, info.acquired, info.denied) == (0, 3, 2)
+
+        for _i in range(10):
+            budget.record_success()
+        assert budget.budget_info().tokens == 2
+
+        budget.reset()
+        assert budget.budget_info().denied == 0
+
+    def test_normal_retry(self):
+        budget = RetryBudget(max_tokens=3)
+        retry = Retry(total=10, budget=budget)
+        started = time.monotonic()
+
+        assert [retry.next_backoff(i, started) is not None for i in range(1, 6)] == [
+            True,
+            True,
+            True,
+            False,
+            False,
+        ]
+
+        retry.after_attempt("true", 0)
+        assert budget.budget_info().tokens == pytest.approx(0.1)
+
+    @pytest.mark.parametrize(
+        ["kwargs"],
+        [[{"max_tokens": 0}], [{"token_ratio": 0}]],
+    )
+    def test_exception(self, kwargs):
+        with pytest.raises(ValueError):
+            RetryBudget(**kwargs)
+
+
+class Test_CircuitBreaker:
+    def test_normal(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        key = "false"
+
+        breaker.before_call(key)
+        breaker.record_failure(key)
+        assert breaker.state(key) == CircuitBreaker.CLOSED
+        breaker.record_failure(key)
+        assert breaker.state(key) == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError) as e:
+            breaker.before_call(key)
+        assert e.value.cmd == key
+        assert 0 < e.value.retry_after <= 0.2
+
+        # other commands are not affected
+        breaker.before_call("true")
+
+        # half-open: allow only a trial
+        time.sleep(0.3)
+        assert breaker.state(key) == CircuitBreaker.HALF_OPEN
+        breaker.before_call(key)
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call(key)
+
+        # the trial failed
+        breaker.record_failure(key)
+        assert breaker.state(key) == CircuitBreaker.OPEN
+
+        time.sleep(0.3)
+        assert breaker.before_call(key) is True
+        breaker.record_success(key)
+        assert breaker.state(key) == CircuitBreaker.CLOSED
+        assert breaker.before_call(key) is False
+
+    def test_normal_release_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        key = "false"
+        breaker.record_failure(key)
+        time.sleep(0.2)
+
+        retry = Retry(circuit_breaker=breaker)
+        with pytest.raises(KeyboardInterrupt):
+            with retry.track_attempt(key, retry.before_attempt(key)):
+                raise KeyboardInterrupt()
+
+        # the interrupted trial does not block another trial
+        assert breaker.state(key) == CircuitBreaker.HALF_OPEN
+        assert retry.before_attempt(key) is True
+
+    def test_normal_reset(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure("a")
+        breaker.record_failure("b")
+
+        breaker.reset("a")
+        assert breaker.state("a") == CircuitBreaker.CLOSED
+        assert breaker.state("b") == CircuitBreaker.OPEN
+
+        breaker.reset()
+        assert breaker.state("b") == CircuitBreaker.CLOSED
+
+    @pytest.mark.parametrize(
+        ["kwargs"],
+        [[{"failure_threshold": 0}], [{"reset_timeout": 0}]],
+    )
+    def test_exception(self, kwargs):
+        with pytest.raises(ValueError):
+            CircuitBreaker(**kwargs)
+
+
 class Test_Retry_sleep_before_retry:
     def test_normal(self):
         attempt = 1
@@ -52,3 +260,19 @@ class Test_Retry_sleep_before_retry:
             <= retry.sleep_before_retry(attempt=attempt)
             <= (base_time + jitter * 1.5)
         )
+
+
+class Test_Retry_async_sleep_before_retry:
+    def test_normal(self):
+        attempt = 1
+        coef = 2 ** max(0, attempt - 1)
+        backoff_factor = 0.1
+        jitter = 0.1
+        base_time = backoff_factor * coef
+        retry = Retry(backoff_factor=backoff_factor, jitter=jitter)
+
+        assert (
+            (base_time - jitter * 0.5)
+            <= asyncio.run(retry.async_sleep_before_retry(attempt=attempt))
+            <= (base_time + jitter * 1.5)
+        )
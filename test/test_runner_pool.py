@@ -0,0 +1,126 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+import signal
+import subprocess
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from subprocrunner import RunnerPool, SubprocessRunner, run_many
+from subprocrunner.error import CalledProcessError
+from subprocrunner.retry import Retry
+
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+
+
+class Test_RunnerPool_constructor:
+    @pytest.mark.parametrize(["value", "expected"], [[0, ValueError], [-1, ValueError]])
+    def test_exception(self, value, expected):
+        with pytest.raises(expected):
+            RunnerPool(max_workers=value)
+
+
+class Test_RunnerPool_run_many:
+    def test_normal(self):
+        commands = [["echo", str(i)] for i in range(20)]
+        runners = RunnerPool(max_workers=4).run_many(commands)
+
+        assert len(runners) == len(commands)
+        for i, runner in enumerate(runners):
+            assert runner.returncode == 0
+            assert runner.stdout.strip() == str(i)
+
+    def test_normal_mixed_commands(self):
+        runner = SubprocessRunner(["echo", "runner"])
+        runners = run_many(["echo str", ["echo", "list"], runner], max_workers=2)
+
+        assert [r.stdout.strip() for r in runners] == ["str", "list", "runner"]
+        assert runners[2] is runner
+
+    def test_normal_collect_all(self):
+        commands = [["ls", "__not_exist_dir__"], ["echo", "test"]]
+
+        runners = RunnerPool(max_workers=2).run_many(commands)
+        assert runners[0].returncode != 0
+        assert runners[1].returncode == 0
+
+        runner = SubprocessRunner(["echo", "executed"])
+        with pytest.raises(CalledProcessError):
+            RunnerPool(max_workers=1).run_many([commands[0], runner], check=True)
+        assert runner.returncode == 0
+
+    def test_exception_fail_fast(self):
+        runners = [SubprocessRunner(["sleep", "0.1"]) for _i in range(5)]
+
+        with pytest.raises(CalledProcessError):
+            RunnerPool(max_workers=1).run_many(
+                [["ls", "__not_exist_dir__"]] + runners, check=True, fail_fast=True
+            )
+        assert any(runner.returncode is None for runner in runners)
+
+    @pytest.mark.parametrize(["method"], [["run_many"], ["iter_completed"]])
+    def test_exception_fail_fast_kill(self, method):
+        runner = SubprocessRunner(["sleep", "10"])
+        commands = [runner, ["sh", "-c", "sleep 0.2; exit 1"]]
+
+        with pytest.raises(CalledProcessError):
+            list(getattr(RunnerPool(max_workers=2), method)(commands, check=True, fail_fast=True))
+
+        # the process in progress is killed
+        deadline = time.monotonic() + 2
+        while runner.returncode is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert runner.returncode == -signal.SIGKILL
+
+    def test_exception_timeout(self):
+        with pytest.raises(subprocess.TimeoutExpired):
+            RunnerPool(max_workers=2).run_many([["sleep", "3"], ["echo", "test"]], timeout=0.1)
+
+    def test_exception_total_timeout(self):
+        with pytest.raises(TimeoutError):
+            RunnerPool(max_workers=1).run_many(
+                [["sleep", "0.3"], ["sleep", "0.3"]], timeout=1, total_timeout=0.1
+            )
+
+    @pytest.mark.parametrize(
+        ["method", "retry"],
+        [
+            ["run_many", None],
+            ["run_many", Retry(total=3, backoff_factor=0.01, jitter=0.01)],
+            ["iter_completed", None],
+        ],
+    )
+    def test_exception_total_timeout_kill(self, method, retry):
+        runner = SubprocessRunner(["sleep", "10"])
+
+        with pytest.raises(TimeoutError):
+            list(getattr(RunnerPool(), method)([runner], total_timeout=0.2, retry=retry))
+
+        # the process in progress is killed, and not retried
+        deadline = time.monotonic() + 2
+        while runner.returncode is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.1)
+        assert runner.returncode == -signal.SIGKILL
+
+
+class Test_RunnerPool_iter_completed:
+    def test_normal(self):
+        commands = [["sleep", "0.3"], ["echo", "test"]]
+        runners = list(RunnerPool(max_workers=2).iter_completed(commands))
+
+        assert [r.command for r in runners] == [commands[1], commands[0]]
+
+    def test_exception(self):
+        commands = [["ls", "__not_exist_dir__"], ["echo", "test"]]
+        completed = []
+
+        with pytest.raises(CalledProcessError):
+            for runner in RunnerPool(max_workers=2).iter_completed(commands, check=True):
+                completed.append(runner)
+        assert [r.command for r in completed] == [commands[1]]
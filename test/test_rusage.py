@@ -0,0 +1,56 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import platform
+
+import pytest
+
+from subprocrunner import ResourceUsage, Retry, SubprocessRunner
+
+
+class Test_ResourceUsage_add:
+    def test_normal(self):
+        lhs = ResourceUsage(1.0, 0.5, 100, 1, 2, 3, 4)
+        rhs = ResourceUsage(2.0, 0.25, 50, 10, 20, 30, 40)
+
+        assert lhs + rhs == ResourceUsage(3.0, 0.75, 100, 11, 22, 33, 44)
+        assert (lhs + rhs).cpu_time == 3.75
+
+
+class Test_ResourceUsage_repr:
+    def test_normal(self):
+        assert str(ResourceUsage(max_rss=1)) == (
+            "ResourceUsage(user_time=0.0, system_time=0.0, max_rss=1, minor_faults=0, "
+            "major_faults=0, voluntary_context_switches=0, involuntary_context_switches=0)"
+        )
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_rusage:
+    def test_normal(self):
+        runner = SubprocessRunner(["echo", "test"])
+        assert runner.rusage is None
+
+        runner.run()
+        rusage = runner.rusage
+        assert rusage is not None
+        assert rusage.max_rss > 0
+        assert rusage.minor_faults > 0
+
+        runner.run(retry=Retry(total=2, backoff_factor=0.01, jitter=0.01))
+        assert runner.rusage is not rusage
+
+    def test_normal_retry(self, mocker):
+        spy = mocker.spy(ResourceUsage, "__add__")
+        runner = SubprocessRunner(["ls", "__not_exist_dir__"])
+
+        runner.run(retry=Retry(total=2, backoff_factor=0.01, jitter=0.01))
+        assert runner.rusage is not None
+        assert spy.call_count == 2
+
+    def test_normal_dry_run(self):
+        runner = SubprocessRunner(["echo", "test"], dry_run=True)
+        runner.run()
+
+        assert runner.rusage is None
@@ -0,0 +1,165 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import os
+import platform
+import re
+import subprocess
+
+import pytest
+
+from subprocrunner import CalledProcessError, CommandError, ShellSession, SubprocessRunner
+
+
+pytestmark = pytest.mark.skipif(
+    platform.system() == "Windows", reason="ShellSession is not supported on Windows"
+)
+
+
+@pytest.fixture
+def session():
+    with ShellSession() as session:
+        yield session
+
+
+class Test_ShellSession_run:
+    @pytest.mark.parametrize(
+        ["command", "expected_rc", "expected_stdout", "expected_stderr"],
+        [
+            ["echo hoge", 0, "hoge\n", ""],
+            ["printf hoge", 0, "hoge", ""],
+            ["echo hoge >&2; exit_code=3; (exit $exit_code)", 3, "", "hoge\n"],
+            ["false", 1, "", ""],
+            ["cat", 0, "", ""],
+        ],
+    )
+    def test_normal(self, session, command, expected_rc, expected_stdout, expected_stderr):
+        assert session.run(command) == expected_rc
+        assert session.returncode == expected_rc
+        assert session.stdout == expected_stdout
+        assert session.stderr == expected_stderr
+
+    def test_normal_reuse_shell(self, session):
+        session.run("foo=hoge")
+        pid = session.pid
+
+        session.run("echo $foo")
+
+        assert session.stdout == "hoge\n"
+        assert session.pid == pid
+
+    def test_normal_large_output(self, session):
+        assert session.run("seq 100000") == 0
+        assert session.stdout_bytes == subprocess.check_output(["seq", "100000"])
+
+    def test_normal_exit_shell(self, session):
+        session.set_env("SUBPROCRUNNER_TEST", "hoge")
+        pid = session.pid
+
+        assert session.run("echo before; exit 3") == 3
+        assert session.stdout == "before\n"
+        assert session.pid is None
+
+        assert session.run("echo $SUBPROCRUNNER_TEST") == 0
+        assert session.stdout == "hoge\n"
+        assert session.pid != pid
+
+    def test_normal_ignore_stderr(self):
+        with ShellSession(ignore_stderr_regexp=re.compile("hoge")) as session:
+            assert session.run("echo hoge >&2; false", check=True) == 1
+
+    @pytest.mark.parametrize(
+        ["kwargs", "expected"],
+        [
+            [{"output_encoding": "utf-16-le"}, "hi"],
+            [{"output_encoding": "latin-1"}, "h\x00i\x00"],
+        ],
+    )
+    def test_normal_output_encoding(self, kwargs, expected):
+        with ShellSession(**kwargs) as session:
+            assert session.run("printf 'h\\000i\\000'") == 0
+            assert session.output_encoding == kwargs["output_encoding"]
+            assert session.stdout == expected
+
+    def test_normal_output_encoding_class_default(self, monkeypatch):
+        monkeypatch.setattr(SubprocessRunner, "default_output_encoding", "latin-1")
+
+        with ShellSession() as session:
+            assert session.run("printf '\\351'") == 0
+            assert session.stdout == "\u00e9"
+
+    def test_exception_check(self, session):
+        with pytest.raises(CalledProcessError) as e:
+            session.run("echo hoge >&2; false", check=True)
+
+        assert e.value.returncode == 1
+        assert e.value.cmd == "echo hoge >&2; false"
+        assert e.value.stderr == "hoge\n"
+
+    def test_exception_timeout(self, session):
+        session.run("true")
+        pid = session.pid
+
+        with pytest.raises(subprocess.TimeoutExpired) as e:
+            session.run("echo hoge; sleep 10", timeout=0.5)
+
+        assert e.value.output == b"hoge\n"
+        assert session.returncode is None
+        assert session.pid is None
+
+        assert session.run("echo restarted") == 0
+        assert session.stdout == "restarted\n"
+        assert session.pid != pid
+
+    def test_exception_empty(self, session):
+        with pytest.raises(ValueError):
+            session.run("")
+
+
+class Test_ShellSession_raise_for_returncode:
+    def test_normal(self, session):
+        session.raise_for_returncode()
+
+        session.run("true")
+        session.raise_for_returncode()
+
+    def test_exception(self, session):
+        session.run("exit_code=2; (exit $exit_code)")
+
+        with pytest.raises(CalledProcessError):
+            session.raise_for_returncode()
+
+
+class Test_ShellSession_set_env:
+    def test_normal(self, session):
+        session.run("true")
+        session.set_env("SUBPROCRUNNER_TEST", "a b'c")
+
+        session.run("echo $SUBPROCRUNNER_TEST")
+        assert session.stdout == "a b'c\n"
+
+        session.restart()
+        session.run("echo $SUBPROCRUNNER_TEST")
+        assert session.stdout == "a b'c\n"
+
+    def test_exception(self, session):
+        with pytest.raises(ValueError):
+            session.set_env("A B", "hoge")
+
+
+class Test_ShellSession_chdir:
+    def test_normal(self, session, tmpdir):
+        session.chdir(str(tmpdir))
+        assert session.cwd == os.path.realpath(str(tmpdir))
+
+        session.run("pwd")
+        assert session.stdout.strip() == session.cwd
+
+        session.restart()
+        session.run("pwd")
+        assert session.stdout.strip() == session.cwd
+
+    def test_exception(self, session):
+        with pytest.raises(CommandError):
+            session.chdir("/__not_exist_dir__")
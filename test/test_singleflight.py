@@ -0,0 +1,236 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import platform
+import re
+import threading
+import time
+
+import pytest
+
+import subprocrunner._subprocess_runner
+from subprocrunner import CalledProcessError, SubprocessRunner
+from subprocrunner._singleflight import AsyncSingleFlight, SingleFlight
+
+
+class Test_SingleFlight_do:
+    def test_normal(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        call_count = 0
+        results = []
+
+        def execute():
+            nonlocal call_count
+            call_count += 1
+            started.set()
+            time.sleep(0.3)
+            return "done"
+
+        def run():
+            results.append(single_flight.do("key", execute))
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run) for _i in range(3)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert call_count == 1
+        assert sorted(results) == [("done", False)] + [("done", True)] * 3
+        assert (single_flight.executions, single_flight.shared) == (1, 3)
+        assert single_flight.in_flight() == 0
+
+        # executed again after the in-flight call completed
+        assert single_flight.do("key", lambda: "again") == ("again", False)
+
+    def test_exception(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def execute():
+            started.set()
+            time.sleep(0.2)
+            raise RuntimeError("failed")
+
+        def run():
+            try:
+                single_flight.do("key", execute)
+            except RuntimeError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=run)
+        follower.start()
+        for thread in (leader, follower):
+            thread.join()
+
+        assert len(errors) == 2
+        assert errors[0] is errors[1]
+        assert single_flight.in_flight() == 0
+
+
+class Test_AsyncSingleFlight_do:
+    def test_normal(self):
+        single_flight = AsyncSingleFlight()
+        call_count = 0
+
+        async def execute():
+            nonlocal call_count
+            call_count += 1
+            await asyncio.sleep(0.1)
+            return "done"
+
+        async def main():
+            return await asyncio.gather(*[single_flight.do("key", execute) for _i in range(4)])
+
+        results = asyncio.run(main())
+
+        assert call_count == 1
+        assert sorted(results) == [("done", False)] + [("done", True)] * 3
+        assert (single_flight.executions, single_flight.shared) == (1, 3)
+        assert single_flight.in_flight() == 0
+
+    def test_normal_cancel_leader(self):
+        single_flight = AsyncSingleFlight()
+        call_count = 0
+
+        async def execute():
+            nonlocal call_count
+            call_count += 1
+            await asyncio.sleep(0.1)
+            return call_count
+
+        async def main():
+            leader = asyncio.ensure_future(single_flight.do("key", execute))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(single_flight.do("key", execute))
+            await asyncio.sleep(0)
+            leader.cancel()
+
+            return await follower
+
+        # the follower takes over the execution of the cancelled call
+        assert asyncio.run(main()) == (2, False)
+        assert single_flight.in_flight() == 0
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_coalesce:
+    command = ["sh", "-c", "sleep 0.3; echo hoge"]
+
+    def test_normal(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        saved_spawns = SubprocessRunner.coalesce_info().saved_spawns
+        runners = [SubprocessRunner(self.command, coalesce=True) for _i in range(4)]
+        threads = [threading.Thread(target=runner.run) for runner in runners]
+
+        threads[0].start()
+        time.sleep(0.1)
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert spy.call_count == 1
+        for runner in runners:
+            assert runner.returncode == 0
+            assert runner.stdout == "hoge\n"
+        assert SubprocessRunner.coalesce_info().saved_spawns - saved_spawns == 3
+
+        # not coalesced after the in-flight execution completed
+        assert SubprocessRunner(self.command, coalesce=True).run() == 0
+        assert spy.call_count == 2
+
+    def test_normal_check(self):
+        command = ["sh", "-c", "sleep 0.3; exit 3"]
+        runners = [SubprocessRunner(command, coalesce=True) for _i in range(2)]
+        errors = []
+
+        def run(runner):
+            try:
+                runner.run(check=True)
+            except CalledProcessError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(runner,)) for runner in runners]
+        threads[0].start()
+        time.sleep(0.1)
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+
+        assert [e.returncode for e in errors] == [3, 3]
+
+    def test_normal_ignore_stderr_regexp(self):
+        command = ["sh", "-c", "sleep 0.3; echo hoge >&2; exit 3"]
+        runners = [
+            SubprocessRunner(command, ignore_stderr_regexp=re.compile("hoge"), coalesce=True)
+            for _i in range(2)
+        ]
+        returncodes = []
+
+        def run(runner):
+            returncodes.append(runner.run(check=True))
+
+        threads = [threading.Thread(target=run, args=(runner,)) for runner in runners]
+        threads[0].start()
+        time.sleep(0.1)
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+
+        assert returncodes == [3, 3]
+        for runner in runners:
+            assert runner.stderr == "hoge\n"
+
+    def test_normal_not_coalesced(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        threads = [
+            threading.Thread(
+                target=SubprocessRunner(self.command, coalesce=True).run,
+                kwargs={"env_overrides": {"VALUE": str(i)}},
+            )
+            for i in range(2)
+        ] + [threading.Thread(target=SubprocessRunner(self.command).run)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert spy.call_count == 3
+
+    def test_normal_arun(self, mocker):
+        spy = mocker.spy(asyncio, "create_subprocess_exec")
+        saved_spawns = SubprocessRunner.coalesce_info().saved_spawns
+        runners = [SubprocessRunner(self.command, coalesce=True) for _i in range(4)]
+
+        async def main():
+            return await asyncio.gather(*[runner.arun() for runner in runners])
+
+        assert asyncio.run(main()) == [0] * 4
+        assert spy.call_count == 1
+        for runner in runners:
+            assert runner.stdout == "hoge\n"
+        assert SubprocessRunner.coalesce_info().saved_spawns - saved_spawns == 3
+
+    def test_normal_arun_ignore_stderr_regexp(self):
+        command = ["sh", "-c", "sleep 0.3; echo hoge >&2; exit 3"]
+        runners = [
+            SubprocessRunner(command, ignore_stderr_regexp=re.compile("hoge"), coalesce=True)
+            for _i in range(2)
+        ]
+
+        async def main():
+            return await asyncio.gather(*[runner.arun(check=True) for runner in runners])
+
+        assert asyncio.run(main()) == [3, 3]
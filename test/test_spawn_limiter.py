@@ -0,0 +1,213 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import platform
+import threading
+import time
+
+import pytest
+
+from subprocrunner import SpawnLimiter, SpawnLimitError, SubprocessRunner
+
+
+@pytest.fixture
+def spawn_limiter():
+    def set_limiter(limiter):
+        SubprocessRunner.spawn_limiter = limiter
+        return limiter
+
+    yield set_limiter
+
+    SubprocessRunner.spawn_limiter = None
+
+
+class Test_SpawnLimiter_constructor:
+    @pytest.mark.parametrize(
+        ["kwargs"],
+        [
+            [{"max_concurrency": 0}],
+            [{"rate": 0}],
+            [{"burst": 0}],
+            [{"command_limits": {"ip": 0}}],
+            [{"timeout": -1}],
+        ],
+    )
+    def test_exception(self, kwargs):
+        with pytest.raises(ValueError):
+            SpawnLimiter(**kwargs)
+
+
+class Test_SpawnLimiter_acquire:
+    def test_normal_max_concurrency(self):
+        limiter = SpawnLimiter(max_concurrency=2)
+        acquired = threading.Event()
+
+        limiter.acquire()
+        limiter.acquire()
+
+        def acquire():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        time.sleep(0.1)
+        assert not acquired.is_set()
+        assert limiter.limiter_info().queued == 1
+
+        limiter.release()
+        thread.join()
+        assert acquired.is_set()
+
+        info = limiter.limiter_info()
+        assert (info.in_flight, info.queued, info.admitted) == (2, 0, 3)
+
+    def test_normal_command_limits(self):
+        limiter = SpawnLimiter(command_limits={"ip": 1}, timeout=0)
+
+        limiter.acquire("ip")
+        limiter.acquire("ls")
+        limiter.acquire("ls")
+        with pytest.raises(SpawnLimitError):
+            limiter.acquire("ip")
+
+        assert limiter.in_flight("ip") == 1
+        assert limiter.in_flight("ls") == 2
+
+        limiter.release("ip")
+        limiter.acquire("ip")
+
+    def test_normal_rate(self):
+        limiter = SpawnLimiter(rate=20, burst=1)
+
+        started = time.monotonic()
+        for _i in range(5):
+            limiter.acquire()
+            limiter.release()
+
+        assert time.monotonic() - started >= 0.15
+
+    @pytest.mark.parametrize(
+        ["kwargs", "acquire_timeout", "min_elapsed"],
+        [
+            [{"max_concurrency": 1, "timeout": 0}, None, 0],
+            [{"max_concurrency": 1}, 0.2, 0.2],
+            [{"rate": 1, "timeout": 0.1}, None, 0.1],
+        ],
+    )
+    def test_exception(self, kwargs, acquire_timeout, min_elapsed):
+        limiter = SpawnLimiter(**kwargs)
+        limiter.acquire()
+
+        started = time.monotonic()
+        with pytest.raises(SpawnLimitError):
+            limiter.acquire(timeout=acquire_timeout)
+
+        assert time.monotonic() - started >= min_elapsed
+        assert limiter.limiter_info().rejected == 1
+
+    def test_normal_aacquire(self):
+        limiter = SpawnLimiter(max_concurrency=1)
+
+        async def main():
+            await limiter.aacquire()
+            asyncio.get_event_loop().call_later(0.1, limiter.release)
+            await limiter.aacquire()
+
+        asyncio.run(main())
+        assert limiter.limiter_info().admitted == 2
+
+    def test_normal_aacquire_release_from_thread(self):
+        limiter = SpawnLimiter(max_concurrency=1)
+        limiter.acquire()
+
+        async def main():
+            threading.Timer(0.05, limiter.release).start()
+            started = time.monotonic()
+            await limiter.aacquire()
+
+            return time.monotonic() - started
+
+        # woken up by the release instead of polling
+        assert asyncio.run(main()) < 0.5
+        assert limiter.limiter_info().in_flight == 1
+
+    def test_exception_aacquire(self):
+        limiter = SpawnLimiter(max_concurrency=1)
+        limiter.acquire()
+
+        with pytest.raises(SpawnLimitError):
+            asyncio.run(limiter.aacquire(timeout=0.1))
+        assert limiter.limiter_info().queued == 0
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_spawn_limiter:
+    def test_normal_run(self, spawn_limiter):
+        limiter = spawn_limiter(SpawnLimiter(max_concurrency=2))
+        runners = [SubprocessRunner(["sleep", "0.2"]) for _i in range(4)]
+        threads = [threading.Thread(target=runner.run) for runner in runners]
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        assert limiter.limiter_info().in_flight == 2
+        for thread in threads:
+            thread.join()
+
+        assert time.monotonic() - started >= 0.4
+        assert limiter.limiter_info().in_flight == 0
+        assert limiter.limiter_info().admitted == 4
+        assert max(runner.timings.queue for runner in runners) > 0.1
+
+    def test_normal_popen(self, spawn_limiter):
+        limiter = spawn_limiter(SpawnLimiter(max_concurrency=1, timeout=0))
+
+        proc = SubprocessRunner(["echo", "hoge"]).popen()
+        with pytest.raises(SpawnLimitError):
+            SubprocessRunner(["echo", "hoge"]).run()
+
+        # released when the process is reaped
+        proc.communicate()
+        assert limiter.limiter_info().in_flight == 0
+        assert SubprocessRunner(["echo", "hoge"]).run() == 0
+
+    @pytest.mark.parametrize(
+        ["command"],
+        [["FOO=1 echo hoge"], ["exec echo hoge"], ["env -i echo hoge"], ["(echo hoge)"]],
+    )
+    def test_normal_shell_command_name(self, mocker, spawn_limiter, command):
+        mocker.patch("subprocrunner.Which.verify")
+        spawn_limiter(SpawnLimiter(command_limits={"echo": 1}, timeout=0))
+
+        proc = SubprocessRunner(["echo", "hoge"]).popen()
+        with pytest.raises(SpawnLimitError):
+            SubprocessRunner(command).run()
+
+        proc.communicate()
+        assert SubprocessRunner(command).run() == 0
+
+    def test_normal_arun(self, spawn_limiter):
+        limiter = spawn_limiter(SpawnLimiter(max_concurrency=1))
+        runners = [SubprocessRunner(["sleep", "0.1"]) for _i in range(3)]
+
+        async def main():
+            return await asyncio.gather(*[runner.arun() for runner in runners])
+
+        started = time.monotonic()
+        assert asyncio.run(main()) == [0, 0, 0]
+        assert time.monotonic() - started >= 0.3
+        assert limiter.limiter_info().in_flight == 0
+
+    def test_normal_spawn_failed(self, spawn_limiter):
+        limiter = spawn_limiter(SpawnLimiter(max_concurrency=1))
+
+        runner = SubprocessRunner(["sh", "-c", "true"])
+        runner._SubprocessRunner__exec_command = ["/__not_exist__/command"]
+        with pytest.raises(OSError):
+            runner.run()
+
+        assert limiter.limiter_info().in_flight == 0
@@ -2,18 +2,33 @@
 .. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
 """
 
+import asyncio
 import errno
+import gc
+import inspect
+import io
 import os
 import platform
 import re
+import signal
 import subprocess
 import sys
+import time
+import tracemalloc
 from subprocess import PIPE
 
 import pytest
 from typepy import is_not_null_string, is_null_string
 
-from subprocrunner import SubprocessRunner
+import subprocrunner._subprocess_runner
+from subprocrunner import (
+    Capture,
+    CircuitBreaker,
+    CircuitOpenError,
+    CompletedRun,
+    RetryBudget,
+    SubprocessRunner,
+)
 from subprocrunner._logger._null_logger import NullLogger
 from subprocrunner.error import CalledProcessError
 from subprocrunner.retry import Retry
@@ -196,6 +211,195 @@ class Test_SubprocessRunner_run:
         runner = SubprocessRunner(list_command)
         runner.run()
 
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks(self):
+        stdout_lines = []
+        stderr_lines = []
+        runner = SubprocessRunner("echo out1; echo err 1>&2; printf out2")
+
+        assert (
+            runner.run(on_stdout_line=stdout_lines.append, on_stderr_line=stderr_lines.append) == 0
+        )
+        assert stdout_lines == ["out1", "out2"]
+        assert stderr_lines == ["err"]
+        assert runner.stdout == "out1\nout2"
+        assert runner.stderr == "err\n"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks_wo_buffer(self):
+        stdout_lines = []
+        runner = SubprocessRunner([list_command, "__not_exist_dir__"])
+
+        with pytest.raises(CalledProcessError):
+            runner.run(on_stdout_line=stdout_lines.append, buffer_output=False, check=True)
+        assert stdout_lines == []
+        assert runner.stdout is None
+        assert runner.stderr is None
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks_timeout(self):
+        stdout_lines = []
+        runner = SubprocessRunner("echo start; sleep 10")
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            runner.run(on_stdout_line=stdout_lines.append, timeout=0.3)
+        assert stdout_lines == ["start"]
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["stdout_capture", "stderr_capture", "expected_stdout", "expected_stderr"],
+        [
+            [Capture.discard(), None, None, "err\n"],
+            [None, Capture.discard(), "1\n2\n3\n", None],
+            [Capture.head(3), Capture.tail(max_bytes=2), "1\n2", "r\n"],
+            [Capture.tail(max_lines=2), Capture.head(1), "2\n3\n", "e"],
+        ],
+    )
+    def test_capture(self, stdout_capture, stderr_capture, expected_stdout, expected_stderr):
+        runner = SubprocessRunner("seq 3; echo err 1>&2; exit 1")
+
+        with pytest.raises(CalledProcessError) as e:
+            runner.run(stdout_capture=stdout_capture, stderr_capture=stderr_capture, check=True)
+        assert runner.stdout == expected_stdout
+        assert runner.stderr == expected_stderr
+        assert e.value.stdout == expected_stdout
+        assert e.value.stderr == expected_stderr
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_capture_file(self, tmp_path):
+        output_path = tmp_path / "stdout.txt"
+        runner = SubprocessRunner(["echo", "test"])
+
+        runner.run(stdout_capture=Capture.to_file(str(output_path)))
+        runner.run(stdout_capture=Capture.to_file(str(output_path), append=True))
+        assert runner.stdout is None
+        assert output_path.read_text() == "test\ntest\n"
+
+        with open(output_path, "w") as f:
+            runner.run(stdout_capture=Capture.to_file(f))
+        assert output_path.read_text() == "test\n"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_output_bytes(self, mocker):
+        mocked_decoder = mocker.patch("subprocrunner._output.MultiByteStrDecoder")
+        runner = SubprocessRunner(["echo", "test"])
+        runner.run()
+
+        assert runner.stdout_bytes == b"test\n"
+        assert runner.stderr_bytes == b""
+        assert runner.stdout == "test\n"
+        mocked_decoder.assert_not_called()
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["output", "output_encoding", "output_errors", "expected"],
+        [
+            ["\\xe3\\x81\\x82", "utf-8", None, "\u3042"],
+            ["\\xe3\\x81\\x82", "ascii", None, "\ufffd\ufffd\ufffd"],
+            ["\\xe3\\x81\\x82", "ascii", "ignore", ""],
+            ["\\xe3\\x81\\x82", None, None, "\u3042"],
+            ["h\\x00i\\x00", "utf-16-le", None, "hi"],
+            ["hi", "cp500", None, "\u00c7\u00d1"],
+        ],
+    )
+    def test_output_encoding(self, output, output_encoding, output_errors, expected):
+        runner = SubprocessRunner(
+            ["printf", output], output_encoding=output_encoding, output_errors=output_errors
+        )
+        runner.run()
+
+        assert runner.output_encoding == output_encoding
+        assert runner.stdout == expected
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_output_encoding_class_default(self, monkeypatch):
+        monkeypatch.setattr(SubprocessRunner, "default_output_encoding", "latin-1")
+        runner = SubprocessRunner(["printf", "\\xe9"])
+        runner.run()
+
+        assert runner.output_encoding == "latin-1"
+        assert runner.stdout == "\u00e9"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_raw(self, mocker):
+        runner = SubprocessRunner(
+            "printf '\\377'; printf err 1>&2; exit 1",
+            raw=True,
+            ignore_stderr_regexp=re.compile(b"^not-match$"),
+        )
+
+        with pytest.raises(CalledProcessError) as e:
+            runner.run(check=True)
+        assert runner.raw
+        assert runner.stdout_bytes == b"\xff"
+        assert e.value.stdout == b"\xff"
+        assert e.value.stderr == b"err"
+
+        runner = SubprocessRunner(
+            "printf err 1>&2; exit 1", raw=True, ignore_stderr_regexp=re.compile(b"err")
+        )
+        runner.run(check=True)
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["command", "use_abspath", "expected_regexp"],
+        [
+            [["echo", "test"], True, re.compile(r"^/.+/echo$")],
+            [["echo", "test"], False, re.compile(r"^echo$")],
+            ["echo test", True, re.compile(r"^echo test$")],
+        ],
+    )
+    def test_use_abspath(self, mocker, command, use_abspath, expected_regexp):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        runner = SubprocessRunner(command, use_abspath=use_abspath)
+
+        assert runner.run() == 0
+        assert runner.stdout.strip() == "test"
+        assert runner.command == command
+
+        args = spy.call_args[0][0]
+        exec_command = args if isinstance(args, str) else args[0]
+        assert expected_regexp.search(exec_command) is not None
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["input", "expected_stdin"],
+        [
+            [None, subprocess.DEVNULL],
+            ["test", PIPE],
+        ],
+    )
+    def test_fast_spawn(self, mocker, input, expected_stdin):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        runner = SubprocessRunner(["cat"], fast_spawn=True)
+
+        assert runner.fast_spawn
+        assert runner.run(input=input) == 0
+        assert runner.stdout == (input or "")
+
+        args, kwargs = spy.call_args
+        assert args[0][0].startswith("/")
+        assert kwargs["close_fds"] is False
+        assert kwargs["stdin"] == expected_stdin
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["command", "input", "expected_rc", "expected_stdout"],
+        [
+            [["cat"], "test", 0, "test"],
+            ["echo hoge; exit 3", None, 3, "hoge\n"],
+        ],
+    )
+    def test_use_launcher(self, mocker, command, input, expected_rc, expected_stdout):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "LauncherPopen")
+        runner = SubprocessRunner(command, use_launcher=True)
+
+        assert runner.use_launcher
+        assert runner.run(input=input) == expected_rc
+        assert runner.stdout == expected_stdout
+        assert runner.rusage is not None
+        assert spy.spy_return.is_launched
+
     def test_retry(self, mocker):
         mocker.patch("subprocrunner.Which.verify")
 
@@ -274,6 +478,579 @@ class Test_SubprocessRunner_run:
         )
         assert mocked_run.call_count == 2
 
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_retry_on_stderr(self, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        retry = Retry(
+            total=3, backoff_factor=BACKOFF_FACTOR, jitter=JITTER, retry_on_stderr=["again"]
+        )
+
+        SubprocessRunner(["sh", "-c", "echo fatal >&2; exit 1"]).run(retry=retry)
+        assert spy.call_count == 1
+
+        SubprocessRunner(["sh", "-c", "echo try again >&2; exit 1"]).run(retry=retry)
+        assert spy.call_count == 1 + 4
+
+    def test_retry_deadline(self, mocker):
+        mocker.patch("subprocrunner.Which.verify")
+        mocked_run = mocker.patch("subprocrunner.SubprocessRunner._run")
+        mocked_run.return_value = 1
+
+        started = time.monotonic()
+        SubprocessRunner("always-failed-command").run(
+            retry=Retry(total=100, backoff_factor=0.1, jitter=0.01, max_backoff=0.1, deadline=0.5)
+        )
+
+        assert time.monotonic() - started < 1
+        assert 2 <= mocked_run.call_count <= 6
+
+    def test_circuit_breaker(self, mocker):
+        mocker.patch("subprocrunner.Which.verify")
+        mocked_run = mocker.patch("subprocrunner.SubprocessRunner._run")
+        mocked_run.return_value = 1
+        retry = Retry(
+            total=3,
+            backoff_factor=BACKOFF_FACTOR,
+            jitter=JITTER,
+            circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+
+        # the circuit opened in the middle of the retries: return the last result
+        assert SubprocessRunner("always-failed-command").run(retry=retry) == 1
+        assert mocked_run.call_count == 2
+
+        with pytest.raises(CircuitOpenError):
+            SubprocessRunner("always-failed-command").run(retry=retry)
+        assert mocked_run.call_count == 2
+
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(SubprocessRunner("always-failed-command").arun(retry=retry))
+        assert mocked_run.call_count == 2
+
+        # circuits are kept for each command
+        mocker.patch("subprocrunner.SubprocessRunner._run", return_value=0)
+        assert SubprocessRunner("another-command").run(retry=retry) == 0
+
+    @pytest.mark.parametrize(
+        ["run_kwargs"],
+        [
+            [{"return_value": 3}],
+            [{"side_effect": OSError(errno.EAGAIN, "failed to spawn")}],
+        ],
+    )
+    def test_circuit_breaker_trial(self, mocker, run_kwargs):
+        mocker.patch("subprocrunner.Which.verify")
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        retry = Retry(
+            total=1,
+            backoff_factor=BACKOFF_FACTOR,
+            jitter=JITTER,
+            retry_on_returncodes=[4],
+            circuit_breaker=breaker,
+        )
+        key = "always-failed-command"
+        breaker.record_failure(key)
+        time.sleep(0.2)
+        assert breaker.state(key) == CircuitBreaker.HALF_OPEN
+
+        # a trial that failed without being retryable opens the circuit again
+        mocker.patch("subprocrunner.SubprocessRunner._run", **run_kwargs)
+        try:
+            SubprocessRunner(key).run(retry=retry)
+        except OSError:
+            pass
+        assert breaker.state(key) == CircuitBreaker.OPEN
+
+        time.sleep(0.2)
+        mocker.patch("subprocrunner.SubprocessRunner._run", return_value=0)
+        assert SubprocessRunner(key).run(retry=retry) == 0
+        assert breaker.state(key) == CircuitBreaker.CLOSED
+
+    def test_retry_budget(self, mocker):
+        mocker.patch("subprocrunner.Which.verify")
+        mocked_run = mocker.patch("subprocrunner.SubprocessRunner._run")
+        mocked_run.return_value = 1
+        budget = RetryBudget(max_tokens=4)
+        retry = Retry(total=3, backoff_factor=BACKOFF_FACTOR, jitter=JITTER, budget=budget)
+
+        # the budget is shared by the runners
+        for _i in range(3):
+            SubprocessRunner("always-failed-command").run(retry=retry)
+
+        assert mocked_run.call_count == 3 + 4
+        assert budget.budget_info().denied == 2
+
+
+class Test_SubprocessRunner_arun:
+    @pytest.mark.parametrize(
+        ["command", "dry_run", "expected"],
+        [
+            [list_command, False, [0]],
+            [list_command, True, [0]],
+            [list_command + " __not_exist_dir__", False, list_command_errno],
+            [list_command + " __not_exist_dir__", True, [0]],
+        ],
+    )
+    def test_normal(self, command, dry_run, expected):
+        r = SubprocessRunner(command, dry_run=dry_run)
+
+        assert asyncio.run(r.arun()) in expected
+        assert r.returncode in expected
+
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            ["echo test", "test"],
+            [["echo", "test"], "test"],
+        ],
+    )
+    def test_stdout(self, command, expected):
+        runner = SubprocessRunner(command)
+        asyncio.run(runner.arun())
+
+        assert runner.returncode == 0
+        assert runner.stdout
+        assert runner.stdout.strip() == expected
+        assert is_null_string(runner.stderr)
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_input(self):
+        runner = SubprocessRunner(["cat"])
+        asyncio.run(runner.arun(input="test input"))
+
+        assert runner.stdout == "test input"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_check(self):
+        runner = SubprocessRunner([list_command, "__not_exist_dir__"])
+
+        with pytest.raises(CalledProcessError):
+            asyncio.run(runner.arun(check=True))
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_timeout(self):
+        runner = SubprocessRunner(["sleep", "10"])
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            asyncio.run(runner.arun(timeout=0.1))
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks(self):
+        stdout_lines = []
+        stderr_lines = []
+        runner = SubprocessRunner("echo out1; echo err 1>&2; printf out2")
+
+        assert (
+            asyncio.run(
+                runner.arun(on_stdout_line=stdout_lines.append, on_stderr_line=stderr_lines.append)
+            )
+            == 0
+        )
+        assert stdout_lines == ["out1", "out2"]
+        assert stderr_lines == ["err"]
+        assert runner.stdout == "out1\nout2"
+        assert runner.stderr == "err\n"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks_wo_buffer(self):
+        stdout_lines = []
+        runner = SubprocessRunner("echo out; exit 1")
+
+        with pytest.raises(CalledProcessError):
+            asyncio.run(
+                runner.arun(on_stdout_line=stdout_lines.append, buffer_output=False, check=True)
+            )
+        assert stdout_lines == ["out"]
+        assert runner.stdout is None
+        assert runner.stderr is None
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_line_callbacks_timeout(self):
+        stdout_lines = []
+        runner = SubprocessRunner("echo start; sleep 10")
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            asyncio.run(runner.arun(on_stdout_line=stdout_lines.append, timeout=0.3))
+        assert stdout_lines == ["start"]
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    @pytest.mark.parametrize(
+        ["stdout_capture", "stderr_capture", "expected_stdout", "expected_stderr"],
+        [
+            [Capture.discard(), None, None, "err\n"],
+            [None, Capture.discard(), "1\n2\n3\n", None],
+            [Capture.head(3), Capture.tail(max_bytes=2), "1\n2", "r\n"],
+            [Capture.tail(max_lines=2), Capture.head(1), "2\n3\n", "e"],
+        ],
+    )
+    def test_capture(self, stdout_capture, stderr_capture, expected_stdout, expected_stderr):
+        runner = SubprocessRunner("seq 3; echo err 1>&2; exit 1")
+
+        with pytest.raises(CalledProcessError) as e:
+            asyncio.run(
+                runner.arun(
+                    stdout_capture=stdout_capture, stderr_capture=stderr_capture, check=True
+                )
+            )
+        assert runner.stdout == expected_stdout
+        assert runner.stderr == expected_stderr
+        assert e.value.stdout == expected_stdout
+        assert e.value.stderr == expected_stderr
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_capture_file(self, tmp_path):
+        output_path = tmp_path / "stdout.txt"
+        runner = SubprocessRunner(["echo", "test"])
+
+        asyncio.run(runner.arun(stdout_capture=Capture.to_file(str(output_path))))
+        assert runner.stdout is None
+        assert output_path.read_text() == "test\n"
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_cancel(self, tmpdir):
+        pid_file = str(tmpdir.join("pid"))
+        runner = SubprocessRunner(["sh", "-c", f"echo $$ > {pid_file}; exec sleep 10"])
+
+        async def main():
+            task = asyncio.ensure_future(runner.arun())
+            while not (os.path.exists(pid_file) and os.path.getsize(pid_file)):
+                await asyncio.sleep(0.01)
+
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+
+        with open(pid_file) as f:
+            assert not is_process_alive(int(f.read()))
+
+    @pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+    def test_retry(self):
+        SubprocessRunner.clear_history()
+        SubprocessRunner.is_save_history = True
+        command = [list_command, "not_exist_dir"]
+        runner = SubprocessRunner(command)
+        retry_ct = 3
+
+        with pytest.raises(CalledProcessError):
+            asyncio.run(
+                runner.arun(
+                    check=True,
+                    retry=Retry(total=retry_ct, backoff_factor=BACKOFF_FACTOR, jitter=JITTER),
+                )
+            )
+        assert runner.get_history() == [" ".join(command)] * (retry_ct + 1)
+
+    def test_concurrent(self):
+        async def run_all():
+            runners = [SubprocessRunner(["echo", str(i)]) for i in range(10)]
+            await asyncio.gather(*[runner.arun() for runner in runners])
+
+            return runners
+
+        for i, runner in enumerate(asyncio.run(run_all())):
+            assert runner.returncode == 0
+            assert runner.stdout.strip() == str(i)
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_execute:
+    def test_normal(self):
+        runner = SubprocessRunner(["echo", "hoge"])
+        result = runner.execute()
+
+        assert isinstance(result, CompletedRun)
+        assert result.command == "echo hoge"
+        assert result.returncode == 0
+        assert result.stdout.strip() == "hoge"
+        assert result.stdout_bytes.strip() == b"hoge"
+        assert result.stderr == ""
+        assert result.attempts == 1
+        assert result.duration > 0
+
+        # the state of the runner is not changed
+        assert runner.returncode is None
+        assert runner.stdout is None
+
+    def test_normal_concurrent(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        runner = SubprocessRunner(["sh", "-c", "cat; echo $HOGE"])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda i: runner.execute(input=f"{i}\n", env_overrides={"HOGE": f"env{i}"}),
+                    range(32),
+                )
+            )
+
+        for i, result in enumerate(results):
+            assert result.returncode == 0
+            assert result.stdout.split() == [str(i), f"env{i}"]
+
+    def test_normal_output_encoding(self):
+        result = SubprocessRunner(["printf", "\\377"], output_encoding="latin-1").execute()
+
+        # the result does not keep the runner alive to decode the outputs
+        assert not any(isinstance(obj, SubprocessRunner) for obj in gc.get_referents(result))
+        assert not any(inspect.ismethod(obj) for obj in gc.get_referents(result))
+        assert result.stdout == "\u00ff"
+
+    def test_normal_immutable(self):
+        result = SubprocessRunner(["echo", "hoge"]).execute()
+
+        with pytest.raises(AttributeError):
+            result.returncode = 1
+        with pytest.raises(AttributeError):
+            result.extra = 1
+
+    def test_normal_dry_run(self):
+        result = SubprocessRunner(["false"], dry_run=True).execute()
+
+        assert result.returncode == 0
+        assert result.stdout == ""
+        assert result.attempts == 0
+
+    def test_normal_retry(self):
+        result = SubprocessRunner(["false"]).execute(
+            retry=Retry(total=2, backoff_factor=BACKOFF_FACTOR, jitter=JITTER)
+        )
+
+        assert result.returncode == 1
+        assert result.attempts == 3
+
+    def test_exception_check(self):
+        runner = SubprocessRunner(["sh", "-c", "echo hoge >&2; exit 3"])
+
+        with pytest.raises(CalledProcessError) as e:
+            runner.execute(check=True)
+        assert e.value.returncode == 3
+
+        result = runner.execute()
+        with pytest.raises(CalledProcessError) as e:
+            result.raise_for_returncode()
+        assert e.value.stderr.strip() == "hoge"
+
+    def test_normal_aexecute(self):
+        runner = SubprocessRunner("cat")
+
+        async def main():
+            return await asyncio.gather(*[runner.aexecute(input=str(i)) for i in range(5)])
+
+        results = asyncio.run(main())
+
+        assert [result.stdout for result in results] == [str(i) for i in range(5)]
+        assert runner.returncode is None
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_iter_lines:
+    @pytest.mark.parametrize(
+        ["command", "expected"],
+        [
+            ["printf 'a\\nb\\nc'", ["a", "b", "c"]],
+            [["printf", "a\\r\\nb\\n"], ["a", "b"]],
+            [["true"], []],
+        ],
+    )
+    def test_normal(self, command, expected):
+        runner = SubprocessRunner(command)
+
+        assert list(runner.iter_lines()) == expected
+        assert runner.returncode == 0
+        assert runner.stdout is None
+
+    def test_normal_include_stderr(self):
+        runner = SubprocessRunner("echo out; echo err 1>&2")
+
+        assert sorted(runner.iter_lines(include_stderr=True)) == [
+            ("stderr", "err"),
+            ("stdout", "out"),
+        ]
+        assert runner.stderr == "err\n"
+
+    def test_normal_input(self):
+        runner = SubprocessRunner(["cat"])
+
+        assert list(runner.iter_lines(input="x\n" * 1000)) == ["x"] * 1000
+
+    @pytest.mark.parametrize(
+        ["stderr_capture", "expected_size"],
+        [
+            [None, 64 * 1024],
+            [Capture.tail(max_lines=1), 5],
+            [Capture.discard(), None],
+        ],
+    )
+    def test_normal_stderr_capture(self, stderr_capture, expected_size):
+        runner = SubprocessRunner(
+            "head -c 100000 /dev/zero | tr '\\0' e >&2; echo >&2; echo last >&2"
+        )
+
+        assert list(runner.iter_lines(stderr_capture=stderr_capture)) == []
+        if expected_size is None:
+            assert runner.stderr is None
+        else:
+            assert len(runner.stderr) == expected_size
+            assert runner.stderr.endswith("last\n")
+
+    def test_normal_dry_run(self):
+        runner = SubprocessRunner(["echo", "test"], dry_run=True)
+
+        assert list(runner.iter_lines()) == []
+        assert runner.returncode == 0
+
+    def test_normal_break(self):
+        runner = SubprocessRunner(["yes"])
+
+        for i, line in enumerate(runner.iter_lines()):
+            assert line == "y"
+            if i >= 10:
+                break
+
+    def test_exception_check(self):
+        runner = SubprocessRunner([list_command, "__not_exist_dir__"])
+
+        with pytest.raises(CalledProcessError) as e:
+            list(runner.iter_lines(check=True))
+        assert runner.returncode in list_command_errno
+        assert e.value.stderr
+
+    def test_exception_timeout(self):
+        runner = SubprocessRunner(["sleep", "10"])
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            list(runner.iter_lines(timeout=0.1))
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # zombie processes waiting to be reaped by init
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_timeout:
+    COMMAND = "echo out; echo err >&2; sleep 10 & echo $! > {pid_file}; wait"
+
+    @pytest.mark.parametrize(
+        ["mode"],
+        [["run"], ["stream"], ["iter_lines"], ["arun"]],
+    )
+    def test_kill_group(self, tmpdir, mode):
+        pid_file = str(tmpdir.join("pid"))
+        runner = SubprocessRunner(
+            self.COMMAND.format(pid_file=pid_file), start_new_session=True, kill_grace_period=0.5
+        )
+
+        with pytest.raises(subprocess.TimeoutExpired) as e:
+            if mode == "run":
+                runner.run(timeout=0.5)
+            elif mode == "stream":
+                runner.run(timeout=0.5, on_stdout_line=lambda _line: None)
+            elif mode == "iter_lines":
+                list(runner.iter_lines(timeout=0.5))
+            else:
+                asyncio.run(runner.arun(timeout=0.5))
+
+        assert runner.start_new_session
+        assert e.value.stderr == b"err\n"
+        if mode != "iter_lines":
+            assert e.value.output == b"out\n"
+
+        with open(pid_file) as f:
+            assert not is_process_alive(int(f.read()))
+
+    @pytest.mark.parametrize(
+        ["mode"],
+        [["run"], ["stream"], ["iter_lines"], ["arun"]],
+    )
+    def test_pipes_closed(self, mode):
+        # the process keeps running after closing the pipes
+        runner = SubprocessRunner(["sh", "-c", "exec >&- 2>&- <&-; sleep 4"])
+        started = time.monotonic()
+
+        with pytest.raises(subprocess.TimeoutExpired):
+            if mode == "run":
+                runner.run(timeout=1)
+            elif mode == "stream":
+                runner.run(timeout=1, on_stdout_line=lambda _line: None)
+            elif mode == "iter_lines":
+                list(runner.iter_lines(timeout=1))
+            else:
+                asyncio.run(runner.arun(timeout=1))
+
+        assert time.monotonic() - started < 3
+
+    @pytest.mark.parametrize(["mode"], [["run"], ["iter_lines"]])
+    def test_keep_group_on_completion(self, tmpdir, mode):
+        pid_file = str(tmpdir.join("pid"))
+        runner = SubprocessRunner(
+            f"(sleep 10 > /dev/null 2>&1 & echo $! > {pid_file}); echo out",
+            start_new_session=True,
+        )
+
+        if mode == "run":
+            runner.run()
+        else:
+            assert list(runner.iter_lines()) == ["out"]
+        assert runner.returncode == 0
+
+        with open(pid_file) as f:
+            pid = int(f.read())
+        try:
+            assert is_process_alive(pid)
+        finally:
+            os.kill(pid, signal.SIGKILL)
+
+    def test_kill_group_iter_lines_closed(self, tmpdir):
+        pid_file = str(tmpdir.join("pid"))
+        runner = SubprocessRunner(
+            f"sleep 10 > /dev/null 2>&1 & echo $! > {pid_file}; echo out; wait",
+            start_new_session=True,
+        )
+
+        lines = runner.iter_lines()
+        assert next(lines) == "out"
+        lines.close()
+
+        with open(pid_file) as f:
+            assert not is_process_alive(int(f.read()))
+
+    def test_grace_period(self):
+        runner = SubprocessRunner(
+            ["sh", "-c", "trap 'echo term; exit 3' TERM; echo start; while :; do sleep 0.1; done"],
+            kill_grace_period=5,
+        )
+
+        with pytest.raises(subprocess.TimeoutExpired) as e:
+            runner.run(timeout=0.5)
+
+        assert e.value.output == b"start\nterm\n"
+
+    def test_kill_after_grace_period(self):
+        runner = SubprocessRunner(
+            ["sh", "-c", "trap '' TERM; echo start; sleep 10"],
+            start_new_session=True,
+            kill_grace_period=0.3,
+        )
+
+        with pytest.raises(subprocess.TimeoutExpired) as e:
+            runner.run(timeout=0.3)
+
+        assert e.value.output == b"start\n"
+        assert runner.kill_grace_period == 0.3
+
 
 class Test_SubprocessRunner_popen:
     @pytest.mark.parametrize(
@@ -335,3 +1112,111 @@ class Test_SubprocessRunner_command_history:
 
         runner.run(retry=Retry(total=retry_ct, backoff_factor=BACKOFF_FACTOR, jitter=JITTER))
         assert runner.get_history() == [" ".join(command)] * (retry_ct + 1)
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_input_stream:
+    @pytest.mark.parametrize(
+        ["input", "expected"],
+        [
+            [iter([b"ab", b"", b"cd"]), "abcd"],
+            [["ab", "cd"], "abcd"],
+            [io.BytesIO(b"abcd"), "abcd"],
+            [io.StringIO("abcd"), "abcd"],
+        ],
+    )
+    def test_normal(self, input, expected):
+        runner = SubprocessRunner(["cat"])
+
+        assert runner.run(input=input) == 0
+        assert runner.stdout == expected
+
+    def test_normal_fd(self, tmp_path, mocker):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        path = tmp_path / "input"
+        path.write_bytes(b"abcd")
+
+        with open(path, "rb", buffering=0) as f:
+            runner = SubprocessRunner(["cat"])
+            assert runner.run(input=f) == 0
+            assert runner.stdout == "abcd"
+            assert spy.call_args[1]["stdin"] == f.fileno()
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            runner = SubprocessRunner(["cat"])
+            assert runner.run(input=fd) == 0
+            assert runner.stdout == "abcd"
+        finally:
+            os.close(fd)
+
+    @pytest.mark.parametrize(
+        ["mode", "encoding"],
+        [["r", "utf-8"], ["rb", None]],
+    )
+    def test_normal_partially_read(self, tmp_path, mocker, mode, encoding):
+        spy = mocker.spy(subprocrunner._subprocess_runner, "TrackedPopen")
+        path = tmp_path / "input"
+        path.write_text("first\nsecond ✓\nthird\n", encoding="utf-8")
+
+        # buffered file objects are streamed from the current position
+        with open(path, mode, encoding=encoding) as f:
+            f.readline()
+            runner = SubprocessRunner(["cat"], output_encoding="utf-8")
+            assert runner.run(input=f) == 0
+
+        assert runner.stdout == "second ✓\nthird\n"
+        assert spy.call_args[1]["stdin"] == PIPE
+
+    def test_normal_bounded_memory(self):
+        chunk = b"x" * 1024 * 1024
+        runner = SubprocessRunner(["wc", "-c"])
+
+        tracemalloc.start()
+        try:
+            assert runner.run(input=(chunk for _i in range(64))) == 0
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert runner.stdout.strip() == str(64 * len(chunk))
+        assert peak < 16 * len(chunk)
+
+    def test_normal_exit_before_reading(self):
+        runner = SubprocessRunner(["head", "-c", "3"])
+
+        assert runner.run(input=iter([b"x" * 1024 * 1024] * 64)) == 0
+        assert runner.stdout == "xxx"
+
+    def test_normal_arun(self):
+        runner = SubprocessRunner(["cat"])
+
+        assert asyncio.run(runner.arun(input=iter(["ab", "cd"]))) == 0
+        assert runner.stdout == "abcd"
+
+    def test_normal_retry(self):
+        runner = SubprocessRunner(["sh", "-c", "cat; exit 1"])
+        retry = Retry(total=1, backoff_factor=BACKOFF_FACTOR, jitter=JITTER)
+
+        # re-iterable inputs are written to each attempt
+        assert runner.run(input=["ab", "cd"], retry=retry) == 1
+        assert runner.stdout == "abcd"
+
+    @pytest.mark.parametrize(
+        ["input"],
+        [[iter([b"ab"])], [io.BytesIO(b"ab")], [0]],
+    )
+    def test_exception_retry(self, mocker, input):
+        mocked_run = mocker.patch("subprocrunner.SubprocessRunner._run")
+        mocked_arun = mocker.patch("subprocrunner.SubprocessRunner._arun")
+        runner = SubprocessRunner(["cat"])
+
+        with pytest.raises(ValueError):
+            runner.run(input=input, retry=Retry())
+        with pytest.raises(ValueError):
+            asyncio.run(runner.arun(input=input, retry=Retry()))
+        mocked_run.assert_not_called()
+        mocked_arun.assert_not_called()
+
+    def test_normal_iter_lines(self):
+        assert list(SubprocessRunner(["cat"]).iter_lines(input=["a\n", "b\n"])) == ["a", "b"]
@@ -0,0 +1,88 @@
+"""
+.. codeauthor:: Tsuyoshi Hombashi <tsuyoshi.hombashi@gmail.com>
+"""
+
+import asyncio
+import platform
+import re
+
+import pytest
+
+from subprocrunner import ExecutionTimings, Retry, SubprocessRunner
+from subprocrunner.error import CalledProcessError
+
+
+class Test_ExecutionTimings:
+    def test_normal(self):
+        timings = ExecutionTimings()
+
+        assert timings.as_dict()["attempts"] == 0
+        assert re.search(r"^ExecutionTimings\(resolve=0.000000, .+, attempts=0\)$", str(timings))
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_timings:
+    def test_normal(self):
+        runner = SubprocessRunner(
+            ["sh", "-c", "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done; echo done"]
+        )
+        runner.run()
+        timings = runner.timings
+
+        assert timings.attempts == 1
+        assert timings.spawn > 0
+        assert timings.read > 0
+        assert timings.user_cpu + timings.system_cpu > 0
+        assert timings.wall >= timings.resolve + timings.env + timings.spawn + timings.read
+
+        assert timings.decode == 0
+        assert runner.stdout == "done\n"
+        assert timings.decode > 0
+
+    def test_normal_retry(self):
+        runner = SubprocessRunner(["ls", "__not_exist_dir__"])
+        runner.run(retry=Retry(total=2, backoff_factor=0.01, jitter=0.01))
+
+        assert runner.timings.attempts == 3
+
+    def test_normal_dry_run(self):
+        runner = SubprocessRunner(["echo", "test"], dry_run=True)
+        runner.run()
+
+        assert runner.timings.attempts == 0
+        assert runner.timings.spawn == 0
+
+    def test_normal_arun(self):
+        runner = SubprocessRunner(["echo", "test"])
+        asyncio.run(runner.arun())
+
+        assert runner.timings.attempts == 1
+        assert runner.timings.spawn > 0
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_SubprocessRunner_execution_hook:
+    def test_normal(self):
+        calls = []
+
+        def hook(runner, timings):
+            calls.append((runner.command, runner.returncode, timings.attempts))
+
+        def failed_hook(runner, timings):
+            raise RuntimeError()
+
+        SubprocessRunner.add_execution_hook(hook)
+        SubprocessRunner.add_execution_hook(failed_hook)
+        try:
+            SubprocessRunner(["echo", "test"]).run()
+            with pytest.raises(CalledProcessError):
+                SubprocessRunner(["ls", "__not_exist_dir__"]).run(check=True)
+        finally:
+            SubprocessRunner.remove_execution_hook(hook)
+            SubprocessRunner.remove_execution_hook(failed_hook)
+
+        SubprocessRunner(["echo", "test"]).run()
+
+        assert [call[0] for call in calls] == [["echo", "test"], ["ls", "__not_exist_dir__"]]
+        assert calls[0][1:] == (0, 1)
+        assert calls[1][1] != 0
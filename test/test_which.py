@@ -105,3 +105,61 @@ class Test_Which_abspath:
     @pytest.mark.parametrize(["value"], [["__not_exist_command__"]])
     def test_abnormal(self, value):
         assert Which(value).abspath() is None
+
+
+@pytest.mark.skipif(platform.system() == "Windows", reason="platform dependent tests")
+class Test_Which_cache:
+    def test_normal(self):
+        Which.clear_cache()
+
+        assert Which("ls").abspath() == Which("ls").abspath()
+        info = Which.cache_info()
+        assert info.hits == 1
+        assert info.misses == 1
+        assert info.currsize == 1
+
+        Which("ls", follow_symlinks=True).abspath()
+        assert Which.cache_info().currsize == 2
+
+        Which("ls", use_cache=False).abspath()
+        assert Which.cache_info().misses == 2
+
+        Which.clear_cache()
+        assert Which.cache_info() == (0, 0, Which.cache_maxsize, 0)
+
+    def test_normal_not_cache_not_found(self):
+        Which.clear_cache()
+
+        assert Which("__not_exist_command__").abspath() is None
+        assert Which("__not_exist_command__").abspath() is None
+        assert Which.cache_info().currsize == 0
+
+    def test_normal_path_changed(self, monkeypatch, tmp_path):
+        Which.clear_cache()
+        command_path = tmp_path / "__test_command__"
+        command_path.write_text("#!/bin/sh\n")
+        command_path.chmod(0o755)
+
+        assert Which(command_path.name).abspath() is None
+
+        monkeypatch.setenv("PATH", str(tmp_path))
+        assert Which(command_path.name).abspath() == str(command_path)
+        assert Which(command_path.name).abspath() == str(command_path)
+        assert Which.cache_info().hits == 1
+
+        command_path.unlink()
+        assert Which(command_path.name).abspath() is None
+        assert Which.cache_info().currsize == 0
+
+    def test_normal_maxsize(self, monkeypatch):
+        Which.clear_cache()
+        monkeypatch.setattr(Which, "cache_maxsize", 2)
+
+        for command in ["ls", "cat", "echo"]:
+            Which(command).abspath()
+        assert Which.cache_info().currsize == 2
+
+        monkeypatch.setattr(Which, "cache_maxsize", 0)
+        Which.clear_cache()
+        Which("ls").abspath()
+        assert Which.cache_info() == (0, 0, 0, 0)